@@ -3,10 +3,20 @@ import os
 from dotenv import load_dotenv
 import database  # Import database functions
 import discord
-from discord.ext import commands
 from discord import app_commands
 import datetime
 import casino_games
+import cluster
+import command_sync
+import game_rules
+import outbound
+import rr_lobby
+import rr_sessions
+import leaderboards
+import ledger
+import members
+import metrics
+import startup
 import asyncio
 
 
@@ -19,20 +29,56 @@ TOKEN: Final[str] = os.getenv('DISCORD_TOKEN')
 # Bot Setup with Intents
 intents = discord.Intents.default()
 intents.message_content = True
-intents.members = True  # Required for member lookups in slash commands
+intents.members = True  # Required for on_member_join and batched member lookups
+
+# An AutoShardedBot when sharded (BOT_SHARDED=1, or a cluster worker started by cluster.py).
+# Members are only cached per MEMBER_CACHE and guilds aren't chunked; names are resolved through members.resolver.
+bot = cluster.make_bot(
+    command_prefix=")",
+    intents=intents,
+    tree_cls=startup.GatedCommandTree,  # Times commands; answers "starting up" until the startup pipeline is done
+    member_cache_flags=members.cache_flags(),
+    chunk_guilds_at_startup=members.CHUNK_GUILDS,
+)
+
+# 🔹 Startup pipeline: each stage starts once what it needs is done, and runs once per process
+@startup.pipeline.stage("database", required=True)
+async def start_database():
+    await database.get_backend()  # Opens the pool and pings DB_POOL_MIN connections
+
+@startup.pipeline.stage("schema", needs=["database"], required=True)
+async def check_schema():
+    await database.init_db()  # Applies pending migrations and checks the hot-query indexes
+
+@startup.pipeline.stage("game sessions", needs=["schema"], required=True)
+async def recover_games():
+    await rr_sessions.sessions.recover()  # Refund Russian Roulette games left over from before a restart
+
+@startup.pipeline.stage("rank index", needs=["schema"])
+async def load_rankings():
+    await leaderboards.rankings.ensure_loaded()  # Every balance, for /rank and deeper leaderboard pages
+
+@startup.pipeline.stage("leaderboards", needs=["schema"])
+async def load_leaderboards():
+    await leaderboards.cache.get(leaderboards.GLOBAL, limit=LEADERBOARD_PAGE_SIZE)
+
+@startup.pipeline.stage("command sync")
+async def sync_commands():
+    if cluster.CLUSTER_ID != 0:  # One worker syncs for the whole cluster
+        return
+    # Only when the command tree changed since the last sync
+    result = await command_sync.syncer.sync(bot.tree)
+    if result["synced"]:
+        print("✅ Slash commands synced successfully!\n" + command_sync.describe(result))
+
+async def setup_hook():
+    startup.pipeline.start()  # In the background, so the gateway connects meanwhile
 
-bot = commands.Bot(command_prefix=")", intents=intents)
+bot.setup_hook = setup_hook
 
-# 🔹 Sync Commands on Bot Startup
 @bot.event
 async def on_ready():
     print(f'{bot.user} is now running!')
-    await database.init_db()  # Initialize database on startup
-    try:
-        await bot.tree.sync()  # Sync slash commands with Discord
-        print("✅ Slash commands synced successfully!")
-    except Exception as e:
-        print(f"❌ Failed to sync commands: {e}")
 
 # 🔹 Add Users to Database When They Join the Server
 @bot.event
@@ -40,6 +86,7 @@ async def on_member_join(member):
     user_id = member.id
     username = member.name  # Get Discord username
     server_id = member.guild.id
+    members.resolver.remember(member)  # Members aren't cached (MEMBER_CACHE); keep the name for leaderboards
 
     # Add user to database
     await database.add_user(user_id, username, server_id)
@@ -51,36 +98,91 @@ async def on_member_join(member):
 
 @bot.event
 async def on_message(message: discord.Message):
-    if message.author == bot.user:
-        return  # Ignore bot messages
-
-    user_id = message.author.id
-    username = message.author.name  # Get username
-    server_id = message.guild.id
-
-    # Ensure user is in the database
-    await database.add_user(user_id, username, server_id)
+    if message.author.bot:
+        return  # Ignore bot messages (ours and everyone else's)
 
+    if message.guild is not None:  # DMs have no server to register against
+        # Ensure user is in the database (buffered, unchanged users are skipped)
+        database.queue_user(message.author.id, message.author.name, message.guild.id)
 
     await bot.process_commands(message)
 
 
-@bot.command(name="sync", description="Syncs slash commands to the current guild for instant updates")
-async def sync(ctx):
+@bot.command(name="sync", description="Syncs slash commands to the current guild for instant updates (`)sync global` for everywhere)")
+async def sync(ctx, scope: str = "guild"):
     if ctx.author.id not in ADMIN_USERS:
         await ctx.send("❌ You don't have permission to sync commands.")
         return
     
     await ctx.send("🔄 Syncing commands...")
     try:
-        # Sync to the current guild (instant)
-        bot.tree.copy_global_to(guild=ctx.guild)
-        synced = await bot.tree.sync(guild=ctx.guild)
-        await ctx.send(f"✅ Synced {len(synced)} commands to this guild!")
+        if scope == "global":
+            result = await command_sync.syncer.sync(bot.tree, force=True)
+            where = "globally (updates take ~1 hour)"
+        else:
+            # Sync to the current guild (instant)
+            bot.tree.copy_global_to(guild=ctx.guild)
+            result = await command_sync.syncer.sync(bot.tree, guild=ctx.guild, force=True)
+            where = "to this guild"
+        await ctx.send(f"✅ Synced commands {where}!\n" + command_sync.describe(result))
     except Exception as e:
         await ctx.send(f"❌ Failed to sync: {e}")
 
 
+@bot.command(name="refreshbalances", description="Drops cached balances after coins were edited outside the bot")
+async def refreshbalances(ctx, member: discord.Member = None):
+    if ctx.author.id not in ADMIN_USERS:
+        await ctx.send("❌ You don't have permission to use this command.")
+        return
+
+    database.invalidate_balance(member.id if member else None)
+    leaderboards.cache.invalidate(everything=True)
+    stats = database.balance_cache.stats()
+    target = member.display_name if member else "everyone"
+    await ctx.send(
+        f"✅ Cleared cached balance for {target} and all leaderboards. "
+        f"Cache: {stats['size']} entries, {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%})."
+    )
+
+
+@bot.command(name="dbstats", description="Shows database pool usage and per-function query timings")
+async def dbstats(ctx):
+    if ctx.author.id not in ADMIN_USERS:
+        await ctx.send("❌ You don't have permission to use this command.")
+        return
+
+    stats = database.pool_stats.snapshot()
+    lines = [
+        f"🗄️ Pool ({stats['backend']}): {stats['in_use']} in use / {stats['free']} free ({stats['pool_size']} open, {stats['pool_min']}-{stats['pool_max']} allowed)",
+        f"⏱️ Acquire wait: avg {stats['acquire_wait_avg'] * 1000:.1f} ms, max {stats['acquire_wait_max'] * 1000:.1f} ms over {stats['acquires']} acquires",
+        f"🩺 Health checks: {stats['health_checks']} ({stats['reconnects']} reconnects)",
+    ]
+    names = members.resolver.stats()
+    lines.append(f"👥 Member names: {names['size']}/{names['maxsize']} cached, {names['hits']} hits, {names['misses']} misses")
+    slowest = sorted(stats["queries"].items(), key=lambda item: item[1]["avg"], reverse=True)[:10]
+    for name, query in slowest:
+        lines.append(f"`{name}`: {query['calls']} calls, avg {query['avg'] * 1000:.1f} ms, max {query['max'] * 1000:.1f} ms")
+    await ctx.send("\n".join(lines))
+
+
+@bot.command(name="shards", description="Shows latency, event rate and guilds for every shard in the cluster")
+async def shards(ctx):
+    if ctx.author.id not in ADMIN_USERS:
+        await ctx.send("❌ You don't have permission to use this command.")
+        return
+
+    now = datetime.datetime.now().timestamp()
+    lines = []
+    for worker, report in sorted(cluster.shard_reports(bot).items()):
+        stale = " ⚠️ stale" if now - report["at"] > 3 * cluster.REPORT_INTERVAL else ""
+        for row in report["shards"]:
+            latency = f"{row['latency_ms']:.0f} ms" if row["latency_ms"] is not None else "connecting"
+            lines.append(f"Shard {row['shard']} (worker {worker}): {latency}, {row['events_per_second']:.1f} events/s, {row['guilds']} guilds{stale}")
+    if len(lines) > 30:
+        lines = lines[:30] + [f"...and {len(lines) - 30} more"]
+    await ctx.send("📡 " + ("\n".join(lines) if lines else "No shard reports yet."))
+
+
 @bot.command(name="unsync", description="Clears guild-specific commands (removes duplicates)")
 async def unsync(ctx):
     if ctx.author.id not in ADMIN_USERS:
@@ -90,47 +192,77 @@ async def unsync(ctx):
     await ctx.send("🔄 Clearing guild commands...")
     try:
         bot.tree.clear_commands(guild=ctx.guild)
-        await bot.tree.sync(guild=ctx.guild)
-        await ctx.send("✅ Guild commands cleared! You are now using only global commands (updates take ~1 hour).")
+        result = await command_sync.syncer.sync(bot.tree, guild=ctx.guild, force=True)
+        await ctx.send("✅ Guild commands cleared! You are now using only global commands (updates take ~1 hour).\n" + command_sync.describe(result))
     except Exception as e:
         await ctx.send(f"❌ Failed to unsync: {e}")
 
 
 
 
+LEADERBOARD_PAGE_SIZE = 10
+
+
+async def get_leaderboard_page(server_id, page):
+    """Page 1 comes from the top-K cache; deeper pages from the rank index. Rows carry stored usernames."""
+    if page == 1:
+        rows = await leaderboards.cache.get(server_id, limit=LEADERBOARD_PAGE_SIZE)
+    else:
+        await leaderboards.rankings.ensure_loaded()
+        rows = leaderboards.rankings.page(page, LEADERBOARD_PAGE_SIZE, server_id)
+    return await leaderboards.usernames.fill(rows)
+
+
+async def leaderboard_names(entries, guild, everywhere=False):
+    """Stored usernames, plus one batched Discord lookup for users the database has no name for."""
+    names = {entry["user_id"]: entry["username"] for entry in entries if entry["username"]}
+    unnamed = [entry["user_id"] for entry in entries if entry["user_id"] not in names]
+    if unnamed:
+        resolved = await members.resolver.resolve(unnamed, guild=guild, bot=bot if everywhere else None)
+        for user_id, name in resolved.items():
+            leaderboards.usernames.put(user_id, name)
+        names.update(resolved)
+    return names
+
+
 @bot.tree.command(name="leaderboard_local", description="View the richest players in this server")
-async def leaderboard_local(interaction: discord.Interaction):
+@app_commands.describe(page="Page of the leaderboard to show (10 players per page)")
+async def leaderboard_local(interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
     server_id = interaction.guild.id
-    leaderboard_data = await database.get_local_leaderboard(server_id)
+    leaderboard_data = await get_leaderboard_page(server_id, page)
 
     if not leaderboard_data:
-        await interaction.response.send_message("❌ No data available yet!", ephemeral=True)
+        await interaction.response.send_message("❌ No data available yet!" if page == 1 else f"❌ There is no page {page}!", ephemeral=True)
         return
 
-    embed = discord.Embed(title=f"🏆 {interaction.guild.name} Leaderboard", color=discord.Color.gold())
-    
-    for i, entry in enumerate(leaderboard_data, start=1):
-        user = interaction.guild.get_member(entry["user_id"]) or f"<@{entry['user_id']}>"
+    title = f"🏆 {interaction.guild.name} Leaderboard" + (f" (Page {page})" if page > 1 else "")
+    embed = discord.Embed(title=title, color=discord.Color.gold())
+
+    names = await leaderboard_names(leaderboard_data, interaction.guild)
+    for i, entry in enumerate(leaderboard_data, start=(page - 1) * LEADERBOARD_PAGE_SIZE + 1):
+        user = members.name_or_mention(names, entry["user_id"])
         embed.add_field(name=f"#{i} {user}", value=f"💰 {entry['balance']} coins", inline=False)
 
     await interaction.response.send_message(embed=embed)
 
 
 @bot.tree.command(name="leaderboard_global", description="View the richest players across all servers")
-async def leaderboard_global(interaction: discord.Interaction):
-    leaderboard_data = await database.get_global_leaderboard()
+@app_commands.describe(page="Page of the leaderboard to show (10 players per page)")
+async def leaderboard_global(interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
+    leaderboard_data = await get_leaderboard_page(leaderboards.GLOBAL, page)
 
     if not leaderboard_data:
-        await interaction.response.send_message("❌ No data available yet!", ephemeral=True)
+        await interaction.response.send_message("❌ No data available yet!" if page == 1 else f"❌ There is no page {page}!", ephemeral=True)
         return
 
-    embed = discord.Embed(title="🌍 Global Leaderboard", color=discord.Color.blue())
+    title = "🌍 Global Leaderboard" + (f" (Page {page})" if page > 1 else "")
+    embed = discord.Embed(title=title, color=discord.Color.blue())
 
     trophy_emojis = ["🥇", "🥈", "🥉"]  # Gold, Silver, Bronze for top 3
 
-    for i, entry in enumerate(leaderboard_data, start=1):
-        user = bot.get_user(entry["user_id"])  # Fetch user from bot's cache
-        username = user.display_name if user else f"<@{entry['user_id']}>"  # Fallback if user not cached
+    names = await leaderboard_names(leaderboard_data, interaction.guild, everywhere=True)
+    for i, entry in enumerate(leaderboard_data, start=(page - 1) * LEADERBOARD_PAGE_SIZE + 1):
+        username = members.name_or_mention(names, entry["user_id"])
 
         # Assign trophies for top 3, default to 🏆 for others
         rank_emoji = trophy_emojis[i - 1] if i <= 3 else "🏆"
@@ -140,6 +272,33 @@ async def leaderboard_global(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 
+@bot.tree.command(name="rank", description="See where you (or another user) place on the leaderboards")
+@app_commands.describe(member="Select a user (optional)")
+async def rank(interaction: discord.Interaction, member: discord.Member = None):
+    if member is None:
+        member = interaction.user
+
+    await leaderboards.rankings.ensure_loaded()
+    rankings = leaderboards.rankings
+    if member.id not in rankings.global_index:
+        # Not indexed yet (no balance change since startup), so pull them in once
+        balance = await database.find_balance(member.id)
+        if balance is None:  # Never played; don't put a 0 on the leaderboards for them
+            await interaction.response.send_message(f"❌ {member.display_name} has no balance yet.", ephemeral=True)
+            return
+        rankings.set(member.id, balance, server_id=interaction.guild.id)
+
+    local = rankings.rank(member.id, interaction.guild.id)
+    global_rank = rankings.rank(member.id)
+    balance = rankings.global_index.balance(member.id)
+
+    lines = [f"💰 **{member.display_name}** has {balance} coins."]
+    if local:
+        lines.append(f"🏆 #{local[0]} of {local[1]} in {interaction.guild.name}")
+    lines.append(f"🌍 #{global_rank[0]} of {global_rank[1]} globally")
+    await interaction.response.send_message("\n".join(lines))
+
+
 
 
 
@@ -175,17 +334,17 @@ async def send_money(interaction: discord.Interaction, member: discord.Member, a
         await interaction.response.send_message("❌ You cannot send coins to yourself!", ephemeral=True)
         return
 
-    # Get sender's balance
-    sender_balance = await database.get_balance(sender_user_id)
+    if amount <= 0:
+        await interaction.response.send_message("❌ Amount must be greater than 0!", ephemeral=True)
+        return
 
-    # Check if the amount is valid
-    if amount <= 0 or amount > sender_balance:
+    # Perform transaction (both sides in one DB transaction, only if the sender can cover it)
+    ok, sender_balance = await database.transfer(sender_user_id, receiver_user_id, amount)
+    if not ok:
         await interaction.response.send_message(f"❌ You don't have enough coins! Your balance is {sender_balance}.", ephemeral=True)
         return
-
-    # Perform transaction
-    await database.update_balance(sender_user_id, -amount)
-    await database.update_balance(receiver_user_id, amount)
+    ledger.record(sender_user_id, -amount, ledger.TRANSFER, ref_id=interaction.id)
+    ledger.record(receiver_user_id, amount, ledger.TRANSFER, ref_id=interaction.id)
 
     await interaction.response.send_message(f"🎉 **{interaction.user.mention} sent {amount} coins to {member.mention}!**", ephemeral=False)
 
@@ -203,7 +362,8 @@ async def addcoins(interaction: discord.Interaction, member: discord.Member, amo
     user_id = member.id  # Get Discord ID
 
     # Add coins
-    await database.update_balance(user_id, amount)
+    if await database.update_balance(user_id, amount) is not None:
+        ledger.record(user_id, amount, ledger.ADMIN, ref_id=interaction.id)
 
     await interaction.response.send_message(f"✅ {member.display_name} has received {amount} coins!")
 
@@ -215,24 +375,22 @@ async def daily(interaction: discord.Interaction):
     user_id = interaction.user.id
     username = interaction.user.display_name
 
-    # Get last claim date from database
-    last_claim_date = await database.get_last_claim(user_id)
-
     # Get today's date in EST
     now = datetime.datetime.now(datetime.timezone.utc).astimezone(datetime.timezone(datetime.timedelta(hours=-5)))  # Convert to EST
     today = now.date()  # Get YYYY-MM-DD
 
-    # Check if user already claimed today
-    if last_claim_date == today:
+    # Check the last claim, credit the reward (with any streak bonus) and save today's date in one write
+    claim = await database.claim_daily(user_id, game_rules.DAILY_REWARD, today, game_rules.DAILY_STREAK_BONUS, game_rules.DAILY_STREAK_CAP)
+    if claim is None:
         await interaction.response.send_message("⏳ You have already claimed your daily reward today! Try again tomorrow.")
         return
 
-    # Give user coins and update last claim date
-    reward_amount = 100
-    await database.update_balance(user_id, reward_amount)
-    await database.update_last_claim(user_id)  # Save today's date
-
-    await interaction.response.send_message(f"✅ {username}, you have claimed your daily reward of {reward_amount} coins!")
+    reward_amount, streak = claim
+    ledger.record(user_id, reward_amount, ledger.DAILY, ref_id=interaction.id)
+    message = f"✅ {username}, you have claimed your daily reward of {reward_amount} coins!"
+    if streak > 1:
+        message += f" 🔥 {streak}-day streak!"
+    await interaction.response.send_message(message)
 
 
 
@@ -268,71 +426,75 @@ async def russianroulette_solo(interaction: discord.Interaction, amount: int, ch
 async def russianroulette_multi(interaction: discord.Interaction, amount: int):
     await interaction.response.defer()
 
-    user_id = interaction.user.id
-    server_id = interaction.guild.id
-    user_ids = [user_id]  # The host is automatically included
-
-    # **Save the game session as OPEN JOIN in SQL**
-    game_id = await database.create_invitation(user_id, server_id, user_ids)
+    # **Open an in-memory lobby; the host is automatically included**
+    lobby = rr_lobby.Lobby(interaction.user.id, interaction.guild.id, amount)
 
     # **Send the join prompt**
     class AcceptDeclineView(discord.ui.View):
-        def __init__(self, game_id):
+        def __init__(self, lobby):
             super().__init__(timeout=30)
-            self.game_id = game_id
+            self.lobby = lobby
 
         @discord.ui.button(label="Join ✅", style=discord.ButtonStyle.success, custom_id="join_button")
         async def accept(self, interaction: discord.Interaction, button: discord.ui.Button):
-
-            user_id = interaction.user.id
-            if await database.is_already_in_game(self.game_id, user_id):
+            result = self.lobby.join(interaction.user.id)  # No database work until the lobby closes
+            if result == rr_lobby.ALREADY_JOINED:
                 await interaction.response.send_message("❌ You already joined!", ephemeral=True)
-                return
-            await database.add_player_to_game(self.game_id, user_id)
-            await interaction.response.send_message(f"✅ {interaction.user.display_name} joined the game!", ephemeral=False)
+            elif result == rr_lobby.IN_GAME:
+                await interaction.response.send_message("❌ You're already in a Russian Roulette game!", ephemeral=True)
+            elif result in (rr_lobby.FULL, rr_lobby.CLOSED):
+                await interaction.response.send_message("❌ This game has already started!", ephemeral=True)
+            elif self.lobby.full:
+                await interaction.response.send_message(f"✅ {interaction.user.display_name} joined the game! The lobby is full, starting now.", ephemeral=False)
+            else:
+                await interaction.response.send_message(f"✅ {interaction.user.display_name} joined the game!", ephemeral=False)
 
-    view = AcceptDeclineView(game_id)
+    view = AcceptDeclineView(lobby)
 
     await interaction.followup.send(
         "🔫 **Russian Roulette Open Game Started!**\n"
         "Anyone in the server can join by clicking **Join ✅**.\n"
-        "Game will start in 10 seconds.",
+        f"Game will start in {rr_lobby.LOBBY_SECONDS:g} seconds, or as soon as {lobby.max_players} players have joined.",
         view=view,
         ephemeral=False
     )
 
-    await asyncio.sleep(10)  # Wait for players to join
-
-    # **Retrieve final players from SQL**
-    final_players: list = await database.get_accepted_players(game_id)
-
-    if len(final_players) < 2:
-        await interaction.followup.send("❌ Not enough players joined. Game canceled.", ephemeral=False)
-        await database.delete_invitation(game_id)  # Clean up
-        return
+    joined = await lobby.wait()  # Until the timeout, or earlier if the lobby fills up
 
-    # **Start the game with joined players**
-    # 🔹 Disable the join button to prevent spam after the game starts
+    # 🔹 Disable the join button now that the lobby is closed
     for child in view.children:
         if isinstance(child, discord.ui.Button) and child.custom_id == "join_button":
             child.disabled = True
 
-    await interaction.edit_original_response(view=view)  # ✅ Updates the message to disable the button
+    outbound.edit_original(interaction, view=view)  # ✅ Updates the message to disable the button
 
-    # 🔹 Start the game
-    await casino_games.russianroulette_multi(interaction, amount, 8, final_players)
+    # One pooled connection from the roster check to the wagers (followups are only queued here)
+    async with database.session():
+        # **One eligibility check for the whole roster**
+        final_players, dropped = await casino_games.eligible_players(joined, amount)
+        if dropped:
+            outbound.followup(
+                interaction,
+                f"⚠️ {', '.join(f'<@{uid}>' for uid in dropped)} can't play (not enough coins, or already in a game).",
+                ephemeral=False
+            )
 
+        if len(final_players) < 2:
+            outbound.followup(interaction, "❌ Not enough players joined. Game canceled.", ephemeral=False)
+            return
 
-    await interaction.followup.send(
+        # **Start the game with joined players**
+        await casino_games.russianroulette_multi(interaction, amount, 8, final_players)
+
+
+    outbound.followup(
+        interaction,
         f"🔫 **Multiplayer Russian Roulette Started!**\n"
         f"Players: {', '.join(f'<@{uid}>' for uid in final_players)}\n"
         f"First player: <@{final_players[0]}>",
         ephemeral=False
     )
 
-    # **Delete the invitation data from SQL**
-    await database.delete_invitation(game_id)
-
 
 
 @bot.tree.command(name="crash", description="Play the Crash game: withdraw before the multiplier crashes!")
@@ -350,8 +512,24 @@ async def roulette(interaction: discord.Interaction, amount: int, choice: str):
     await casino_games.roulette(interaction, amount, choice)
 
 # 🔹 Main Entry Point
+async def run_bot():
+    metrics_runner = await metrics.start_server()  # Prometheus scrape endpoint (METRICS_PORT=0 turns it off)
+    async with bot:
+        await cluster.start(bot)  # Shard reports; joins the cluster bus when started by cluster.py
+        try:
+            await bot.start(TOKEN)
+        finally:
+            await cluster.stop()
+            await rr_sessions.sessions.close()  # Checkpoint live Russian Roulette games
+            await ledger.writer.close()  # Write the last coin ledger entries
+            await database.close_pool()  # Flushes buffered user writes before exit
+            await metrics.stop_server(metrics_runner)
+
 def main():
-    bot.run(TOKEN)
+    try:
+        asyncio.run(run_bot())
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
     main()
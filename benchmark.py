@@ -0,0 +1,378 @@
+"""Headless load generator for the casino commands.
+
+Drives the real handlers in casino_games.py (and through them database.py)
+with fake interactions, so no Discord connection is needed, and reports
+throughput, latency percentiles and database calls per command.
+
+It writes to whatever storage the bot is configured for (STORAGE_BACKEND, and
+DB_* or SQLITE_PATH). Point it at a local, disposable database, or use
+STORAGE_BACKEND=memory to measure the bot without one: benchmark users are
+created with IDs from BENCH_USER_BASE upward (and removed again with --cleanup).
+
+    python benchmark.py --concurrency 50 --duration 30
+    python benchmark.py --mix coinflip=1 --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json   # exits 1 on regression
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import random
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import casino_games  # noqa: E402  (after load_dotenv, like the bot)
+import database  # noqa: E402
+import outbound  # noqa: E402
+import storage  # noqa: E402
+from rr_sessions import sessions as rr_sessions  # noqa: E402
+
+BENCH_USER_BASE = 900_000_000_000_000_000  # Well above real snowflakes for years to come
+BENCH_SERVER_ID = 1
+STARTING_BALANCE = 10_000_000
+DEFAULT_MIX = "coinflip=4,roulette=3,crash=1,rr_solo=1,rr_multi=1"
+
+_command = contextvars.ContextVar("benchmark_command", default=None)
+_ids = itertools.count(1)
+
+
+# --- Fake Discord objects: just enough surface for casino_games and outbound ---
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"bench{user_id - BENCH_USER_BASE}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+
+
+class FakeMessage:
+    def __init__(self, latency):
+        self.id = next(_ids)
+        self._latency = latency
+
+    async def edit(self, **kwargs):
+        await asyncio.sleep(self._latency)
+        return self
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self, kwargs):
+        if self._done:
+            raise RuntimeError("Interaction has already been responded to")
+        self._done = True
+        self._interaction.sent.append(kwargs)
+        await asyncio.sleep(self._interaction.latency)
+
+    async def send_message(self, content=None, **kwargs):
+        kwargs["content"] = content
+        await self._respond(kwargs)
+        view = kwargs.get("view")
+        if view is not None:
+            self._interaction.view = view
+
+    async def defer(self, **kwargs):
+        await self._respond(kwargs)
+
+    async def edit_message(self, **kwargs):
+        await self._respond(kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        kwargs["content"] = content
+        self._interaction.sent.append(kwargs)
+        view = kwargs.get("view")
+        if view is not None:
+            self._interaction.view = view
+        await asyncio.sleep(self._interaction.latency)
+        return FakeMessage(self._interaction.latency)
+
+
+class FakeInteraction:
+    def __init__(self, user_id, channel_id, latency):
+        self.id = next(_ids)
+        self.user = FakeUser(user_id)
+        self.channel_id = channel_id
+        self.guild_id = BENCH_SERVER_ID
+        self.latency = latency  # Simulated Discord round trip for every send
+        self.sent: list = []
+        self.view = None  # Last view attached to a message, for pressing its buttons
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.extras: dict = {}
+        self.command_failed = False
+
+    async def original_response(self):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self.latency)
+
+    async def edit_original_response(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self.latency)
+
+
+# --- Measurement ---
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list] = {}
+        self.db_calls: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+
+    async def timed(self, name, coro):
+        token = _command.set(name)
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            print(f"{name} failed: {e!r}", file=sys.stderr)
+        finally:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+            _command.reset(token)
+
+    def count_db_call(self):
+        name = _command.get()
+        if name is not None:
+            self.db_calls[name] = self.db_calls.get(name, 0) + 1
+
+    def report(self, elapsed):
+        rows = {}
+        for name, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            rows[name] = {
+                "count": len(samples),
+                "per_second": len(samples) / elapsed,
+                "p50_ms": _percentile(samples, 50) * 1000,
+                "p95_ms": _percentile(samples, 95) * 1000,
+                "p99_ms": _percentile(samples, 99) * 1000,
+                "max_ms": samples[-1] * 1000,
+                "db_calls": self.db_calls.get(name, 0) / len(samples),
+                "errors": self.errors.get(name, 0),
+            }
+        return rows
+
+
+def _percentile(samples, percent):
+    """Nearest-rank percentile of sorted samples."""
+    index = max(0, min(len(samples) - 1, round(percent / 100 * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+def _instrument_db(recorder):
+    # Every database function reports through pool_stats.record_query; attribute each call to the running command
+    record_query = database.pool_stats.record_query
+
+    def counting(name, seconds):
+        recorder.count_db_call()
+        record_query(name, seconds)
+
+    database.pool_stats.record_query = counting
+
+
+# --- Workloads: one complete game per call, timing every handler invocation separately ---
+
+class Workload:
+    def __init__(self, recorder, args):
+        self.recorder = recorder
+        self.args = args
+
+    def interaction(self, user_id):
+        channel_id = random.randrange(self.args.channels)
+        return FakeInteraction(user_id, channel_id, self.args.discord_latency)
+
+    async def coinflip(self, users):
+        interaction = self.interaction(users[0])
+        await self.recorder.timed("coinflip", casino_games.coinflip(interaction, self.args.bet, random.choice(["heads", "tails"])))
+
+    async def roulette(self, users):
+        choice = random.choice(["red", "black", "green", str(random.randint(0, 36))])
+        interaction = self.interaction(users[0])
+        await self.recorder.timed("roulette", casino_games.roulette(interaction, self.args.bet, choice))
+
+    async def crash(self, users):
+        interaction = self.interaction(users[0])
+        await self.recorder.timed("crash", casino_games.crash(interaction, self.args.bet))
+        view = interaction.view
+        if view is None:
+            return
+        # Cash out at a random target; if the game crashes first the scheduler ends it
+        await asyncio.sleep(random.uniform(0.5, self.args.crash_hold))
+        if not view.cashed_out and view in casino_games.crash_scheduler.active:
+            click = self.interaction(users[0])
+            await self.recorder.timed("crash_withdraw", view.withdraw.callback(click))
+
+    async def rr_solo(self, users):
+        user_id = users[0]
+        interaction = self.interaction(user_id)
+        await self.recorder.timed("rr_solo", casino_games.russianroulette_solo(interaction, self.args.bet, 6, user_id))
+        for _ in range(random.randint(1, 3)):
+            if rr_sessions.get(user_id) is None:
+                return
+            await self.recorder.timed("rr_shoot", casino_games.shoot_solo(self.interaction(user_id)))
+        if rr_sessions.get(user_id) is not None:
+            await self.recorder.timed("rr_cashout", casino_games.cashout(self.interaction(user_id)))
+
+    async def rr_multi(self, users):
+        players = list(users[:3])
+        interaction = self.interaction(players[0])
+        await interaction.response.defer()  # The bot's command defers before starting the game
+        await self.recorder.timed("rr_multi", casino_games.russianroulette_multi(interaction, self.args.bet, 6, players))
+        while True:
+            game = next(filter(None, map(rr_sessions.get, players)), None)
+            if game is None:
+                return
+            shooter = game["players"][game["current_turn"]]
+            await self.recorder.timed("rr_multi_shoot", casino_games.shoot_multi(self.interaction(shooter)))
+
+
+async def _seed_users(count):
+    for i in range(count):
+        user_id = BENCH_USER_BASE + i
+        database.queue_user(user_id, f"bench{i}", BENCH_SERVER_ID)
+    await database.flush_users()
+    for i in range(count):
+        user_id = BENCH_USER_BASE + i
+        balance = await database.get_balance(user_id)
+        if balance != STARTING_BALANCE:
+            await database.update_balance(user_id, STARTING_BALANCE - balance)
+
+
+async def _cleanup_users(count):
+    await database.delete_users(range(BENCH_USER_BASE, BENCH_USER_BASE + count))
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("coinflip", "roulette", "crash", "rr_solo", "rr_multi"):
+            raise argparse.ArgumentTypeError(f"Unknown workload {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run(args):
+    recorder = Recorder()
+    _instrument_db(recorder)
+    users_per_worker = 3  # Enough for a multiplayer game; workers never share users, so games can't collide
+    user_count = args.concurrency * users_per_worker
+
+    await database.init_db()
+    await _seed_users(user_count)
+
+    workload = Workload(recorder, args)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(index):
+        users = [BENCH_USER_BASE + index * users_per_worker + i for i in range(users_per_worker)]
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            await getattr(workload, name)(users)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    # Let crash results and queued follow-ups drain before shutting down
+    while casino_games.crash_scheduler.active or outbound.queue.depth():
+        await asyncio.sleep(0.1)
+    await rr_sessions.close()
+    if args.cleanup:
+        await _cleanup_users(user_count)
+    await database.close_pool()
+    return recorder.report(elapsed), elapsed
+
+
+def _print_report(rows, elapsed, args):
+    print(f"\n{args.concurrency} workers for {elapsed:.1f}s on {storage.STORAGE_BACKEND} storage, simulated Discord latency {args.discord_latency * 1000:.0f} ms")
+    print(f"{'command':<16}{'count':>8}{'per s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'db/cmd':>8}{'errors':>8}")
+    for name, row in rows.items():
+        print(f"{name:<16}{row['count']:>8}{row['per_second']:>9.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}{row['db_calls']:>8.2f}{row['errors']:>8}")
+    stats = database.pool_stats.snapshot()
+    print(f"pool: {stats['acquires']} acquires, avg wait {stats['acquire_wait_avg'] * 1000:.2f} ms, max wait {stats['acquire_wait_max'] * 1000:.2f} ms")
+
+
+def _compare(rows, baseline, tolerance):
+    """Returns a line per command whose p99 grew or throughput fell by more than tolerance."""
+    regressions = []
+    for name, expected in baseline.get("commands", {}).items():
+        row = rows.get(name)
+        if row is None:
+            continue
+        if row["p99_ms"] > expected["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {row['p99_ms']:.1f} ms vs baseline {expected['p99_ms']:.1f} ms")
+        if row["per_second"] < expected["per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {row['per_second']:.1f}/s vs baseline {expected['per_second']:.1f}/s")
+        if row["db_calls"] > expected["db_calls"] + 0.01:
+            regressions.append(f"{name}: {row['db_calls']:.2f} db calls vs baseline {expected['db_calls']:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the casino commands against a local database.")
+    parser.add_argument("--concurrency", type=int, default=20, help="simulated players running games at once")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to generate load")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX), help=f"workload weights (default {DEFAULT_MIX})")
+    parser.add_argument("--bet", type=int, default=10)
+    parser.add_argument("--channels", type=int, default=50, help="channels the fake interactions are spread over")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="seconds each simulated Discord call takes")
+    parser.add_argument("--crash-hold", type=float, default=3.0, help="longest a player waits before withdrawing from Crash")
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable game outcomes")
+    parser.add_argument("--cleanup", action="store_true", help="delete the benchmark users afterwards")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as the new baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a baseline and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p99/throughput drift against the baseline")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    rows, elapsed = asyncio.run(run(args))
+    _print_report(rows, elapsed, args)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "mix": args.mix,
+                "discord_latency": args.discord_latency,
+                "commands": rows,
+            }, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline.get("concurrency"), baseline.get("mix")) != (args.concurrency, args.mix):
+            print("Warning: baseline was recorded with a different concurrency or mix", file=sys.stderr)
+        regressions = _compare(rows, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
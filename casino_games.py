@@ -1,8 +1,12 @@
 import random
 import database
+import game_rules
+import ledger
+import metrics
+import outbound
+from rr_sessions import sessions as rr_sessions, SOLO_IDLE_TIMEOUT, MULTI_IDLE_TIMEOUT
 import discord
 from discord import app_commands
-import json
 import asyncio
 import math
 import time
@@ -16,31 +20,42 @@ async def coinflip(interaction: discord.Interaction, amount: int, choice: str):
         return
 
 
-    # Get user's balance
-    balance = await database.get_balance(user_id)
-
-    if amount <= 0 or amount > balance:
-        await interaction.response.send_message(f"❌ You don't have enough coins! Your balance is {balance}.")
+    if amount <= 0:
+        await interaction.response.send_message("❌ Amount must be greater than 0!", ephemeral=True)
         return
 
     # Perform coin flip
     outcome = random.choice(["heads", "tails"])
     win = choice == outcome
 
+    # Take the bet and pay out (double the bet on a win) in one conditional update
+    payout = amount * game_rules.COINFLIP_PAYOUT if win else 0
+    ok, balance = await database.try_debit(user_id, amount, credit=payout)
+    if not ok:
+        await interaction.response.send_message(f"❌ You don't have enough coins! Your balance is {balance}.")
+        return
+
+    ledger.record(user_id, -amount, ledger.BET, "coinflip", interaction.id)
+    ledger.record(user_id, payout, ledger.PAYOUT, "coinflip", interaction.id)
+    metrics.record_game("coinflip", "win" if win else "loss", amount, payout)
     if win:
-        await database.update_balance(user_id, amount)  # Double the bet
         await interaction.response.send_message(f"🎉 The coin landed on **{outcome}**! You won {amount} coins!", ephemeral=False)
     else:
-        await database.update_balance(user_id, -amount)  # Deduct the bet
         await interaction.response.send_message(f"💀 The coin landed on **{outcome}**. You lost {amount} coins!", ephemeral=False)
 
 
 
 
 class RussianRouletteSoloView(discord.ui.View):
-    def __init__(self, user_id):
-        super().__init__(timeout=60)
+    def __init__(self, user_id, game_data):
+        super().__init__(timeout=SOLO_IDLE_TIMEOUT)
         self.user_id = user_id
+        self.game_data = game_data
+
+    async def on_timeout(self):
+        # Earlier views of the same game time out too; only act once the game itself has gone idle
+        if rr_sessions.is_idle(self.game_data):
+            await rr_sessions.expire(self.game_data)
 
     @discord.ui.button(label="Shoot 🔫", style=discord.ButtonStyle.danger)
     async def shoot_button(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -59,9 +74,13 @@ class RussianRouletteSoloView(discord.ui.View):
 
 class RussianRouletteMultiView(discord.ui.View):
     def __init__(self, game_data):
-        super().__init__(timeout=300)  # Extend timeout to avoid buttons disappearing
+        super().__init__(timeout=MULTI_IDLE_TIMEOUT)  # Extend timeout to avoid buttons disappearing
         self.game_data = game_data
 
+    async def on_timeout(self):
+        if rr_sessions.is_idle(self.game_data):
+            await rr_sessions.expire(self.game_data)
+
     @discord.ui.button(label="Shoot 🔫", style=discord.ButtonStyle.danger)
     async def shoot_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Handles shooting logic, ensuring the correct player takes the turn."""
@@ -86,43 +105,57 @@ class RussianRouletteMultiView(discord.ui.View):
 
 
 async def russianroulette_solo(interaction: discord.Interaction, amount: int, chambers: int, user_id: int):
-    balance = await database.get_balance(user_id)
-    if amount <= 0 or amount > balance:
-        await interaction.response.send_message(f"❌ You don't have enough coins! Your balance is {balance}.", ephemeral=True)
+    if amount <= 0:
+        await interaction.response.send_message("❌ Amount must be greater than 0!", ephemeral=True)
         return
 
-    await database.update_balance(user_id, -amount)  # Deduct wager
+    async with database.session():  # The busy check (and any expiry refund) and the wager share one connection
+        busy = await rr_sessions.busy_players([user_id])
+        if not busy:
+            ok, balance = await database.try_debit(user_id, amount)  # Deduct wager
+    if busy:
+        await interaction.response.send_message("❌ You're already in a Russian Roulette game!", ephemeral=True)
+        return
+    if not ok:
+        await interaction.response.send_message(f"❌ You don't have enough coins! Your balance is {balance}.", ephemeral=True)
+        return
 
     gun = [0] * chambers
     bullet_index = random.randint(0, chambers - 1)
     gun[bullet_index] = 1
 
-    await database.save_game_state([user_id], chambers, amount, amount, 0, gun, 0)
+    ledger.record(user_id, -amount, ledger.BET, "russianroulette_solo", interaction.id)
+    game_data = rr_sessions.create([user_id], chambers, amount, amount, gun, server_id=interaction.guild_id, ref_id=interaction.id)
 
-    view = RussianRouletteSoloView(user_id)
+    view = RussianRouletteSoloView(user_id, game_data)
     await interaction.response.send_message(
         f"🔫 **Solo Russian Roulette Started!**\nYou chose {chambers} chambers.\nClick **Shoot 🔫** or **Cash Out 💰**.",
         view=view
     )
 
-async def russianroulette_multi(interaction: discord.Interaction, amount: int, chambers: int, user_ids: list):
-    # ✅ First, check if all players have enough balance and ensure atomicity
-    # Note: iterating through async generator or list comprehension with async functions inside 'any' is tricky.
-    # 'any' does not support async. We must loop explicitly or use gather.
-    
+async def eligible_players(user_ids: list, amount: int):
+    """Splits a closed lobby's roster into players who can start (not in a live game, balance covers amount) and the rest."""
+    balances = await database.get_balances(user_ids)  # One query for the whole roster
+    busy = await rr_sessions.busy_players(user_ids)  # Includes games on other cluster workers
+    eligible, dropped = [], []
     for user_id in user_ids:
-        bal = await database.get_balance(user_id)
-        if bal < amount:
-            await interaction.followup.send("❌ One or more players do not have enough coins!", ephemeral=True)
-            return
+        if user_id not in busy and balances[user_id] >= amount:
+            eligible.append(user_id)
+        else:
+            dropped.append(user_id)
+    return eligible, dropped
 
-    # ✅ Deduct the wager **only if all players have enough balance**
-    for user_id in user_ids:
-        await database.update_balance(user_id, -amount)
+
+async def russianroulette_multi(interaction: discord.Interaction, amount: int, chambers: int, user_ids: list):
+    # ✅ Deduct the wager from every player at once, so if anyone can't cover it nobody is charged
+    ok, _ = await database.apply_deltas({user_id: -amount for user_id in user_ids})
+    if not ok:
+        outbound.followup(interaction, "❌ One or more players do not have enough coins!", ephemeral=True, urgent=True)
+        return
+    ledger.record_many({user_id: -amount for user_id in user_ids}, ledger.BET, "russianroulette_multi", interaction.id)
 
     # ✅ Randomize turn order and initialize game state
     random.shuffle(user_ids)
-    current_turn = 0
 
     # ✅ Set up the gun
     gun = [0] * chambers
@@ -131,23 +164,15 @@ async def russianroulette_multi(interaction: discord.Interaction, amount: int, c
 
     winnings = amount * len(user_ids)  # Total pot value
 
-    # ✅ Save game state in the database
-    await database.save_game_state(user_ids, chambers, winnings, amount, 0, gun, current_turn)
-
-    # ✅ Pass complete game state to `RussianRouletteMultiView`
-    game_data = {
-        "players": user_ids,
-        "chambers": chambers,
-        "winnings": winnings,
-        "original_wager": amount,
-        "shots_survived": 0,
-        "gun": gun,
-        "current_turn": current_turn
-    }
-    view = RussianRouletteMultiView(game_data)  # Ensure game state is passed to View
+    # ✅ Register the live game (checkpointed to the database in the background)
+    game_data = rr_sessions.create(user_ids, chambers, winnings, amount, gun, server_id=interaction.guild_id, ref_id=interaction.id)
+
+    # ✅ Pass the live game state to `RussianRouletteMultiView` so turn checks always see the latest turn
+    view = RussianRouletteMultiView(game_data)
 
     # ✅ Start the game and announce turn order
-    await interaction.followup.send(
+    outbound.followup(
+        interaction,
         f"🔫 **Multiplayer Russian Roulette Started!**\n"
         f"Players: {', '.join(f'<@{uid}>' for uid in user_ids)}\n"
         f"Chambers: {chambers}\n"
@@ -160,7 +185,7 @@ async def russianroulette_multi(interaction: discord.Interaction, amount: int, c
 
 async def shoot_solo(interaction: discord.Interaction):
     user_id = interaction.user.id
-    game_data = await database.get_game_state(user_id)
+    game_data = rr_sessions.get(user_id)
 
     if not game_data:
         await interaction.response.send_message("❌ You're not playing Russian Roulette!", ephemeral=True)
@@ -172,19 +197,19 @@ async def shoot_solo(interaction: discord.Interaction):
 
     if shot_result == 1:
         # Player lost, end the game
-        await database.delete_game_state(user_id)
+        rr_sessions.end(game_data)
+        metrics.record_game("russianroulette_solo", "loss", game_data["original_wager"], 0)
         await interaction.response.send_message(f"💀 **Bang!** {interaction.user.display_name} lost {game_data['original_wager']} coins!", ephemeral=False)
         return
 
     # Apply multiplier for winnings
-    multipliers = {2: 2.0, 3: 1.5, 4: 1.333, 5: 1.25, 6: 1.2, 7: 1.166, 8: 1.125}
-    game_data["winnings"] = round(game_data["winnings"] * multipliers[game_data["chambers"]])
+    game_data["winnings"] = round(game_data["winnings"] * game_rules.RR_CHAMBER_MULTIPLIERS[game_data["chambers"]])
     game_data["shots_survived"] += 1
 
     # Save progress
-    await database.save_game_state([user_id], game_data["chambers"], game_data["winnings"], game_data["original_wager"], game_data["shots_survived"], gun, 0)
+    rr_sessions.save(game_data)
 
-    view = RussianRouletteSoloView(user_id)
+    view = RussianRouletteSoloView(user_id, game_data)
     await interaction.response.send_message(
         f"✅ **Click!** You survived! **Potential winnings: {game_data['winnings']} coins.**\n"
         f"Click **Shoot 🔫** or **Cash Out 💰**!",
@@ -196,35 +221,35 @@ async def shoot_multi(interaction: discord.Interaction):
     await interaction.response.defer()  # Prevent timeout
 
     user_id = interaction.user.id
-    game_data = await database.get_game_state(user_id)
+    game_data = rr_sessions.get(user_id)
 
     if not game_data:
-        await interaction.followup.send("❌ You're not playing Russian Roulette!", ephemeral=True)
+        outbound.followup(interaction, "❌ You're not playing Russian Roulette!", ephemeral=True, urgent=True)
         return
 
     if user_id != game_data["players"][game_data["current_turn"]]:
-        await interaction.followup.send("❌ It's not your turn!", ephemeral=True)
+        outbound.followup(interaction, "❌ It's not your turn!", ephemeral=True, urgent=True)
         return
 
     gun = game_data["gun_state"]
     fired_index = random.randint(0, len(gun) - 1)
     shot_result = gun.pop(fired_index)
+    eliminated = shot_result == 1
 
-    if shot_result == 1:
-        game_data["players"].remove(user_id)
-
-        # 🔹 Ensure the user is removed from SQL as well where necessary
-        await database.update_game_players(user_id, game_data["players"])
-
-        await interaction.followup.send(f"💀 <@{user_id}> **was eliminated!**", ephemeral=False)
+    if eliminated:
+        rr_sessions.remove_player(game_data, user_id)
 
         if len(game_data["players"]) == 1:
-            # 🔹 Last player standing wins
+            # 🔹 Last player standing wins (end the game before awaiting so a second click can't pay twice)
             winner_id = game_data["players"][0]
-            await database.update_balance(winner_id, game_data["winnings"])
-            await database.delete_game_state(game_data["players"][0])  # Delete using the game creator's ID
-
-            await interaction.followup.send(
+            rr_sessions.end(game_data)
+            outbound.followup(interaction, f"💀 <@{user_id}> **was eliminated!**", ephemeral=False)
+            if await database.update_balance(winner_id, game_data["winnings"]) is not None:
+                ledger.record(winner_id, game_data["winnings"], ledger.PAYOUT, "russianroulette_multi", game_data.get("ref_id"))
+            metrics.record_game("russianroulette_multi", "win", game_data["winnings"], game_data["winnings"])
+
+            outbound.followup(
+                interaction,
                 f"🎉 <@{winner_id}> is the last player standing and won {game_data['winnings']} coins!",
                 ephemeral=False
             )
@@ -239,26 +264,24 @@ async def shoot_multi(interaction: discord.Interaction):
     else:
         # 🔹 Player survived, so increment shots survived
         game_data["shots_survived"] += 1
-        await interaction.followup.send("✅ **Click! No Bullet.** ")
 
     # 🔹 **Ensure turn moves to the next valid player**
     game_data["current_turn"] = (game_data["current_turn"] + 1) % len(game_data["players"])
 
-    # 🔹 **Force the update into SQL**
-    await database.save_game_state(
-        game_data["players"], game_data["chambers"], game_data["winnings"],
-        game_data["original_wager"], game_data["shots_survived"], game_data["gun_state"], game_data["current_turn"]
-    )
+    # 🔹 Live state is authoritative; eliminations are checkpointed right away, plain shots on the interval
+    rr_sessions.save(game_data, transition=eliminated)
 
-    await asyncio.sleep(0.2)
-    # 🔹 **Retrieve updated game state to ensure sync**
-    updated_game_data = await database.get_game_state(game_data["players"][0])
+    if eliminated:
+        outbound.followup(interaction, f"💀 <@{user_id}> **was eliminated!**", ephemeral=False)
+    else:
+        outbound.followup(interaction, "✅ **Click! No Bullet.** ")
 
-    view = RussianRouletteMultiView(updated_game_data)  # ✅ Pass latest game state
+    view = RussianRouletteMultiView(game_data)  # ✅ Pass live game state
 
     # ✅ **Notify the next player even if someone was eliminated**
-    next_player = updated_game_data["players"][updated_game_data["current_turn"]]
-    await interaction.followup.send(
+    next_player = game_data["players"][game_data["current_turn"]]
+    outbound.followup(
+        interaction,
         f"🔫 **Next player:** <@{next_player}>, it's your turn!",
         view=view,
         ephemeral=False
@@ -273,43 +296,45 @@ async def shoot_multi(interaction: discord.Interaction):
 
 async def cashout(interaction: discord.Interaction):
     user_id = interaction.user.id
-    game_data = await database.get_game_state(user_id)
+    game_data = rr_sessions.get(user_id)
     
     if not game_data:
         await interaction.response.send_message("❌ You're not playing Russian Roulette!", ephemeral=True)
         return
 
-    await database.update_balance(user_id, game_data["winnings"])
-    await database.delete_game_state(user_id)
+    rr_sessions.end(game_data)  # End first so a double click can't cash out twice
+    if await database.update_balance(user_id, game_data["winnings"]) is not None:
+        ledger.record(user_id, game_data["winnings"], ledger.PAYOUT, "russianroulette_solo", game_data.get("ref_id"))
+    metrics.record_game("russianroulette_solo", "win", game_data["original_wager"], game_data["winnings"])
 
     await interaction.response.send_message(f"💰 **{interaction.user.display_name} cashed out early and won {game_data['winnings']} coins!**", ephemeral=False)
 
 
 async def vote_split(interaction: discord.Interaction):
     user_id = interaction.user.id
-    game_data = await database.get_game_state(user_id)
+    game_data = rr_sessions.get(user_id)
 
-    if not game_data or "players" not in game_data:
+    if not game_data:
         await interaction.response.send_message("❌ Game data not found. Try again later!", ephemeral=True)
         return
 
-    players_list = json.loads(game_data["players"]) if isinstance(game_data["players"], str) else game_data["players"]
-    if user_id not in players_list:
+    if user_id not in game_data["players"]:
         await interaction.response.send_message("❌ You're not in this game!", ephemeral=True)
         return
 
-    votes = await database.get_votes(game_data["players"][0]) or []
-
+    votes = game_data["votes"]
     if user_id not in votes:
-        await database.add_vote(game_data["players"][0], user_id)
-
-    votes = await database.get_votes(game_data["players"][0])
+        votes.append(user_id)
+        rr_sessions.save(game_data)
 
     if len(votes) > len(game_data["players"]) // 2:
         split_amount = game_data["winnings"] // len(game_data["players"])
-        for player in game_data["players"]:
-            await database.update_balance(player, split_amount)
-        await database.delete_game_state(game_data["players"][0])
+        rr_sessions.end(game_data)  # End first so late votes can't trigger a second payout
+        # Everyone is paid in one transaction, or nobody is
+        ok, _ = await database.apply_deltas({player: split_amount for player in game_data["players"]})
+        if ok:
+            ledger.record_many({player: split_amount for player in game_data["players"]}, ledger.PAYOUT, "russianroulette_multi", game_data.get("ref_id"))
+        metrics.record_game("russianroulette_multi", "split", game_data["winnings"], split_amount * len(game_data["players"]))
 
         await interaction.response.send_message(
             f"✅ **Majority voted to split the pot!** Each player receives {split_amount} coins.", ephemeral=False
@@ -322,18 +347,23 @@ async def vote_split(interaction: discord.Interaction):
         ephemeral=True
     )
 
+async def refund_abandoned(game_data):
+    """Ends a game nobody can finish any more (its buttons timed out, or it predates a restart) and gives the players still in it their wager back."""
+    rr_sessions.end(game_data)  # End first so a late click can't also pay out
+    game = "russianroulette_solo" if len(game_data["players"]) == 1 else "russianroulette_multi"
+    refunds = {player: game_data["original_wager"] for player in game_data["players"]}
+    ok, _ = await database.apply_deltas(refunds, require_non_negative=False)
+    if ok:
+        ledger.record_many(refunds, ledger.REFUND, game, game_data.get("ref_id"))
+    metrics.record_game(game, "expired", sum(refunds.values()), sum(refunds.values()) if ok else 0)
+
+
+rr_sessions.on_expire(refund_abandoned)
+
+
 def get_crash_multiplier() -> float:
-    # 5% chance for instant crash (multiplier exactly 1.0)
-    if random.random() < 0.05:
-        return 1.0
-    # Otherwise, sample from a Gamma distribution
-    # Gamma(2.5, 1) has a mode near 1.5 and mean = 2.5.
-    multiplier = random.gammavariate(2.5, 1)
-    # Ensure the multiplier is at least 1.1 (to avoid overlap with the instant crash case)
-    multiplier = max(1.1, multiplier)
-    # Clamp the multiplier to a maximum of 25
-    multiplier = min(25.0, multiplier)
-    return multiplier
+    # 5% instant crashes, otherwise a clamped Gamma draw (see game_rules for the parameters)
+    return game_rules.crash_point()
 
 class CrashGameView(discord.ui.View):
     def __init__(self, bet: int, rate: float, crash_multiplier: float, start_time: float, interaction: discord.Interaction):
@@ -345,6 +375,28 @@ class CrashGameView(discord.ui.View):
         self.start_time = start_time
         self.cashed_out = False
         self.interaction = interaction
+        self.message = None  # InteractionMessage, fetched once so ticks don't re-request it
+        self.last_shown = "1.00"  # Multiplier currently on screen
+        self.next_edit_at = 0.0
+        self.edit_task = None
+
+    def current_multiplier(self, now=None):
+        elapsed = (now if now is not None else time.time()) - self.start_time
+        return math.exp(self.rate * elapsed)
+
+    def progress_embed(self, shown: str):
+        return discord.Embed(
+            title="Crash Game In Progress",
+            description=f"Bet: {self.bet} coins\nCurrent Multiplier: {shown}×\nWithdraw before it crashes!",
+            color=discord.Color.orange()
+        )
+
+    def crashed_embed(self):
+        return discord.Embed(
+            title="Crash!",
+            description=f"The multiplier reached **{self.crash_multiplier:.2f}×**. You lost your bet of {self.bet} coins.",
+            color=discord.Color.red()
+        )
 
     @discord.ui.button(label="Withdraw 💰", style=discord.ButtonStyle.success)
     async def withdraw(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -357,15 +409,16 @@ class CrashGameView(discord.ui.View):
             await interaction.response.send_message("You have already cashed out!", ephemeral=True)
             return
 
-        elapsed = time.time() - self.start_time
-        current_multiplier = math.exp(self.rate * elapsed)
+        current_multiplier = self.current_multiplier()
         if current_multiplier >= self.crash_multiplier:
             await interaction.response.send_message("Too late! The game has crashed.", ephemeral=True)
             return
 
         self.cashed_out = True
         winnings = int(self.bet * current_multiplier)
-        await database.update_balance(interaction.user.id, winnings)
+        if await database.update_balance(interaction.user.id, winnings) is not None:
+            ledger.record(interaction.user.id, winnings, ledger.PAYOUT, "crash", self.interaction.id)
+        metrics.record_game("crash", "win", self.bet, winnings)
         embed = discord.Embed(
             title="Crash Game Result",
             description=f"You withdrew at **{current_multiplier:.2f}×** and won **{winnings} coins**! ... The crash point was **{self.crash_multiplier:.2f}×**.",
@@ -379,18 +432,21 @@ class CrashGameView(discord.ui.View):
 
 async def crash(interaction: discord.Interaction, amount: int):
     user_id = interaction.user.id
-    balance = await database.get_balance(user_id)
-    if amount <= 0 or amount > balance:
+    if amount <= 0:
+        await interaction.response.send_message("❌ Amount must be greater than 0!", ephemeral=True)
+        return
+
+    # Deduct the bet immediately (only succeeds if the balance covers it).
+    ok, balance = await database.try_debit(user_id, amount)
+    if not ok:
         await interaction.response.send_message(
             f"❌ You don't have enough coins! Your balance is {balance}.", ephemeral=True
         )
         return
-
-    # Deduct the bet immediately.
-    await database.update_balance(user_id, -amount)
+    ledger.record(user_id, -amount, ledger.BET, "crash", interaction.id)
     
     # Set parameters for the game.
-    rate = 0.1  # Growth rate; adjust as needed.
+    rate = game_rules.CRASH_RATE  # Growth rate
     crash_multiplier = get_crash_multiplier()  # Use your weighted distribution function.
     start_time = time.time()  # Make sure this line is present!
     
@@ -406,45 +462,100 @@ async def crash(interaction: discord.Interaction, amount: int):
         color=discord.Color.orange()
     )
     await interaction.response.send_message(embed=embed, view=view)
-    
-    # Update loop for multiplier display.
-    update_interval = 0.5  # Adjust as needed.
-    while not view.cashed_out:
-        elapsed = time.time() - start_time
-        current_multiplier = math.exp(rate * elapsed)
-        if current_multiplier >= crash_multiplier:
-            embed = discord.Embed(
-                title="Crash!",
-                description=f"The multiplier reached **{crash_multiplier:.2f}×**. You lost your bet of {amount} coins.",
-                color=discord.Color.red()
-            )
-            for child in view.children:
-                child.disabled = True
-            try:
-                await interaction.followup.edit_message(
-                    message_id=(await interaction.original_response()).id,
-                    embed=embed,
-                    view=view
-                )
-            except Exception as e:
-                print(f"Error editing message on crash: {e}")
-            return
-        embed = discord.Embed(
-            title="Crash Game In Progress",
-            description=f"Bet: {amount} coins\nCurrent Multiplier: {current_multiplier:.2f}×\nWithdraw before it crashes!",
-            color=discord.Color.orange()
-        )
+
+    # Hand the game to the shared ticker instead of running a loop per game.
+    view.message = await interaction.original_response()
+    crash_scheduler.add(view)
+
+
+class CrashScheduler:
+    """Drives every running Crash game from one loop.
+
+    Crashes and cash-outs are checked every tick. Multiplier edits are spread so
+    that all games together stay within edits_per_second, and the spacing widens
+    when Discord starts pushing back (429s, or edits that come back slowly because
+    the library is sleeping off a rate limit) and narrows again as edits succeed.
+    """
+
+    def __init__(self, tick: float = 0.1, min_interval: float = 0.5, edits_per_second: float = 10.0, slow_edit: float = 1.0):
+        self.tick = tick
+        self.min_interval = min_interval
+        self.edits_per_second = edits_per_second
+        self.slow_edit = slow_edit
+        self.backoff = 1.0
+        self.active: set = set()
+        self.edits_sent = 0
+        self.edits_skipped = 0
+        self._task = None
+        self._final_edits: set = set()  # Keeps crash-result edits referenced until they finish
+
+    def add(self, view: CrashGameView):
+        self.active.add(view)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def interval(self) -> float:
+        """Seconds between multiplier edits for each game, given how many are running."""
+        return max(self.min_interval, len(self.active) / self.edits_per_second) * self.backoff
+
+    async def _run(self):
+        while self.active:
+            now = time.time()
+            interval = self.interval()
+            for view in list(self.active):
+                if view.cashed_out:
+                    self.active.discard(view)
+                    continue
+
+                if view.current_multiplier(now) >= view.crash_multiplier:
+                    # The final edit always goes out, even if a tick edit is still in flight
+                    self.active.discard(view)
+                    metrics.record_game("crash", "loss", view.bet, 0)
+                    for child in view.children:
+                        child.disabled = True
+                    task = asyncio.create_task(self._edit(view, view.crashed_embed(), final=True))
+                    self._final_edits.add(task)
+                    task.add_done_callback(self._final_edits.discard)
+                    continue
+
+                if now < view.next_edit_at or (view.edit_task is not None and not view.edit_task.done()):
+                    continue
+                shown = f"{view.current_multiplier(now):.2f}"
+                if shown == view.last_shown:
+                    self.edits_skipped += 1
+                    continue
+                view.last_shown = shown
+                view.next_edit_at = now + interval
+                view.edit_task = asyncio.create_task(self._edit(view, view.progress_embed(shown)))
+            await asyncio.sleep(self.tick)
+
+    async def _edit(self, view: CrashGameView, embed: discord.Embed, final: bool = False):
+        if view.cashed_out and not final:
+            return  # The withdraw result is already on screen
+        started = time.monotonic()
         try:
-            await interaction.followup.edit_message(
-                message_id=(await interaction.original_response()).id,
-                embed=embed,
-                view=view
-            )
+            # Through the outbound queue, so time spent waiting for budget there counts as pushback too.
+            # A progress edit still queued when the player withdraws must not cover up the result.
+            unless = None if final else (lambda: view.cashed_out)
+            await outbound.edit_message(view.interaction, view.message, unless=unless, embed=embed, view=view)
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self.backoff = min(self.backoff * 2, 8.0)
+            print(f"Error editing crash message: {e}")
+            return
         except Exception as e:
-            print(f"Error editing message during update: {e}")
-        await asyncio.sleep(update_interval)
+            print(f"Error editing crash message: {e}")
+            return
+        self.edits_sent += 1
+        if time.monotonic() - started > self.slow_edit:
+            self.backoff = min(self.backoff * 2, 8.0)
+        else:
+            self.backoff = max(1.0, self.backoff * 0.9)
 
 
+crash_scheduler = CrashScheduler()
+metrics.active_games.set_function(lambda: len(crash_scheduler.active), game="crash")
+metrics.active_games.set_function(lambda: len(rr_sessions), game="russianroulette")
 
 
 
@@ -459,7 +570,7 @@ async def roulette(interaction: discord.Interaction, amount: int, choice: str):
     # 1. Validate Input
     choice = choice.lower().strip()
     valid_colors = ["red", "black", "green"]
-    valid_numbers = [str(i) for i in range(37)] + ["00"] # "0" to "36" and "00"
+    valid_numbers = game_rules.ROULETTE_WHEEL # "0" to "36" and "00"
     
     bet_type = None # "color" or "number"
     
@@ -474,38 +585,16 @@ async def roulette(interaction: discord.Interaction, amount: int, choice: str):
         )
         return
 
-    # 2. Check Balance
-    balance = await database.get_balance(user_id)
+    # 2. Check Amount
     if amount <= 0:
         await interaction.response.send_message("❌ Amount must be greater than 0!", ephemeral=True)
         return
-    if amount > balance:
-        await interaction.response.send_message(f"❌ You don't have enough coins! Your balance is {balance}.", ephemeral=True)
-        return
-
-    # 3. Deduct Bet
-    await database.update_balance(user_id, -amount)
-
-    # 4. Define Wheel
-    wheel_numbers = [str(i) for i in range(37)] + ["00"]
-    
-    # Helper to determine color
-    def get_color(num_str):
-        if num_str in ["0", "00"]:
-            return "green"
-        n = int(num_str)
-        # Red numbers: 1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36
-        red_numbers = {1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36}
-        if n in red_numbers:
-            return "red"
-        else:
-            return "black"
 
-    # 5. Spin
-    result_number = random.choice(wheel_numbers)
-    result_color = get_color(result_number)
+    # 3. Spin
+    result_number = random.choice(game_rules.ROULETTE_WHEEL)
+    result_color = game_rules.roulette_color(result_number)
 
-    # 6. Determine Win
+    # 4. Determine Win
     won = False
     payout = 0
     
@@ -517,16 +606,26 @@ async def roulette(interaction: discord.Interaction, amount: int, choice: str):
             # If they bet "green", and it hits 0 or 00 (which are green), they win.
             # Green covers 2 spots (2/38). Fair payout is 18x. 
             if choice == "green":
-                 payout = amount * 18 # 17:1 odds
+                 payout = amount * game_rules.ROULETTE_GREEN_PAYOUT # 17:1 odds
             else:
-                 payout = amount * 2 # 1:1 odds
+                 payout = amount * game_rules.ROULETTE_COLOR_PAYOUT # 1:1 odds
             
     elif bet_type == "number":
         if choice == result_number:
             won = True
-            payout = amount * 36 # 35:1 payout (36x total)
+            payout = amount * game_rules.ROULETTE_NUMBER_PAYOUT # 35:1 payout (36x total)
+
+    # 5. Deduct Bet & Add Payout (which includes original bet) in one conditional update
+    ok, balance = await database.try_debit(user_id, amount, credit=payout)
+    if not ok:
+        await interaction.response.send_message(f"❌ You don't have enough coins! Your balance is {balance}.", ephemeral=True)
+        return
+
+    ledger.record(user_id, -amount, ledger.BET, "roulette", interaction.id)
+    ledger.record(user_id, payout, ledger.PAYOUT, "roulette", interaction.id)
 
-    # 7. Update Balance & Send Result
+    # 6. Send Result
+    metrics.record_game("roulette", "win" if won else "loss", amount, payout)
     
     # Color mapping for Embed
     embed_color = discord.Color.red() if result_color == "red" else discord.Color.default()
@@ -538,7 +637,6 @@ async def roulette(interaction: discord.Interaction, amount: int, choice: str):
 
     if won:
         profit = payout - amount
-        await database.update_balance(user_id, payout) # Add payout (which includes original bet)
         message += f"🎉 **YOU WON!** You received **{payout}** coins (Profit: {profit})."
         title = "Roulette Result: WIN! 🤑"
     else:
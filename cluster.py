@@ -0,0 +1,424 @@
+"""Runs the bot as a cluster: its gateway shards spread over worker processes.
+
+Each worker is an ordinary bot process (Kui_Discord_Bot_V1.py) running an
+AutoShardedBot over its slice of the shards, with its own database pool and
+its own metrics port (METRICS_PORT + worker number). Workers share state through
+the database and a small broadcast bus run by the launcher (newline-delimited
+JSON over localhost TCP):
+
+  * balance writes, so every worker's balance cache and leaderboards follow
+    coins won or spent on another worker;
+  * shard reports (latency, events per second, guilds), which the launcher logs
+    and )shards shows from any worker.
+
+Russian Roulette games live on the worker that serves their guild: after a
+restart each worker only recovers its own guilds' games, and a player already
+in a game on another worker can't start or join a second one.
+
+    python cluster.py --workers 4               # shard count recommended by Discord
+    python cluster.py --workers 4 --shards 16
+
+STORAGE_BACKEND=memory can't be shared between processes, so it only runs with
+one worker. Without the launcher, BOT_SHARDED=1 runs every shard in one process.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import math
+import os
+import signal
+import sys
+import time
+
+import discord
+from discord.ext import commands
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Set by the launcher for each worker; SHARD_COUNT and SHARD_IDS may also be set by hand
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None  # Total shards across the cluster (None: Discord recommends)
+SHARD_IDS = [int(shard) for shard in os.getenv('SHARD_IDS', '').split(',') if shard.strip()] or None  # This process's shards
+CLUSTER_ID = int(os.getenv('CLUSTER_ID', '0'))
+CLUSTER_BUS = os.getenv('CLUSTER_BUS', '')  # host:port of the launcher's bus; empty outside a cluster
+CLUSTERED = bool(CLUSTER_BUS)
+SHARDED = CLUSTERED or SHARD_COUNT is not None or os.getenv('BOT_SHARDED', '').lower() in ('1', 'true', 'yes')
+
+REPORT_INTERVAL = float(os.getenv('SHARD_REPORT_INTERVAL', '30'))  # seconds between shard reports
+BUS_FLUSH_INTERVAL = 0.05  # seconds balance writes are batched before going out on the bus
+BUS_SEND_TIMEOUT = 5.0  # seconds the launcher waits on a worker that isn't reading the bus before dropping it
+STOP_TIMEOUT = float(os.getenv('CLUSTER_STOP_TIMEOUT', '30'))  # seconds workers get to shut down before they're killed
+IDENTIFY_WINDOW = 5.0  # Discord allows max_concurrency shard identifies per 5 seconds
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Kui_Discord_Bot_V1.py")
+
+
+def shard_for_guild(guild_id, shard_count):
+    """Discord's routing: which shard receives a guild's events."""
+    return (guild_id >> 22) % shard_count
+
+
+def owns_guild(guild_id):
+    """Whether this process serves a guild (always, outside a cluster). DMs and unknown guilds go with shard 0."""
+    if not CLUSTERED or SHARD_COUNT is None or SHARD_IDS is None:
+        return True
+    return (0 if guild_id is None else shard_for_guild(guild_id, SHARD_COUNT)) in SHARD_IDS
+
+
+# --- Worker side ---
+
+def _guild_id(obj):
+    if isinstance(obj, discord.Guild):
+        return obj.id
+    guild_id = getattr(obj, "guild_id", None)  # Interactions and raw events
+    if guild_id is None:
+        guild = getattr(obj, "guild", None)  # Messages, members, channels
+        guild_id = getattr(guild, "id", None)
+    return guild_id if isinstance(guild_id, int) else None
+
+
+class ShardStats:
+    """Events dispatched per shard (attributed through the event's guild) and per-shard latency."""
+
+    def __init__(self):
+        self.events = collections.Counter()
+        self.latest = []  # The last report's rows
+        self._mark = (time.monotonic(), collections.Counter())
+
+    def record(self, bot, event_name, args):
+        # Command events repeat an interaction or message that was already counted
+        if not args or event_name.startswith(("command", "app_command", "socket_")):
+            return
+        guild_id = _guild_id(args[0])
+        if guild_id is None:
+            return
+        shard = shard_for_guild(guild_id, bot.shard_count or 1)
+        self.events[shard] += 1
+        metrics.shard_events.inc(shard=str(shard))
+
+    def snapshot(self, bot, advance=True):
+        """One row per shard of this process, with the event rate since the previous snapshot."""
+        now = time.monotonic()
+        since, before = self._mark
+        elapsed = max(now - since, 1e-9)
+        if advance:
+            self._mark = (now, collections.Counter(self.events))
+        latencies = bot.latencies if isinstance(bot, commands.AutoShardedBot) else [(bot.shard_id or 0, bot.latency)]
+        guilds = collections.Counter(guild.shard_id for guild in bot.guilds)
+        rows = []
+        for shard, latency in sorted(latencies):
+            rows.append({
+                "shard": shard,
+                "latency_ms": round(latency * 1000, 1) if math.isfinite(latency) else None,
+                "events_per_second": round((self.events[shard] - before[shard]) / elapsed, 2),
+                "guilds": guilds[shard],
+            })
+        return rows
+
+
+shard_stats = ShardStats()
+
+
+class _CountEvents:
+    def dispatch(self, event_name, /, *args, **kwargs):
+        shard_stats.record(self, event_name, args)
+        super().dispatch(event_name, *args, **kwargs)
+
+
+class Bot(_CountEvents, commands.Bot):
+    pass
+
+
+class ShardedBot(_CountEvents, commands.AutoShardedBot):
+    pass
+
+
+def make_bot(**options):
+    """The bot for this process: an AutoShardedBot over SHARD_IDS when sharded, a plain Bot otherwise."""
+    if SHARDED:
+        return ShardedBot(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **options)
+    return Bot(**options)
+
+
+class ClusterBus:
+    """A worker's connection to the launcher's bus."""
+
+    def __init__(self, address):
+        self.address = address
+        self.reports: dict[int, dict] = {}  # worker -> {"at", "shards"}, from every other worker
+        self._writer = None
+        self._outbox: dict[int, int] = {}  # user_id -> balance, sent every BUS_FLUSH_INTERVAL
+        self._applying = False
+        self._tasks = []
+
+    async def start(self):
+        host, port = self.address.rsplit(":", 1)
+        reader, self._writer = await asyncio.open_connection(host, int(port))
+        database.add_balance_listener(self.on_balance_change)
+        self._tasks = [asyncio.create_task(self._read_loop(reader)), asyncio.create_task(self._flush_loop())]
+        logger.info(f"Worker {CLUSTER_ID} joined the cluster bus at {self.address} (shards {SHARD_IDS}).")
+
+    def on_balance_change(self, user_id, balance):
+        """Balance listener: queues this worker's writes for the other workers."""
+        if not self._applying and self._writer is not None and not self._writer.is_closing():
+            self._outbox[user_id] = balance
+
+    def publish(self, message):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(json.dumps({**message, "from": CLUSTER_ID}).encode() + b"\n")
+
+    async def _flush_loop(self):
+        while not self._writer.is_closing():
+            await asyncio.sleep(BUS_FLUSH_INTERVAL)
+            if self._outbox:
+                balances, self._outbox = self._outbox, {}
+                self.publish({"type": "balances", "balances": {str(user_id): balance for user_id, balance in balances.items()}})
+                try:
+                    await self._writer.drain()
+                except ConnectionError as e:
+                    logger.error(f"Lost the cluster bus while sending balances: {e}")
+                    self._writer.close()  # Stops on_balance_change queueing for a bus that's gone
+                    self._outbox.clear()
+                    return
+
+    async def _read_loop(self, reader):
+        while line := await reader.readline():
+            message = json.loads(line)
+            if message["type"] == "balances":
+                self._applying = True  # Don't echo other workers' writes back onto the bus
+                try:
+                    for user_id, balance in message["balances"].items():
+                        database.balance_changed_elsewhere(int(user_id), balance)
+                finally:
+                    self._applying = False
+            elif message["type"] == "shards":
+                self.reports[message["from"]] = {"at": time.time(), "shards": message["shards"]}
+        # Without the bus, cached balances could miss other workers' writes for a whole TTL
+        logger.error("Lost the cluster bus; cached balances now expire on their TTL only.")
+        self._writer.close()
+        database.invalidate_balance()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+
+bus = None
+_report_task = None
+
+
+async def _report_loop(bot):
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        if not bot.is_ready():
+            continue
+        rows = shard_stats.latest = shard_stats.snapshot(bot)
+        for row in rows:
+            if row["latency_ms"] is not None:
+                metrics.shard_latency.set(row["latency_ms"] / 1000, shard=str(row["shard"]))
+        if bus is not None:
+            bus.publish({"type": "shards", "shards": rows})
+
+
+async def start(bot):
+    """Starts shard reporting, and joins the launcher's bus when running as a cluster worker."""
+    global bus, _report_task
+    if CLUSTERED:
+        bus = ClusterBus(CLUSTER_BUS)
+        await bus.start()
+    _report_task = asyncio.create_task(_report_loop(bot))
+
+
+async def stop():
+    global bus, _report_task
+    if _report_task is not None:
+        _report_task.cancel()
+        _report_task = None
+    if bus is not None:
+        await bus.close()
+        bus = None
+
+
+def shard_reports(bot):
+    """{worker: {"at", "shards"}} for the whole cluster: this worker live, the others from their last report."""
+    reports = dict(bus.reports) if bus is not None else {}
+    reports[CLUSTER_ID] = {"at": time.time(), "shards": shard_stats.latest or shard_stats.snapshot(bot, advance=False)}
+    return reports
+
+
+# --- Launcher ---
+
+def split_shards(shard_count, workers):
+    """Contiguous, near-equal slices of the shard IDs, one per worker."""
+    size, extra = divmod(shard_count, workers)
+    slices, start = [], 0
+    for worker in range(workers):
+        end = start + size + (worker < extra)
+        slices.append(list(range(start, end)))
+        start = end
+    return [shards for shards in slices if shards]
+
+
+async def recommended_shards(token):
+    """Discord's recommended shard count and identify concurrency for this bot."""
+    client = discord.Client(intents=discord.Intents.none())
+    try:
+        await client.login(token)
+        shards, _, limits = await client.http.get_bot_gateway()
+        return shards, limits.get("max_concurrency", 1)
+    finally:
+        await client.close()
+
+
+class Launcher:
+    def __init__(self, shard_count, slices, max_concurrency, bus_port):
+        self.shard_count = shard_count
+        self.slices = slices
+        self.max_concurrency = max_concurrency
+        self.bus_port = bus_port
+        self.processes: dict[int, asyncio.subprocess.Process] = {}
+        self.reports: dict[int, dict] = {}
+        self._clients: set = set()
+        self._stopping = asyncio.Event()
+
+    async def run(self):
+        server = await asyncio.start_server(self._serve, "127.0.0.1", self.bus_port)
+        self.bus_port = server.sockets[0].getsockname()[1]
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+        logger.info(f"Cluster: {self.shard_count} shards on {len(self.slices)} workers, bus on 127.0.0.1:{self.bus_port}.")
+
+        # Stagger the workers so their shards identify within Discord's concurrency limit
+        delay, supervisors = 0.0, []
+        for worker, shards in enumerate(self.slices):
+            supervisors.append(asyncio.create_task(self._supervise(worker, shards, delay)))
+            delay += IDENTIFY_WINDOW * math.ceil(len(shards) / self.max_concurrency)
+        reporter = asyncio.create_task(self._log_reports())
+
+        await self._stopping.wait()
+        logger.info("Stopping the cluster...")
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGINT)  # The bot shuts down cleanly on Ctrl+C: checkpoints games, flushes users
+        done, hung = await asyncio.wait(supervisors, timeout=STOP_TIMEOUT)
+        if hung:
+            for worker, process in self.processes.items():
+                if process.returncode is None:
+                    logger.error(f"Worker {worker} didn't stop within {STOP_TIMEOUT:.0f}s; killing it.")
+                    process.kill()
+            await asyncio.gather(*hung)
+        reporter.cancel()
+        server.close()
+
+    def _environment(self, worker, shards):
+        env = dict(os.environ)
+        env.update(SHARD_COUNT=str(self.shard_count), SHARD_IDS=",".join(map(str, shards)),
+                   CLUSTER_ID=str(worker), CLUSTER_BUS=f"127.0.0.1:{self.bus_port}")
+        if metrics.METRICS_PORT:
+            env["METRICS_PORT"] = str(metrics.METRICS_PORT + worker)
+        return env
+
+    async def _supervise(self, worker, shards, delay):
+        """Runs one worker, restarting it with backoff if it dies."""
+        backoff = 5.0
+        try:
+            await asyncio.wait_for(self._stopping.wait(), delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            process = self.processes[worker] = await asyncio.create_subprocess_exec(
+                sys.executable, BOT_SCRIPT, env=self._environment(worker, shards))
+            logger.info(f"Worker {worker} started (pid {process.pid}, shards {shards[0]}-{shards[-1]}).")
+            try:
+                code = await process.wait()
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+            if self._stopping.is_set():
+                logger.info(f"Worker {worker} stopped.")
+                return
+            backoff = 5.0 if time.monotonic() - started > 300 else min(backoff * 2, 300.0)
+            logger.error(f"Worker {worker} exited with code {code}; restarting in {backoff:.0f}s.")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), backoff)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _serve(self, reader, writer):
+        """Bus: every line a worker sends goes to every other worker."""
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["type"] == "shards":
+                    self.reports[message["from"]] = {"at": time.time(), "shards": message["shards"]}
+                await asyncio.gather(*(self._send(client, line) for client in self._clients
+                                       if client is not writer and not client.is_closing()))
+        except (ConnectionError, json.JSONDecodeError) as e:
+            logger.warning(f"Dropped a bus connection: {e}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _send(self, client, line):
+        """Writes to one worker, dropping it if it doesn't keep up (it then falls back to cache TTLs)."""
+        client.write(line)
+        try:
+            await asyncio.wait_for(client.drain(), BUS_SEND_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            logger.warning(f"Dropped a bus connection that stopped reading: {e or type(e).__name__}")
+            self._clients.discard(client)
+            client.close()
+
+    async def _log_reports(self):
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            now = time.time()
+            for worker, report in sorted(self.reports.items()):
+                stale = " (stale)" if now - report["at"] > 3 * REPORT_INTERVAL else ""
+                for row in report["shards"]:
+                    latency = f"{row['latency_ms']:.0f} ms" if row["latency_ms"] is not None else "-"
+                    logger.info(f"Shard {row['shard']} on worker {worker}{stale}: {latency}, "
+                                f"{row['events_per_second']:.1f} events/s, {row['guilds']} guilds")
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    import storage
+
+    parser = argparse.ArgumentParser(description="Run the bot as several worker processes, each serving a slice of the shards.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per CPU)")
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT, help="total shards (default: SHARD_COUNT, or Discord's recommendation)")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="shard identifies allowed per 5 seconds (default: from Discord)")
+    parser.add_argument("--bus-port", type=int, default=int(os.getenv('CLUSTER_BUS_PORT', '0')), help="localhost port for the bus (default: any free port)")
+    options = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if options.workers < 1:
+        parser.error("--workers must be at least 1")
+    if storage.STORAGE_BACKEND == "memory" and options.workers > 1:
+        parser.error("STORAGE_BACKEND=memory keeps balances inside one process; use mysql or sqlite for a cluster")
+
+    async def launch():
+        shard_count, max_concurrency = options.shards, options.max_concurrency
+        if shard_count is None or max_concurrency is None:
+            recommended, concurrency = await recommended_shards(os.getenv('DISCORD_TOKEN'))
+            shard_count = shard_count or recommended
+            max_concurrency = max_concurrency or concurrency
+        slices = split_shards(shard_count, min(options.workers, shard_count))
+        await Launcher(shard_count, slices, max_concurrency, options.bus_port).run()
+
+    asyncio.run(launch())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Slash command sync, gated on a hash of the command tree. Syncing is a rate-limited
+# API call (and Discord caps command updates per day), so the "command sync" startup
+# stage, which runs on every boot and deploy, only syncs when the commands actually
+# changed since the last sync. Each scope (global, or one guild) keeps the hash of
+# every command it last synced in a small JSON file, which is also what )sync and
+# )unsync diff against.
+COMMAND_SYNC_STATE = os.getenv('COMMAND_SYNC_STATE', '.command_sync.json')
+
+GLOBAL_SCOPE = "global"
+
+
+def _scope(guild):
+    return GLOBAL_SCOPE if guild is None else str(guild.id)
+
+
+def _label(payload):
+    # Slash commands and context menus may share a name
+    return f"/{payload['name']}" if payload.get("type", 1) == 1 else f"{payload['name']} (context menu)"
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def fingerprint(tree, guild=None):
+    """{"hash", "commands": {label: hash}} for the commands the tree would sync to a scope."""
+    payloads = [command.to_dict(tree) for command in tree.get_commands(guild=guild)]
+    commands = {_label(payload): _digest(payload) for payload in payloads}
+    return {"hash": _digest(commands), "commands": commands}
+
+
+def diff(previous, current):
+    """(added, changed, unknown, removed) command labels between two {label: hash} maps.
+
+    A previous hash of None means the command exists but what it looked like is
+    unknown, so it lands in unknown rather than changed.
+    """
+    added = sorted(label for label in current if label not in previous)
+    changed = sorted(label for label in current
+                     if previous.get(label) is not None and previous[label] != current[label])
+    unknown = sorted(label for label in current if label in previous and previous[label] is None)
+    removed = sorted(label for label in previous if label not in current)
+    return added, changed, unknown, removed
+
+
+class CommandSync:
+    def __init__(self, path=COMMAND_SYNC_STATE):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable command sync state {self.path}: {e}")
+            return {}
+
+    def _save(self, state):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)  # Never leave a half-written file behind
+
+    async def sync(self, tree, guild=None, force=False):
+        """Syncs a scope if its commands changed since the last sync (or when forced).
+
+        Returns {"synced", "added", "changed", "unknown", "removed"}. A scope with no
+        recorded state (synced before this was tracked, or by another host) is diffed
+        against the commands Discord currently has, by name: the ones still in the
+        tree are reported as unknown, since there is nothing to compare them to.
+        """
+        current = fingerprint(tree, guild)
+        state = self._load()
+        recorded = state.get(_scope(guild))
+        if not force and recorded is not None and recorded["hash"] == current["hash"]:
+            return {"synced": False, "added": [], "changed": [], "unknown": [], "removed": []}
+
+        if recorded is None:
+            previous = {_label({"name": command.name, "type": command.type.value}): None
+                        for command in await tree.fetch_commands(guild=guild)}
+        else:
+            previous = recorded["commands"]
+        await tree.sync(guild=guild)
+
+        added, changed, unknown, removed = diff(previous, current["commands"])
+        state[_scope(guild)] = current
+        try:
+            self._save(state)
+        except OSError as e:
+            logger.warning(f"Couldn't record command sync state in {self.path}: {e}")
+        return {"synced": True, "added": added, "changed": changed, "unknown": unknown, "removed": removed}
+
+
+def describe(result):
+    """One line per kind of change, for the admin commands."""
+    if not result["synced"]:
+        return "No changes since the last sync."
+    lines = []
+    for title, labels in (("➕ Added", result["added"]), ("✏️ Changed", result["changed"]),
+                          ("❔ Already deployed (changes unknown)", result["unknown"]),
+                          ("➖ Removed", result["removed"])):
+        if labels:
+            lines.append(f"{title}: {', '.join(labels)}")
+    return "\n".join(lines) or "Synced; every command was already up to date."
+
+
+syncer = CommandSync()
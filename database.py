@@ -1,327 +1,799 @@
-import aiomysql
+import asyncio
+import contextlib
+import contextvars
 import os
 import datetime
-import json
 import logging
+import time
+from collections import OrderedDict
 from typing import Any
+import metrics
+import storage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global variable for the connection pool
-pool: Any = None
+# The storage backend (MySQL, SQLite or in-memory; see storage.STORAGE_BACKEND),
+# started on first use. Everything below the backend -- caches, listeners, the
+# user registry, sessions -- lives here and works the same on all of them.
+backend: Any = None
+_backend_lock = asyncio.Lock()
+
+
+class PoolStats:
+    """Where database time goes: waiting for a pool connection vs. holding one, per database function."""
+
+    def __init__(self):
+        self.acquires = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.queries: dict[str, list] = {}  # function -> [calls, total seconds, max seconds]
+
+    def record_acquire(self, waited):
+        self.acquires += 1
+        self.acquire_wait_total += waited
+        self.acquire_wait_max = max(self.acquire_wait_max, waited)
+
+    def record_query(self, name, seconds):
+        metrics.db_query_latency.observe(seconds, function=name)
+        entry = self.queries.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+    def snapshot(self):
+        info = backend.pool_info() if backend else storage.StorageBackend.pool_info(None)
+        return {
+            **info,
+            "backend": backend.name if backend else storage.STORAGE_BACKEND,
+            "in_use": info["pool_size"] - info["free"],
+            "acquires": self.acquires,
+            "acquire_wait_avg": self.acquire_wait_total / self.acquires if self.acquires else 0.0,
+            "acquire_wait_max": self.acquire_wait_max,
+            "queries": {
+                name: {"calls": calls, "avg": total / calls, "max": worst}
+                for name, (calls, total, worst) in self.queries.items()
+            },
+        }
+
+pool_stats = PoolStats()
+
+# Write-behind user registry. on_message sees every chat line, so users we have
+# already written are skipped and new/changed ones are upserted in batches.
+USER_FLUSH_INTERVAL = float(os.getenv('USER_FLUSH_INTERVAL', '5'))  # seconds
+USER_FLUSH_BATCH = int(os.getenv('USER_FLUSH_BATCH', '200'))  # flush early at this many pending users
+
+_known_users: dict[int, tuple[str, int]] = {}  # user_id -> (username, server_id) as last written
+_pending_users: dict[int, tuple[str, int]] = {}  # user_id -> (username, server_id) waiting to be written
+_user_flush_lock = asyncio.Lock()
+_user_flush_task: Any = None
+_background_tasks: set = set()  # Keeps fire-and-forget tasks referenced until they finish
+
+# Unit of work: session() pins one pooled connection to the current task, and
+# every database function below picks it up through _acquire.
+_session_var: contextvars.ContextVar = contextvars.ContextVar("database_session", default=None)
+
+
+class Rollback(Exception):
+    """Raise inside session(transaction=True) to roll the work back quietly; the session swallows it."""
+
+
+class _Session:
+    def __init__(self, conn):
+        self.conn = conn
+        self.owner = asyncio.current_task()  # Tasks started inside the block copy the contextvar but must not share the connection
+        self.depth = 0  # open transaction levels; 0 means autocommit
+        self.pending: list[dict] = []  # per level: user_id -> balance written, published to caches on the outermost commit
+
+
+def _current_session():
+    state = _session_var.get()
+    if state is not None and state.conn is not None and state.owner is asyncio.current_task():
+        return state
+    return None
+
+
+def _in_transaction():
+    state = _current_session()
+    return state is not None and state.depth > 0
+
+async def get_backend() -> Any:
+    """Returns the storage backend, opening its connections on first use."""
+    global backend
+    if backend is None:
+        async with _backend_lock:  # Concurrent first callers share one backend
+            if backend is None:
+                created = storage.create_backend()
+                try:
+                    await created.start()
+                except Exception as e:
+                    logger.error(f"Failed to start {created.name} storage: {e}")
+                    raise
+                backend = created
+    return backend
+
+@contextlib.asynccontextmanager
+async def _acquire(name, detached=False):
+    """Checks a connection out of the backend, recording the wait and how long `name` holds it.
+
+    Inside session() the session's connection is used instead, unless detached is set
+    (for writes that must not be rolled back with the caller's transaction).
+    """
+    state = None if detached else _current_session()
+    if state is not None:
+        held_from = time.perf_counter()
+        try:
+            yield state.conn
+        finally:
+            pool_stats.record_query(name, time.perf_counter() - held_from)
+        return
+
+    store = await get_backend()
+    started = time.perf_counter()
+    async with store.connection() as conn:
+        pool_stats.record_acquire(time.perf_counter() - started)
+        held_from = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            pool_stats.record_query(name, time.perf_counter() - held_from)
+
+@contextlib.asynccontextmanager
+async def _transaction(conn):
+    """BEGIN ... COMMIT around the block, rolling back if it raises.
+
+    Inside a session that is already in a transaction this becomes a savepoint, so the
+    block still succeeds or fails as a unit without committing the caller's work.
+    Yields a handle whose rollback() undoes the block early (the block may keep querying).
+    """
+    state = _current_session()
+    if state is not None and state.conn is not conn:
+        state = None
+    nested = state is not None and state.depth > 0
+    savepoint = f"sp_{state.depth}" if nested else None
+    tx = _TransactionHandle(conn, savepoint)
+
+    if nested:
+        await backend.savepoint(conn, savepoint)
+    else:
+        await backend.begin(conn)
+    if state is not None:
+        state.depth += 1
+        state.pending.append({})
 
-async def init_pool():
-    global pool
     try:
-        pool = await aiomysql.create_pool(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'), 
-            password=os.getenv('DB_PASSWORD'),
-            db=os.getenv('DB_NAME'),
-            autocommit=True
-        )
-        logger.info("Database connection pool initialized.")
-    except Exception as e:
-        logger.error(f"Failed to initialize database pool: {e}")
-        raise
-
-async def get_pool() -> Any:
-    global pool
-    if pool is None:
-        await init_pool()
-    return pool
+        try:
+            yield tx
+        except BaseException:
+            if not tx.done:
+                await tx.rollback()
+            raise
+        if not tx.done:
+            await tx.commit()
+    finally:
+        if state is not None:
+            state.depth -= 1
+            written = state.pending.pop()
+            if tx.committed:
+                if state.pending:
+                    state.pending[-1].update(written)  # The outer transaction can still roll these back
+                else:
+                    for user_id, balance in written.items():
+                        _publish_balance(user_id, balance)
+
+
+class _TransactionHandle:
+    def __init__(self, conn, savepoint):
+        self.conn = conn
+        self.savepoint = savepoint
+        self.done = False
+        self.committed = False
+
+    async def commit(self):
+        self.done = True
+        if self.savepoint:
+            await backend.release_savepoint(self.conn, self.savepoint)
+        else:
+            await backend.commit(self.conn)
+        self.committed = True
+
+    async def rollback(self):
+        self.done = True
+        if self.savepoint:
+            await backend.rollback_to_savepoint(self.conn, self.savepoint)
+        else:
+            await backend.rollback(self.conn)
+
+
+@contextlib.asynccontextmanager
+async def session(transaction=False):
+    """Holds one pooled connection for every database call this task makes inside the block.
+
+    With transaction=True the block commits as one unit when it finishes and rolls back if
+    it raises (raise Rollback to undo it without an error). Balance caches and leaderboards
+    only see its writes once it commits. Nested sessions reuse the outer connection, and a
+    nested transaction becomes a savepoint. Tasks started inside the block are not part of
+    the session and use their own connections.
+    """
+    state = _current_session()
+    if state is not None:
+        if transaction:
+            try:
+                async with _transaction(state.conn):
+                    yield state.conn
+            except Rollback:
+                pass
+        else:
+            yield state.conn
+        return
+
+    async with _acquire("session") as conn:
+        state = _Session(conn)
+        token = _session_var.set(state)
+        try:
+            if transaction:
+                async with _transaction(conn):
+                    yield conn
+            else:
+                yield conn
+        except Rollback:
+            pass
+        finally:
+            state.conn = None
+            _session_var.reset(token)
 
 async def close_pool():
-    global pool
-    if pool:
-        pool.close()
-        await pool.wait_closed()
-        logger.info("Database connection pool closed.")
-
-# Initialize database (create tables)
+    global backend, _user_flush_task
+    if _user_flush_task is not None:
+        _user_flush_task.cancel()
+        _user_flush_task = None
+    if backend:
+        await flush_users()  # Don't lose buffered registry writes on shutdown
+        await backend.close()
+        backend = None
+
+# Initialize database (bring the schema up to date)
 async def init_db():
-    pool = await get_pool()
-    
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                username VARCHAR(255),
-                server_id BIGINT,
-                balance INT DEFAULT 0,
-                last_claim DATE
-            )
-            """)
-
-            await cursor.execute("""
-            CREATE TABLE IF NOT EXISTS inventory (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id BIGINT,
-                item_name VARCHAR(255),
-                quantity INT DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            """)
-            
-            # Ensure tables needed for Russian Roulette exist (based on usage in original code)
-            # Note: The original init_db didn't create these, assuming they existed or were created manually.
-            # Adding them here for completeness if they don't exist is good practice, but I'll stick to the original logic 
-            # unless errors arise. The user mentioned using Workbench, so tables likely exist.
+    """Applies pending schema migrations, then warns about hot queries that would scan whole tables."""
+    store = await get_backend()
+    await store.migrate()
+    await store.verify()
 
 # Function to add a user
 async def add_user(user_id, username, server_id):
     """Adds a new user to the database, ensuring server_id is recorded."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("""
-                INSERT INTO users (user_id, username, server_id, balance)
-                VALUES (%s, %s, %s, 0)
-                ON DUPLICATE KEY UPDATE username = VALUES(username), server_id = VALUES(server_id)
-            """, (user_id, username, server_id))
+    async with _acquire("add_user") as conn:
+        await backend.upsert_users(conn, [(user_id, username, server_id)])
+    _known_users[user_id] = (username, server_id)
+    _pending_users.pop(user_id, None)
+
+def queue_user(user_id, username, server_id):
+    """Registers a user seen in chat. Unchanged users cost nothing; new or changed ones are written in the next batch."""
+    entry = (username, server_id)
+    if _known_users.get(user_id) == entry:
+        return
+
+    _known_users[user_id] = entry
+    _pending_users[user_id] = entry
+
+    if len(_pending_users) >= USER_FLUSH_BATCH:
+        _spawn(flush_users())
+    _ensure_user_flusher()
+
+async def flush_users():
+    """Writes all buffered users in one batch."""
+    async with _user_flush_lock:
+        if not _pending_users:
+            return
+
+        batch = list(_pending_users.items())
+        _pending_users.clear()
+
+        try:
+            async with _acquire("flush_users", detached=True) as conn:
+                await backend.upsert_users(conn, [(user_id, username, server_id) for user_id, (username, server_id) in batch])
+        except Exception as e:
+            logger.error(f"Failed to flush {len(batch)} buffered users: {e}")
+            # Put them back for the next attempt, without clobbering anything newer
+            for user_id, entry in batch:
+                _pending_users.setdefault(user_id, entry)
+
+async def ensure_user_written(user_id):
+    """Flushes the registry if this user is still buffered, so balance writes find their row."""
+    if user_id in _pending_users:
+        await flush_users()
+
+async def _user_flush_loop():
+    while True:
+        await asyncio.sleep(USER_FLUSH_INTERVAL)
+        await flush_users()
+
+def _ensure_user_flusher():
+    global _user_flush_task
+    if _user_flush_task is None or _user_flush_task.done():
+        _user_flush_task = asyncio.create_task(_user_flush_loop())
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+class BalanceCache:
+    """Bounded LRU of user balances with TTL expiry, kept current by the balance writers."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()  # user_id -> (balance or None, expires_at, stamp)
+        self._stamp = 0  # Bumped on every write/invalidation so in-flight reads can't store stale values
+        self._cleared_at = 0
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] is None or entry[1] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+
+    def begin_read(self):
+        """Returns a token to pass to fill() once the database read completes."""
+        return self._stamp
+
+    def fill(self, user_id, balance, token):
+        """Stores a value read from the database, unless a write or invalidation happened since begin_read()."""
+        entry = self._entries.get(user_id)
+        if token < self._cleared_at or (entry is not None and entry[2] > token):
+            return
+        self._store(user_id, balance)
+
+    def set(self, user_id, balance):
+        """Write-through: called with the balance the database just reported."""
+        self._stamp += 1
+        self._store(user_id, balance)
+
+    def invalidate(self, user_id=None):
+        """Drops one user (or everyone) so the next read goes to the database."""
+        self._stamp += 1
+        if user_id is None:
+            self._entries.clear()
+            self._cleared_at = self._stamp
+        else:
+            # Leave a tombstone so a read that started earlier can't put the old value back
+            self._entries[user_id] = (None, 0, self._stamp)
+            self._entries.move_to_end(user_id)
+            self._trim()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _store(self, user_id, balance):
+        self._entries[user_id] = (balance, time.monotonic() + self.ttl, self._stamp)
+        self._entries.move_to_end(user_id)
+        self._trim()
+
+    def _trim(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+balance_cache = BalanceCache(
+    maxsize=int(os.getenv('BALANCE_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('BALANCE_CACHE_TTL', '30')),  # seconds; bounds how long writes from outside the bot go unseen
+)
+
+_balance_listeners: list = []  # Called as listener(user_id, new_balance) after every balance write
+
+def add_balance_listener(listener):
+    """Registers a callback for balance writes (leaderboard caches keep themselves current this way)."""
+    _balance_listeners.append(listener)
+
+def _balance_changed(user_id, balance):
+    state = _current_session()
+    if state is not None and state.pending:
+        state.pending[-1][user_id] = balance  # Published when the transaction commits
+        return
+    _publish_balance(user_id, balance)
+
+def _publish_balance(user_id, balance):
+    balance_cache.set(user_id, balance)
+    for listener in _balance_listeners:
+        try:
+            listener(user_id, balance)
+        except Exception as e:
+            logger.error(f"Balance listener {listener!r} failed: {e}")
+
+def balance_changed_elsewhere(user_id, balance):
+    """Takes a balance another process wrote (a cluster worker): drops the cached value and tells the listeners."""
+    balance_cache.invalidate(user_id)
+    for listener in _balance_listeners:
+        try:
+            listener(user_id, balance)
+        except Exception as e:
+            logger.error(f"Balance listener {listener!r} failed: {e}")
+
+def known_server(user_id):
+    """Returns the server a user was last registered from, if this process has seen them."""
+    entry = _known_users.get(user_id)
+    return entry[1] if entry else None
+
+def known_username(user_id):
+    """Returns the username a user was last registered with, if this process has seen them."""
+    entry = _known_users.get(user_id)
+    return entry[0] if entry else None
+
+def invalidate_balance(user_id=None):
+    """Forgets cached balances for one user, or all of them, after a write the bot didn't make."""
+    balance_cache.invalidate(user_id)
 
 # Function to update balance
 async def update_balance(user_id, amount):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("UPDATE users SET balance = balance + %s WHERE user_id = %s", (amount, user_id))
+    """Adds amount (may be negative) to a balance and returns the new balance, or None if the user doesn't exist."""
+    if amount == 0:
+        return await get_balance(user_id)
+
+    await ensure_user_written(user_id)
+    async with _acquire("update_balance") as conn:
+        new_balance = await backend.add_to_balance(conn, user_id, amount)
+    if new_balance is None:
+        balance_cache.invalidate(user_id)
+        return None
+
+    _balance_changed(user_id, new_balance)
+    return new_balance
+
+async def try_debit(user_id, amount, credit=0):
+    """Takes amount from a user only if their balance covers it, in one conditional update.
+
+    credit is paid back in the same statement, so games that know the outcome up front
+    (coinflip, roulette) settle in a single round trip.
+    Returns (True, new_balance) on success, or (False, current_balance) if funds were short.
+    """
+    await ensure_user_written(user_id)
+    async with _acquire("try_debit") as conn:
+        new_balance = await backend.debit(conn, user_id, amount, credit)
+        if new_balance is not None:
+            _balance_changed(user_id, new_balance)
+            return True, new_balance
+
+        # Rejected: report what they actually have, on the same connection
+        balance = await backend.get_balance(conn, user_id) or 0
+
+    if not _in_transaction():  # A balance read mid-transaction may never be committed
+        balance_cache.set(user_id, balance)
+    return False, balance
+
+async def transfer(sender_id, receiver_id, amount):
+    """Moves coins from sender to receiver in one transaction, only if the sender can cover it.
+
+    Returns (True, sender_new_balance) on success, or (False, sender_balance) if funds were short.
+    """
+    await ensure_user_written(sender_id)
+    await ensure_user_written(receiver_id)
+    async with _acquire("transfer") as conn:
+        try:
+            async with _transaction(conn) as tx:
+                sender_balance = await backend.debit(conn, sender_id, amount)
+                if sender_balance is None:
+                    await tx.rollback()
+                    sender_balance = await backend.get_balance(conn, sender_id) or 0
+                    if not _in_transaction():
+                        balance_cache.set(sender_id, sender_balance)
+                    return False, sender_balance
+                # The receiver may never have chatted, so may have no row yet
+                receiver_balance = await backend.credit_or_create(conn, receiver_id, amount)
+        except Exception:
+            balance_cache.invalidate(sender_id)
+            balance_cache.invalidate(receiver_id)
+            raise
+
+    _balance_changed(sender_id, sender_balance)
+    _balance_changed(receiver_id, receiver_balance)
+    return True, sender_balance
+
+async def apply_deltas(deltas, require_non_negative=True):
+    """Applies {user_id: delta} to several balances in one transaction: all of them or none.
+
+    Used to collect wagers from, and pay out to, every player of a game at once. Users
+    without a row start from 0. With require_non_negative, nothing changes if any balance
+    would go below zero. Returns (True, new_balances) on success, or (False, current_balances)
+    when rejected, so callers can tell who was short.
+    """
+    if not deltas:
+        return True, {}
+    if any(user_id in _pending_users for user_id in deltas):
+        await flush_users()
+    async with _acquire("apply_deltas") as conn:
+        try:
+            async with _transaction(conn) as tx:
+                new_balances = await backend.apply_deltas(conn, deltas, require_non_negative)
+                if new_balances is None:
+                    await tx.rollback()
+                    current = await backend.get_balances(conn, list(deltas))
+        except Exception:
+            for user_id in deltas:
+                balance_cache.invalidate(user_id)
+            raise
+
+    if new_balances is None:
+        current = {user_id: current.get(user_id, 0) for user_id in deltas}
+        if not _in_transaction():
+            for user_id, balance in current.items():
+                balance_cache.set(user_id, balance)
+        return False, current
+
+    for user_id, balance in new_balances.items():
+        _balance_changed(user_id, balance)
+    return True, new_balances
 
 # Function to retrieve user balance
 async def get_balance(user_id):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT balance FROM users WHERE user_id = %s", (user_id,))
-            result = await cursor.fetchone()
-            return result[0] if result else 0
+    in_transaction = _in_transaction()
+    cached = None if in_transaction else balance_cache.get(user_id)  # The transaction may have changed it
+    if cached is not None:
+        return cached
+
+    token = balance_cache.begin_read()
+    async with _acquire("get_balance") as conn:
+        balance = await backend.get_balance(conn, user_id) or 0
+
+    if not in_transaction:
+        balance_cache.fill(user_id, balance, token)
+    return balance
+
+async def find_balance(user_id):
+    """Like get_balance, but None when the user has no row at all (never played or chatted)."""
+    token = balance_cache.begin_read()
+    async with _acquire("find_balance") as conn:
+        balance = await backend.get_balance(conn, user_id)
+
+    if balance is not None and not _in_transaction():
+        balance_cache.fill(user_id, balance, token)
+    return balance
+
+async def get_balances(user_ids):
+    """Returns {user_id: balance} for several users; cached ones are free, the rest come from one query."""
+    in_transaction = _in_transaction()
+    balances = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        cached = None if in_transaction else balance_cache.get(user_id)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            balances[user_id] = cached
+    if not missing:
+        return balances
+
+    token = balance_cache.begin_read()
+    async with _acquire("get_balances") as conn:
+        rows = await backend.get_balances(conn, missing)
+
+    for user_id in missing:
+        balances[user_id] = rows.get(user_id, 0)
+        if not in_transaction:
+            balance_cache.fill(user_id, balances[user_id], token)
+    return balances
 
 async def get_last_claim(user_id):
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT DATE(last_claim) FROM users WHERE user_id = %s", (user_id,))
-            result = await cursor.fetchone()
-            return result[0] if result else None  # Returns YYYY-MM-DD or None if never claimed
+    async with _acquire("get_last_claim") as conn:
+        return await backend.get_last_claim(conn, user_id)  # Returns a date, or None if never claimed
 
 async def update_last_claim(user_id):
     now = datetime.datetime.now(datetime.timezone.utc).astimezone(datetime.timezone(datetime.timedelta(hours=-5)))  # Convert to EST
     today = now.date()  # Get YYYY-MM-DD (ignore time)
     
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("UPDATE users SET last_claim = %s WHERE user_id = %s", (today, user_id))
-
-async def save_game_state(players, chambers, winnings, original_wager, shots_survived, gun, current_turn):
-    """Saves the current state of a Russian Roulette game."""
-    players_json = json.dumps(players)
-    gun_json = json.dumps(gun)  # Convert gun state to JSON
-
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("""
-                INSERT INTO russian_roullette_game_sessions (user_id, players, chambers, winnings, original_wager, shots_survived, gun_state, current_turn)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    players = VALUES(players),
-                    chambers = VALUES(chambers),
-                    winnings = VALUES(winnings),
-                    original_wager = VALUES(original_wager),
-                    shots_survived = VALUES(shots_survived),
-                    gun_state = VALUES(gun_state),
-                    current_turn = VALUES(current_turn)
-            """, (players[0], players_json, chambers, winnings, original_wager, shots_survived, gun_json, current_turn))
+    async with _acquire("update_last_claim") as conn:
+        await backend.set_last_claim(conn, user_id, today)
+
+async def claim_daily(user_id, reward, today, streak_bonus=0, streak_cap=0):
+    """Credits the daily reward and records today's claim in one conditional write.
+
+    Two claims racing on the same day can't both apply: the write only matches if the last
+    claim is before today. A claim on the day after the previous one extends the streak,
+    which adds streak_bonus per consecutive day (at most streak_cap of them) in the same write.
+    Returns (amount_credited, streak), or None if today's reward was already claimed.
+    """
+    await ensure_user_written(user_id)
+    async with _acquire("claim_daily") as conn:
+        result = await backend.claim_daily(conn, user_id, today, reward, streak_bonus, streak_cap)
+    if result is None:
+        return None
+    balance, streak = result
+    _balance_changed(user_id, balance)
+    return reward + streak_bonus * min(streak - 1, streak_cap), streak
+
+async def delete_users(user_ids):
+    """Removes users and their inventory (used to clean up after benchmarks)."""
+    async with _acquire("delete_users") as conn:
+        async with _transaction(conn):
+            await backend.delete_users(conn, list(user_ids))
+    for user_id in user_ids:
+        balance_cache.invalidate(user_id)
+        _known_users.pop(user_id, None)
+
+async def get_inventory(user_id):
+    """Returns a user's items as a list of {"item_name", "quantity"}."""
+    async with _acquire("get_inventory") as conn:
+        return await backend.get_inventory(conn, user_id)
+
+async def add_item(user_id, item_name, quantity=1):
+    """Gives a user quantity of an item (negative to take some away) and returns how many they now have."""
+    await ensure_user_written(user_id)
+    async with _acquire("add_item") as conn:
+        return await backend.add_item(conn, user_id, item_name, quantity)
+
+async def save_game_state(players, chambers, winnings, original_wager, shots_survived, gun, current_turn, game_id=None, votes=None, server_id=None):
+    """Saves the current state of a Russian Roulette game.
+
+    game_id is the session key (rr_sessions uses the ID of the interaction that started the
+    game); it defaults to the first player.
+    server_id is the guild the game is played in, so a cluster worker only recovers its own games.
+    """
+    game_id = players[0] if game_id is None else game_id
+    state = {
+        "players": players,
+        "chambers": chambers,
+        "winnings": winnings,
+        "original_wager": original_wager,
+        "shots_survived": shots_survived,
+        "gun_state": gun,
+        "current_turn": current_turn,
+        "votes": votes or [],
+        "server_id": server_id,
+    }
+    async with _acquire("save_game_state") as conn:
+        async with _transaction(conn):
+            await backend.save_session(conn, game_id, state)
+
+async def load_game_states():
+    """Returns every saved Russian Roulette session, used to rebuild live games after a restart."""
+    async with _acquire("load_game_states") as conn:
+        return await backend.load_sessions(conn)
+
+async def delete_game_session(game_id):
+    """Deletes a Russian Roulette game session by its key."""
+    async with _acquire("delete_game_session") as conn:
+        async with _transaction(conn):
+            await backend.delete_sessions(conn, [game_id])
 
 async def get_game_state(user_id):
     """Retrieves the current game state for a given player."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cursor: # Use DictCursor for dictionary results
-            await cursor.execute("SELECT * FROM russian_roullette_game_sessions WHERE JSON_CONTAINS(players, %s)", (json.dumps(user_id),))
-            result = await cursor.fetchone()
-
-            if not result:
-                return None
-
-            # Convert JSON fields back into Python objects
-            # Note: JSON fields might be returned as strings or objects depending on the driver/DB configuration.
-            # aiomysql usually returns strings for JSON columns.
-            
-            try:
-                if isinstance(result["players"], str):
-                    result["players"] = json.loads(result["players"])
-                if isinstance(result["gun_state"], str):
-                    result["gun_state"] = json.loads(result["gun_state"])
-            except json.JSONDecodeError:
-                logger.error(f"Error decoding JSON for game state: {result}")
-                return None
-
-            return result
+    async with _acquire("get_game_state") as conn:
+        session_ids = await backend.session_ids_for_player(conn, user_id)
+        return await backend.get_session(conn, session_ids[0]) if session_ids else None
+
+async def players_in_games(user_ids, skip_server=None):
+    """Returns which of these players are in a saved Russian Roulette game (one connection for all of them).
+
+    Games whose server_id skip_server(server_id) accepts are not counted.
+    """
+    busy = set()
+    async with _acquire("players_in_games") as conn:
+        for user_id in user_ids:
+            for session_id in await backend.session_ids_for_player(conn, user_id):
+                if skip_server is not None:
+                    session = await backend.get_session(conn, session_id)
+                    if session is None or skip_server(session.get("server_id")):
+                        continue
+                busy.add(user_id)
+                break
+    return busy
 
 async def delete_game_state(game_owner_id):
-    """Deletes a Russian Roulette game session using the game creator's ID."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("DELETE FROM russian_roullette_game_sessions WHERE players LIKE %s", (f'%{game_owner_id}%',))
+    """Deletes the Russian Roulette game session(s) the given player is in."""
+    async with _acquire("delete_game_state") as conn:
+        async with _transaction(conn):
+            await backend.delete_sessions(conn, await backend.session_ids_for_player(conn, game_owner_id))
 
 async def add_vote(user_id, voter_id):
     """Adds a vote to split the winnings in Russian Roulette."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            # Get current votes, ensure it's a valid list
-            await cursor.execute("SELECT votes FROM russian_roullette_game_sessions WHERE user_id = %s", (user_id,))
-            result = await cursor.fetchone()
-            votes = json.loads(result[0]) if result and result[0] else []
-
-            if voter_id not in votes:
-                votes.append(voter_id)  # Add vote if not already present
-
-            # Update votes in SQL
-            await cursor.execute("UPDATE russian_roullette_game_sessions SET votes = %s WHERE user_id = %s", (json.dumps(votes), user_id))
+    async with _acquire("add_vote") as conn:
+        session = await backend.get_session(conn, user_id)
+        if session is None:
+            return
+        votes = session.get("votes") or []
+        if voter_id not in votes:
+            votes.append(voter_id)  # Add vote if not already present
+            await backend.update_session(conn, user_id, votes=votes)
 
 async def get_votes(user_id):
     """Retrieves the list of votes for a game session."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT votes FROM russian_roullette_game_sessions WHERE user_id = %s", (user_id,))
-            result = await cursor.fetchone()
-
-            if result is None or result[0] is None:
-                return []  # Ensure we return a valid empty list if NULL
-
-            return json.loads(result[0])
+    async with _acquire("get_votes") as conn:
+        session = await backend.get_session(conn, user_id)
+        return (session.get("votes") or []) if session else []  # Ensure we return a valid empty list if NULL
 
 async def clear_votes(user_id):
     """Clears votes when a game session ends."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("UPDATE russian_roullete_game_sessions SET votes = '[]' WHERE user_id = %s", (user_id,))
+    async with _acquire("clear_votes") as conn:
+        await backend.update_session(conn, user_id, votes=[])
 
 async def create_invitation(creator_id, server_id, invited_users):
     """Creates a game invitation and returns the game_id."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("""
-                INSERT INTO russian_roulette_invitations (creator_id, server_id, invited_users, accepted_users, declined_users)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (creator_id, server_id, json.dumps(invited_users), json.dumps([]), json.dumps([])))  # ✅ Explicit empty lists
-            
-            game_id = cursor.lastrowid  # Get the game ID
-            return game_id
+    async with _acquire("create_invitation") as conn:
+        return await backend.create_invitation(conn, creator_id, server_id, invited_users)
+
+async def _add_to_invitation(name, field, game_id, user_id):
+    async with _acquire(name) as conn:
+        invitation = await backend.get_invitation(conn, game_id)
+        if invitation is not None and user_id not in invitation[field]:
+            await backend.set_invitation_users(conn, game_id, field, invitation[field] + [user_id])
 
 async def accept_invitation(game_id, user_id):
     """Marks a user as having accepted the game invitation."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT accepted_users FROM russian_roulette_invitations WHERE game_id = %s", (game_id,))
-            result = await cursor.fetchone()
-            
-            if result:
-                accepted_users = json.loads(result[0])
-                if user_id not in accepted_users:
-                    accepted_users.append(user_id)
-                    await cursor.execute("UPDATE russian_roulette_invitations SET accepted_users = %s WHERE game_id = %s",
-                                   (json.dumps(accepted_users), game_id))
+    await _add_to_invitation("accept_invitation", "accepted_users", game_id, user_id)
 
 async def decline_invitation(game_id, user_id):
     """Marks a user as having declined the game invitation."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT declined_users FROM russian_roulette_invitations WHERE game_id = %s", (game_id,))
-            result = await cursor.fetchone()
-            
-            if result:
-                declined_users = json.loads(result[0])
-                if user_id not in declined_users:
-                    declined_users.append(user_id)
-                    await cursor.execute("UPDATE russian_roulette_invitations SET declined_users = %s WHERE game_id = %s",
-                                   (json.dumps(declined_users), game_id))
+    await _add_to_invitation("decline_invitation", "declined_users", game_id, user_id)
 
 async def get_accepted_players(game_id):
     """Returns the list of users who accepted the game."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT accepted_users FROM russian_roulette_invitations WHERE game_id = %s", (game_id,))
-            result = await cursor.fetchone()
-            return json.loads(result[0]) if result else []
+    async with _acquire("get_accepted_players") as conn:
+        invitation = await backend.get_invitation(conn, game_id)
+        return invitation["accepted_users"] if invitation else []
 
 async def delete_invitation(game_id):
     """Deletes a game invitation after the game starts or is canceled."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("DELETE FROM russian_roulette_invitations WHERE game_id = %s", (game_id,))
+    async with _acquire("delete_invitation") as conn:
+        await backend.delete_invitation(conn, game_id)
 
 async def is_already_in_game(game_id, user_id):
     """Checks if a user has already joined an ongoing game."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT COUNT(*) FROM russian_roulette_invitations WHERE game_id = %s AND JSON_CONTAINS(accepted_users, %s)", 
-                           (game_id, json.dumps(user_id)))
-            result = await cursor.fetchone()
-            return result[0] > 0
+    async with _acquire("is_already_in_game") as conn:
+        invitation = await backend.get_invitation(conn, game_id)
+        return invitation is not None and user_id in invitation["accepted_users"]
 
 async def add_player_to_game(game_id, user_id):
     """Adds a player to an ongoing game session."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("SELECT accepted_users FROM russian_roulette_invitations WHERE game_id = %s", (game_id,))
-            result = await cursor.fetchone()
-            
-            if result:
-                players = json.loads(result[0]) if result[0] else []
-                if user_id not in players:
-                    players.append(user_id)
-                    await cursor.execute("UPDATE russian_roulette_invitations SET accepted_users = %s WHERE game_id = %s", 
-                                   (json.dumps(players), game_id))
+    await _add_to_invitation("add_player_to_game", "accepted_users", game_id, user_id)
 
 async def update_game_players(user_id, new_players):
     """Updates the players list for a game where the user is present."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute("UPDATE russian_roullette_game_sessions SET players = %s WHERE players LIKE %s", 
-                        (json.dumps(new_players), f'%{user_id}%'))
+    async with _acquire("update_game_players") as conn:
+        async with _transaction(conn):
+            for session_id in await backend.session_ids_for_player(conn, user_id):
+                await backend.update_session(conn, session_id, players=new_players)
+
+
+async def append_ledger(entries):
+    """Writes a batch of coin ledger rows in one transaction (see ledger.py, which batches them)."""
+    async with _acquire("append_ledger", detached=True) as conn:
+        async with _transaction(conn):
+            await backend.append_ledger(conn, entries)
 
 
 async def get_local_leaderboard(server_id, limit=10):
     """Fetches the top users by balance in a specific server."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute("""
-                SELECT user_id, balance FROM users 
-                WHERE server_id = %s 
-                ORDER BY balance DESC 
-                LIMIT %s
-            """, (server_id, limit))
-            result = await cursor.fetchall()
-            return result
+    async with _acquire("get_local_leaderboard") as conn:
+        return await backend.top_balances(conn, server_id, limit)
 
 async def get_global_leaderboard(limit=10):
     """Fetches the top users by balance across all servers."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            await cursor.execute("""
-                SELECT user_id, balance FROM users 
-                ORDER BY balance DESC 
-                LIMIT %s
-            """, (limit,))
-            result = await cursor.fetchall()
-            return result
+    async with _acquire("get_global_leaderboard") as conn:
+        return await backend.top_balances(conn, None, limit)
+
+async def get_usernames(user_ids):
+    """Fetches stored usernames for many users in one query, as {user_id: username}."""
+    if not user_ids:
+        return {}
+    async with _acquire("get_usernames") as conn:
+        return await backend.usernames(conn, user_ids)
+
+async def get_all_balances():
+    """Fetches every user's balance and server, used to build the in-memory rank index."""
+    async with _acquire("get_all_balances") as conn:
+        return await backend.all_balances(conn)
@@ -0,0 +1,56 @@
+import random
+
+# Odds and payouts for the casino games, shared by the live games in
+# casino_games.py and the economy simulator (simulate_economy.py) so a tuning
+# change is simulated exactly as it will be played. Payouts are the total
+# returned on a win, stake included.
+
+# Daily reward (/daily), the economy's only source of new coins besides winnings.
+# Claiming on consecutive days adds DAILY_STREAK_BONUS per day of streak, for up to
+# DAILY_STREAK_CAP days.
+DAILY_REWARD = 100
+DAILY_STREAK_BONUS = 10
+DAILY_STREAK_CAP = 7
+
+
+def daily_reward(streak: int) -> int:
+    return DAILY_REWARD + DAILY_STREAK_BONUS * min(streak - 1, DAILY_STREAK_CAP)
+
+# Coinflip
+COINFLIP_PAYOUT = 2
+
+# Roulette (American wheel: 0, 00 and 1-36)
+ROULETTE_WHEEL = [str(i) for i in range(37)] + ["00"]
+ROULETTE_RED_NUMBERS = frozenset({1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36})
+ROULETTE_COLOR_PAYOUT = 2  # red or black, 1:1
+ROULETTE_GREEN_PAYOUT = 18  # 0 or 00, 17:1
+ROULETTE_NUMBER_PAYOUT = 36  # a single number, 35:1
+
+
+def roulette_color(number: str) -> str:
+    if number in ("0", "00"):
+        return "green"
+    return "red" if int(number) in ROULETTE_RED_NUMBERS else "black"
+
+
+# Crash: 5% of games crash instantly at 1.00x; the rest crash at a Gamma(2.5, 1)
+# draw (mode near 1.5, mean 2.5) clamped to [1.1, 25]. The on-screen multiplier
+# grows as exp(CRASH_RATE * seconds).
+CRASH_INSTANT_CHANCE = 0.05
+CRASH_GAMMA_SHAPE = 2.5
+CRASH_GAMMA_SCALE = 1.0
+CRASH_MIN_MULTIPLIER = 1.1
+CRASH_MAX_MULTIPLIER = 25.0
+CRASH_RATE = 0.1
+
+
+def crash_point(rng=random) -> float:
+    if rng.random() < CRASH_INSTANT_CHANCE:
+        return 1.0
+    multiplier = rng.gammavariate(CRASH_GAMMA_SHAPE, CRASH_GAMMA_SCALE)
+    return min(CRASH_MAX_MULTIPLIER, max(CRASH_MIN_MULTIPLIER, multiplier))
+
+
+# Russian Roulette solo: each survived shot multiplies the pot (rounded to whole
+# coins) by the factor for the chosen number of chambers.
+RR_CHAMBER_MULTIPLIERS = {2: 2.0, 3: 1.5, 4: 1.333, 5: 1.25, 6: 1.2, 7: 1.166, 8: 1.125}
@@ -0,0 +1,468 @@
+import asyncio
+import bisect
+import logging
+import os
+import time
+from collections import OrderedDict
+import database
+
+logger = logging.getLogger(__name__)
+
+# Top-K leaderboard cache. Each board holds the exact top `depth` users of a server
+# (or globally) as of its last rebuild, and is kept current from the balance write
+# path. Everyone outside a board is known to be at or below its lowest entry, so a
+# write either updates the board in place, pushes someone out, or (when a board
+# member drops below that floor) shrinks it; a board too small to serve a request
+# is rebuilt. Every board is also rebuilt on an interval in case of writes the bot
+# never saw.
+LEADERBOARD_DEPTH = int(os.getenv('LEADERBOARD_DEPTH', '25'))  # entries kept per board (> the 10 shown, to absorb drops)
+LEADERBOARD_REBUILD_INTERVAL = float(os.getenv('LEADERBOARD_REBUILD_INTERVAL', '300'))  # seconds
+LEADERBOARD_IDLE_TIMEOUT = float(os.getenv('LEADERBOARD_IDLE_TIMEOUT', '3600'))  # boards not viewed this long are dropped
+# Names come from the users table (rebuilds carry them along), so a page is one query or none
+LEADERBOARD_NAME_TTL = float(os.getenv('LEADERBOARD_NAME_TTL', '900'))  # seconds; longer than the rebuild interval
+LEADERBOARD_NAME_CACHE_SIZE = int(os.getenv('LEADERBOARD_NAME_CACHE_SIZE', '10000'))
+
+GLOBAL = None  # Board key for the global leaderboard
+
+
+class _Board:
+    def __init__(self, depth):
+        self.depth = depth
+        self.entries: dict[int, int] = {}  # user_id -> balance
+        self.complete = False  # True when the board holds every user in its scope
+        self.built_at = 0.0
+        self.rebuild_seconds = 0.0
+        self.last_read = time.monotonic()
+
+    def load(self, rows):
+        self.entries = {row["user_id"]: row["balance"] for row in rows}
+        self.complete = len(rows) < self.depth
+
+    def apply(self, user_id, balance):
+        if user_id in self.entries:
+            self.entries[user_id] = balance
+            if not self.complete and balance < self._floor(excluding=user_id):
+                # Someone outside the board may now rank above them; drop them rather than guess
+                del self.entries[user_id]
+            return
+
+        if self.complete or (self.entries and balance > self._floor()):
+            self.entries[user_id] = balance
+            if len(self.entries) > self.depth:
+                lowest = min(self.entries, key=self.entries.get)
+                del self.entries[lowest]
+                self.complete = False
+
+    def top(self, limit):
+        ranked = sorted(self.entries.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"user_id": user_id, "balance": balance} for user_id, balance in ranked]
+
+    def can_serve(self, limit):
+        return self.complete or len(self.entries) >= limit
+
+    def _floor(self, excluding=None):
+        balances = [balance for user_id, balance in self.entries.items() if user_id != excluding]
+        return min(balances) if balances else float("-inf")
+
+
+class UsernameCache:
+    """Usernames for leaderboard rows, kept for `ttl` seconds (at most `maxsize`, least recently used out first)."""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._names: OrderedDict = OrderedDict()  # user_id -> (username, expires at)
+        self.queries = 0
+
+    def get(self, user_id):
+        entry = self._names.get(user_id)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._names[user_id]
+            return None
+        self._names.move_to_end(user_id)
+        return entry[0]
+
+    def put(self, user_id, username):
+        if username is None:
+            return
+        self._names[user_id] = (username, time.monotonic() + self.ttl)
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+
+    def update(self, rows):
+        for row in rows:
+            self.put(row["user_id"], row.get("username"))
+
+    async def fill(self, rows):
+        """Sets row["username"] on every row: this process's own registrations first, then the
+        cache, then one query for the rest. Users with no stored name get None."""
+        missing = []
+        for row in rows:
+            name = database.known_username(row["user_id"]) or self.get(row["user_id"])
+            row["username"] = name
+            if name is None:
+                missing.append(row["user_id"])
+        if missing:
+            self.queries += 1
+            stored = await database.get_usernames(missing)
+            for row in rows:
+                if row["username"] is None and row["user_id"] in stored:
+                    row["username"] = stored[row["user_id"]]
+                    self.put(row["user_id"], row["username"])
+        return rows
+
+
+class LeaderboardCache:
+    def __init__(self, depth, rebuild_interval, idle_timeout):
+        self.depth = depth
+        self.rebuild_interval = rebuild_interval
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self._boards: dict = {}  # server_id (or GLOBAL) -> _Board
+        self._rebuilding: dict = {}  # server_id (or GLOBAL) -> in-flight rebuild task
+        self._pending: dict = {}  # server_id (or GLOBAL) -> writes seen while its rebuild query is in flight
+        self._task = None
+
+    async def get(self, server_id=GLOBAL, limit=10):
+        """Returns the top `limit` users as [{"user_id", "balance"}], from memory when possible."""
+        board = self._boards.get(server_id)
+        now = time.monotonic()
+        if board is None or not board.can_serve(limit) or now - board.built_at > self.rebuild_interval:
+            self.misses += 1
+            board = await self._rebuild(server_id)
+        else:
+            self.hits += 1
+        board.last_read = now
+        self._ensure_rebuilder()
+        return board.top(limit)
+
+    def on_balance_change(self, user_id, balance):
+        """Balance listener: keeps the global board and the user's server board current.
+
+        The registry only knows servers of users this process has seen, so the rank
+        index is asked next (it has every user with a row). A server board that
+        already lists the user is updated either way (e.g. a write from another worker).
+        """
+        server_id = database.known_server(user_id) or rankings._server_of.get(user_id)
+        scopes = (GLOBAL,) if server_id is None else (GLOBAL, server_id)
+        for key, board in self._boards.items():
+            if key in scopes or user_id in board.entries:
+                board.apply(user_id, balance)
+        for key in scopes:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.append((user_id, balance))
+
+    def invalidate(self, server_id=GLOBAL, everything=False):
+        """Forces the next read of a board (or of every board) to go to the database."""
+        if everything:
+            self._boards.clear()
+        else:
+            self._boards.pop(server_id, None)
+
+    def stats(self):
+        now = time.monotonic()
+        boards = list(self._boards.values())
+        lookups = self.hits + self.misses
+        return {
+            "boards": len(boards),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "rebuilds": self.rebuilds,
+            "max_staleness_seconds": max((now - board.built_at for board in boards), default=0.0),
+            "last_rebuild_seconds": max((board.rebuild_seconds for board in boards), default=0.0),
+        }
+
+    async def _rebuild(self, server_id):
+        # Concurrent readers of the same board share one query
+        task = self._rebuilding.get(server_id)
+        if task is None:
+            task = asyncio.create_task(self._load(server_id))
+            self._rebuilding[server_id] = task
+            task.add_done_callback(lambda _: self._rebuilding.pop(server_id, None))
+        return await task
+
+    async def _load(self, server_id):
+        self._pending[server_id] = []
+        started = time.perf_counter()
+        try:
+            if server_id is GLOBAL:
+                rows = await database.get_global_leaderboard(limit=self.depth)
+            else:
+                rows = await database.get_local_leaderboard(server_id, limit=self.depth)
+
+            usernames.update(rows)
+            board = _Board(self.depth)
+            board.load(rows)
+            # Replay writes that raced the query; balances are absolute, so replaying one it already saw is harmless
+            for user_id, balance in self._pending[server_id]:
+                board.apply(user_id, balance)
+        finally:
+            self._pending.pop(server_id, None)
+
+        board.built_at = time.monotonic()
+        board.rebuild_seconds = time.perf_counter() - started
+        previous = self._boards.get(server_id)
+        if previous is not None:
+            board.last_read = previous.last_read
+        self._boards[server_id] = board
+        self.rebuilds += 1
+        return board
+
+    async def _rebuild_loop(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            now = time.monotonic()
+            for server_id, board in list(self._boards.items()):
+                if now - board.last_read > self.idle_timeout:
+                    self._boards.pop(server_id, None)
+                    continue
+                try:
+                    await self._rebuild(server_id)
+                except Exception as e:
+                    logger.error(f"Leaderboard rebuild failed for {server_id or 'global'}: {e}")
+
+    def _ensure_rebuilder(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._rebuild_loop())
+
+
+class RankIndex:
+    """Order-statistic set of users sorted by balance (highest first), for ranks and pages in O(log n).
+
+    Keys are (-balance, user_id) kept in sorted buckets of about _LOAD keys, with a
+    Fenwick tree over the bucket sizes so a key's position (and the key at a
+    position) is found without walking the buckets.
+    """
+
+    _LOAD = 256
+
+    def __init__(self):
+        self._buckets: list[list] = []
+        self._maxes: list = []  # Last key of each bucket
+        self._tree: list[int] = [0]  # Fenwick tree over bucket sizes, 1-indexed
+        self._keys: dict[int, tuple] = {}  # user_id -> key currently stored
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, user_id):
+        return user_id in self._keys
+
+    def load(self, balances):
+        """Replaces the contents with an iterable of (user_id, balance)."""
+        self._keys = {user_id: (-balance, user_id) for user_id, balance in balances}
+        ordered = sorted(self._keys.values())
+        self._buckets = [ordered[i:i + self._LOAD] for i in range(0, len(ordered), self._LOAD)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._build_tree()
+
+    def set(self, user_id, balance):
+        key = (-balance, user_id)
+        old = self._keys.get(user_id)
+        if old == key:
+            return
+        if old is not None:
+            self._remove(old)
+        self._insert(key)
+        self._keys[user_id] = key
+
+    def discard(self, user_id):
+        old = self._keys.pop(user_id, None)
+        if old is not None:
+            self._remove(old)
+
+    def balance(self, user_id):
+        key = self._keys.get(user_id)
+        return -key[0] if key else None
+
+    def rank(self, user_id):
+        """1-based position of a user, or None if they aren't indexed."""
+        key = self._keys.get(user_id)
+        if key is None:
+            return None
+        i = bisect.bisect_left(self._maxes, key)
+        return self._prefix(i) + bisect.bisect_left(self._buckets[i], key) + 1
+
+    def slice(self, start, count):
+        """Returns up to count (user_id, balance) pairs starting at 0-based position start."""
+        if start < 0 or start >= len(self._keys) or count <= 0:
+            return []
+        i, offset = self._locate(start)
+        result = []
+        while i < len(self._buckets) and len(result) < count:
+            for balance, user_id in self._buckets[i][offset:offset + count - len(result)]:
+                result.append((user_id, -balance))
+            i += 1
+            offset = 0
+        return result
+
+    def _insert(self, key):
+        if not self._buckets:
+            self._buckets = [[key]]
+            self._maxes = [key]
+            self._build_tree()
+            return
+
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            i -= 1
+            self._buckets[i].append(key)
+            self._maxes[i] = key
+        else:
+            bisect.insort(self._buckets[i], key)
+        self._add(i, 1)
+
+        bucket = self._buckets[i]
+        if len(bucket) > 2 * self._LOAD:
+            self._buckets.insert(i + 1, bucket[self._LOAD:])
+            del bucket[self._LOAD:]
+            self._maxes[i] = bucket[-1]
+            self._maxes.insert(i + 1, self._buckets[i + 1][-1])
+            self._build_tree()
+
+    def _remove(self, key):
+        i = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._add(i, -1)
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+            self._build_tree()
+
+    def _build_tree(self):
+        n = len(self._buckets)
+        tree = [0] * (n + 1)
+        for i, bucket in enumerate(self._buckets, start=1):
+            tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add(self, i, delta):
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i):
+        """Number of keys in the first i buckets."""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position):
+        """Maps a 0-based position to (bucket index, offset within bucket)."""
+        i = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = i + step
+            if nxt < len(self._tree) and self._tree[nxt] <= position:
+                i = nxt
+                position -= self._tree[nxt]
+            step >>= 1
+        return i, position
+
+
+class Rankings:
+    """Global and per-server RankIndexes, loaded once from the users table and kept current by balance writes."""
+
+    def __init__(self):
+        self.global_index = RankIndex()
+        self._servers: dict[int, RankIndex] = {}
+        self._server_of: dict[int, int] = {}  # user_id -> server_id they're ranked under
+        self._pending: list | None = None  # Writes seen while the initial load query is in flight
+        self._load_task = None
+        self.loaded = False
+        self.load_seconds = 0.0
+
+    async def ensure_loaded(self):
+        """Loads the index on first use; concurrent callers share the one load."""
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load())
+        try:
+            await self._load_task
+        except Exception:
+            self._load_task = None  # Let the next caller retry
+            raise
+
+    def on_balance_change(self, user_id, balance):
+        """Balance listener."""
+        if self._pending is not None:
+            self._pending.append((user_id, balance))
+        if self.loaded:
+            self.set(user_id, balance)
+
+    def set(self, user_id, balance, server_id=None):
+        server_id = server_id or database.known_server(user_id) or self._server_of.get(user_id)
+        self.global_index.set(user_id, balance)
+        if server_id is None:
+            return
+
+        previous = self._server_of.get(user_id)
+        if previous is not None and previous != server_id:
+            self._servers[previous].discard(user_id)
+        self._server_of[user_id] = server_id
+        self._servers.setdefault(server_id, RankIndex()).set(user_id, balance)
+
+    def index(self, server_id=GLOBAL):
+        if server_id is GLOBAL:
+            return self.global_index
+        return self._servers.get(server_id) or RankIndex()
+
+    def rank(self, user_id, server_id=GLOBAL):
+        """Returns (rank, total) for a user, or None if they aren't ranked there."""
+        index = self.index(server_id)
+        position = index.rank(user_id)
+        return (position, len(index)) if position is not None else None
+
+    def page(self, page, per_page=10, server_id=GLOBAL):
+        """Returns one page (1-based) of the ranking as [{"user_id", "balance"}]."""
+        rows = self.index(server_id).slice((page - 1) * per_page, per_page)
+        return [{"user_id": user_id, "balance": balance} for user_id, balance in rows]
+
+    async def _load(self):
+        started = time.perf_counter()
+        self._pending = []
+        try:
+            rows = await database.get_all_balances()
+            self.global_index.load((row["user_id"], row["balance"]) for row in rows)
+            by_server: dict[int, list] = {}
+            for row in rows:
+                if row["server_id"] is not None:
+                    by_server.setdefault(row["server_id"], []).append((row["user_id"], row["balance"]))
+                    self._server_of[row["user_id"]] = row["server_id"]
+            for server_id, balances in by_server.items():
+                index = RankIndex()
+                index.load(balances)
+                self._servers[server_id] = index
+
+            self.loaded = True
+            for user_id, balance in self._pending:
+                self.set(user_id, balance)
+        finally:
+            self._pending = None
+
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"Rank index loaded {len(self.global_index)} users across {len(self._servers)} servers in {self.load_seconds:.2f}s.")
+
+
+usernames = UsernameCache(LEADERBOARD_NAME_TTL, LEADERBOARD_NAME_CACHE_SIZE)
+
+cache = LeaderboardCache(LEADERBOARD_DEPTH, LEADERBOARD_REBUILD_INTERVAL, LEADERBOARD_IDLE_TIMEOUT)
+database.add_balance_listener(cache.on_balance_change)
+
+rankings = Rankings()
+database.add_balance_listener(rankings.on_balance_change)
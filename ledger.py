@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import logging
+import os
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Append-only coin ledger: one coin_ledger row per balance change the bot makes
+# (user, delta, reason, game, ref_id, time). Recording is a list append; a single
+# background writer drains the buffer in multi-row INSERTs (group commit), so a
+# bet never waits on its ledger row. The buffer is bounded: if the database stays
+# down long enough to fill it, new entries are dropped and counted rather than
+# holding up games. close() writes whatever is left on shutdown.
+LEDGER_BATCH = int(os.getenv('LEDGER_BATCH', '500'))  # rows per INSERT
+LEDGER_FLUSH_INTERVAL = float(os.getenv('LEDGER_FLUSH_INTERVAL', '1'))  # seconds between writes when not full
+LEDGER_MAX_PENDING = int(os.getenv('LEDGER_MAX_PENDING', '50000'))  # entries held in memory at most
+
+# Reasons
+BET = "bet"
+PAYOUT = "payout"
+DAILY = "daily"
+TRANSFER = "transfer"
+ADMIN = "admin"
+REFUND = "refund"
+
+
+class LedgerWriter:
+    def __init__(self, batch=LEDGER_BATCH, interval=LEDGER_FLUSH_INTERVAL, max_pending=LEDGER_MAX_PENDING):
+        self.batch = batch
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: list[tuple] = []  # Oldest first; rows leave only once written
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._closing = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id, delta, reason, game=None, ref_id=None):
+        """Queues one ledger row. Never blocks; zero deltas aren't recorded."""
+        if not delta:
+            return
+        if len(self._pending) >= self.max_pending:
+            if not metrics.ledger_entries.value(status="dropped"):
+                logger.error(f"Coin ledger buffer is full ({self.max_pending} entries); dropping new entries until it drains.")
+            metrics.ledger_entries.inc(status="dropped")
+            return
+        created_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        self._pending.append((user_id, delta, reason, game, ref_id, created_at))
+        if len(self._pending) >= self.batch:
+            self._wakeup.set()
+        self._ensure_writer()
+
+    def record_many(self, deltas, reason, game=None, ref_id=None):
+        """Queues one row per {user_id: delta}, e.g. after database.apply_deltas."""
+        for user_id, delta in deltas.items():
+            self.record(user_id, delta, reason, game, ref_id)
+
+    async def flush(self):
+        """Writes everything buffered so far. Returns False if a write failed (the rows stay queued)."""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch]
+                try:
+                    await database.append_ledger(batch)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(batch)} coin ledger entries ({len(self._pending)} queued): {e}")
+                    return False
+                del self._pending[:len(batch)]
+                metrics.ledger_entries.inc(len(batch), status="written")
+        return True
+
+    async def close(self):
+        """Stops the writer and writes what's left."""
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if not await self.flush():
+            logger.error(f"{len(self._pending)} coin ledger entries could not be written before shutdown.")
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not await self.flush() and not self._closing:
+                await asyncio.sleep(self.interval)  # Database trouble; don't spin on it
+
+    def _ensure_writer(self):
+        if not self._closing and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+
+writer = LedgerWriter()
+record = writer.record
+record_many = writer.record_many
+metrics.ledger_pending.set_function(lambda: len(writer))
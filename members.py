@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# Member cache policy. With the members intent, discord.py caches every member of
+# every guild by default (and chunks each guild on join to fill that cache), which
+# is most of the bot's memory on large servers. Slash commands don't need it: the
+# interaction carries the invoking member and any member options. Names the
+# database doesn't have (leaderboard users who never registered a username) are
+# resolved here, lazily and in batches, into a small LRU of display names.
+MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'none')  # "none", "all", or MemberCacheFlags names, e.g. "voice,joined"
+CHUNK_GUILDS = os.getenv('CHUNK_GUILDS', '').lower() in ('1', 'true', 'yes')  # Download full member lists on join
+MEMBER_NAME_CACHE_SIZE = int(os.getenv('MEMBER_NAME_CACHE_SIZE', '5000'))  # display names kept in the LRU
+QUERY_BATCH = 100  # Discord's limit of user IDs per member request
+FETCH_CONCURRENCY = 5  # parallel REST lookups for users outside the guild
+LOOKUP_TIMEOUT = float(os.getenv('MEMBER_LOOKUP_TIMEOUT', '2'))  # seconds; interactions must be answered within 3
+
+
+def cache_flags(policy=MEMBER_CACHE):
+    """MemberCacheFlags for a MEMBER_CACHE setting."""
+    policy = policy.strip().lower()
+    if policy == "all":
+        return discord.MemberCacheFlags.all()
+    flags = discord.MemberCacheFlags.none()
+    for name in filter(None, (part.strip() for part in policy.split(","))):
+        if name == "none":
+            continue
+        if name not in discord.MemberCacheFlags.VALID_FLAGS:
+            raise ValueError(f"Unknown MEMBER_CACHE flag {name!r} (expected one of {', '.join(discord.MemberCacheFlags.VALID_FLAGS)})")
+        setattr(flags, name, True)
+    return flags
+
+
+class MemberResolver:
+    """Display names for user IDs, looked up on demand and kept in an LRU.
+
+    Names are cached per guild (nicknames differ between servers) and globally
+    (for users the current guild doesn't have). Cache misses for one guild go out
+    as a single member request per QUERY_BATCH IDs instead of one call per user.
+    """
+
+    def __init__(self, maxsize=MEMBER_NAME_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._names: OrderedDict = OrderedDict()  # (guild_id or None, user_id) -> display name
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        name = self._names.get(key)
+        if name is not None:
+            self._names.move_to_end(key)
+        return name
+
+    def _put(self, key, name):
+        self._names[key] = name
+        self._names.move_to_end(key)
+        while len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+
+    def remember(self, member):
+        """Caches a member or user the bot already has in hand (e.g. from an interaction)."""
+        guild = getattr(member, "guild", None)
+        self._put((guild.id if guild else None, member.id), member.display_name)
+
+    async def resolve(self, user_ids, guild=None, bot=None, timeout=LOOKUP_TIMEOUT):
+        """Returns {user_id: display name} for the IDs that could be resolved.
+
+        Looks in the LRU, then the client's own caches, then asks Discord: one batched
+        member request for the guild, and (when bot is given) a REST fetch for anyone
+        left who isn't in it. Whatever Discord hasn't answered within timeout is left out.
+        """
+        guild_id = guild.id if guild else None
+        names, missing = {}, []
+        for user_id in dict.fromkeys(user_ids):
+            name = self._get((guild_id, user_id)) or self._get((None, user_id))
+            if name is None and guild is not None and (member := guild.get_member(user_id)) is not None:
+                name = member.display_name
+                self._put((guild_id, user_id), name)
+            if name is None and bot is not None and (user := bot.get_user(user_id)) is not None:
+                name = user.display_name
+                self._put((None, user_id), name)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+        self.hits += len(names)
+        self.misses += len(missing)
+        if missing:
+            try:
+                await asyncio.wait_for(self._lookup(missing, names, guild, bot), timeout)
+            except asyncio.TimeoutError:
+                unresolved = sum(1 for user_id in missing if user_id not in names)
+                logger.warning(f"Member lookup timed out after {timeout}s with {unresolved} of {len(missing)} names unresolved")
+        return names
+
+    async def _lookup(self, missing, names, guild, bot):
+        """Fills names in place, so a timeout keeps whatever already arrived."""
+        guild_id = guild.id if guild else None
+        if guild is not None:
+            for start in range(0, len(missing), QUERY_BATCH):
+                batch = missing[start:start + QUERY_BATCH]
+                try:
+                    # cache=False: the members go into the LRU as names, not into the guild's member cache
+                    found = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+                except (asyncio.TimeoutError, discord.HTTPException, discord.ClientException) as e:
+                    logger.warning(f"Member lookup in guild {guild_id} failed: {e}")
+                    continue
+                for member in found:
+                    names[member.id] = member.display_name
+                    self._put((guild_id, member.id), member.display_name)
+            missing = [user_id for user_id in missing if user_id not in names]
+
+        if missing and bot is not None:
+            semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+            async def fetch(user_id):
+                async with semaphore:
+                    try:
+                        user = await bot.fetch_user(user_id)
+                    except discord.HTTPException:
+                        return
+                names[user.id] = user.display_name
+                self._put((None, user.id), user.display_name)
+
+            await asyncio.gather(*(fetch(user_id) for user_id in missing))
+
+    def stats(self):
+        return {"size": len(self._names), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+resolver = MemberResolver()
+
+
+def name_or_mention(names, user_id):
+    """The resolved name, or a mention when the user couldn't be resolved."""
+    return names.get(user_id) or f"<@{user_id}>"
@@ -0,0 +1,222 @@
+import logging
+import os
+import time
+
+import discord
+from discord import app_commands
+
+logger = logging.getLogger(__name__)
+
+# In-process metrics, served in the Prometheus text format from a small local
+# HTTP endpoint. Recording is a dict update on the event loop, so it is cheap
+# enough for every command, game and query.
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # 0 disables the endpoint
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        return []
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """A value set directly, or read from a callback when scraped (set_function)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+        self._functions: dict[tuple, object] = {}
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        self._functions[self._key(labels)] = function
+
+    def _samples(self):
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.error(f"Gauge {self.name} callback failed: {e}")
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: dict[tuple, list] = {}  # label values -> [per-bucket counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, key, extra=[("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+command_latency = registry.register(Histogram(
+    "kui_command_latency_seconds", "Time spent handling a slash command.", labels=("command", "status")))
+game_rounds = registry.register(Counter(
+    "kui_game_rounds_total", "Finished games by outcome.", labels=("game", "outcome")))
+coins_wagered = registry.register(Counter(
+    "kui_game_coins_wagered_total", "Coins wagered on finished games.", labels=("game",)))
+coins_paid = registry.register(Counter(
+    "kui_game_coins_paid_total", "Coins paid out by finished games (stake included).", labels=("game",)))
+db_query_latency = registry.register(Histogram(
+    "kui_db_query_seconds", "Time a database function held its connection.", labels=("function",), buckets=QUERY_BUCKETS))
+active_games = registry.register(Gauge(
+    "kui_active_game_views", "Games currently running with live buttons.", labels=("game",)))
+ledger_entries = registry.register(Counter(
+    "kui_ledger_entries_total", "Coin ledger entries by fate (written, or dropped because the buffer was full).", labels=("status",)))
+ledger_pending = registry.register(Gauge(
+    "kui_ledger_pending_entries", "Coin ledger entries waiting to be written."))
+shard_events = registry.register(Counter(
+    "kui_shard_events_total", "Gateway events dispatched, by the shard of their guild.", labels=("shard",)))
+shard_latency = registry.register(Gauge(
+    "kui_shard_latency_seconds", "Gateway heartbeat latency per shard, as of the last shard report.", labels=("shard",)))
+
+
+def record_game(game, outcome, wagered, paid):
+    """Counts a finished game. wagered and paid are totals across every player in it."""
+    game_rounds.inc(game=game, outcome=outcome)
+    coins_wagered.inc(wagered, game=game)
+    coins_paid.inc(paid, game=game)
+
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """Command tree that times every slash command into command_latency."""
+
+    async def _call(self, interaction: discord.Interaction):
+        started = time.perf_counter()
+        try:
+            await super()._call(interaction)
+        finally:
+            command = interaction.command
+            name = command.qualified_name if command is not None else "unknown"
+            command_latency.observe(time.perf_counter() - started, command=name, status=self._status(interaction))
+
+    def _status(self, interaction: discord.Interaction):
+        """The status label for a handled interaction."""
+        return "error" if interaction.command_failed else "ok"
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serves GET /metrics. Returns the runner (pass it to stop_server), or None when disabled."""
+    if not port:
+        return None
+    from aiohttp import web  # discord.py already depends on aiohttp
+
+    async def handle(request):
+        return web.Response(body=registry.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
+
+
+async def stop_server(runner):
+    if runner is not None:
+        await runner.cleanup()
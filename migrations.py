@@ -0,0 +1,235 @@
+import aiomysql
+import json
+import logging
+import database
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema migrations. Each migration runs once, in order, and is recorded
+# in schema_version. Steps are SQL strings or async functions taking a cursor, and
+# are written to be safe on databases that already have some of the schema (the
+# Russian Roulette tables were originally created by hand in Workbench).
+
+
+async def _create_index(cursor, table, name, columns):
+    """CREATE INDEX unless it already exists (MySQL has no CREATE INDEX IF NOT EXISTS)."""
+    await cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, name))
+    (exists,) = await cursor.fetchone()
+    if not exists:
+        await cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+        logger.info(f"Created index {name} on {table} ({columns}).")
+
+
+def _index(table, name, columns):
+    async def step(cursor):
+        await _create_index(cursor, table, name, columns)
+    return step
+
+
+async def _add_column(cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless it already exists (MySQL has no ADD COLUMN IF NOT EXISTS)."""
+    await cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    (exists,) = await cursor.fetchone()
+    if not exists:
+        await cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"Added column {column} to {table}.")
+
+
+def _column(table, column, definition):
+    async def step(cursor):
+        await _add_column(cursor, table, column, definition)
+    return step
+
+
+async def _backfill_session_players(cursor):
+    """Fills the membership table from the players JSON of sessions saved before it existed."""
+    await cursor.execute("""
+        SELECT s.user_id, s.players FROM russian_roullette_game_sessions s
+        LEFT JOIN russian_roulette_session_players p ON p.session_id = s.user_id
+        WHERE p.session_id IS NULL
+    """)
+    rows = await cursor.fetchall()
+
+    memberships = []
+    for session_id, players in rows:
+        try:
+            players = json.loads(players) if isinstance(players, str) else players
+        except json.JSONDecodeError:
+            logger.error(f"Skipping backfill for session {session_id}: undecodable players {players!r}")
+            continue
+        memberships.extend((session_id, user_id, seat) for seat, user_id in enumerate(players or []))
+
+    if memberships:
+        await cursor.executemany(
+            "INSERT IGNORE INTO russian_roulette_session_players (session_id, user_id, seat) VALUES (%s, %s, %s)",
+            memberships
+        )
+        logger.info(f"Backfilled {len(memberships)} Russian Roulette session memberships.")
+
+
+MIGRATIONS = [
+    (1, "users and inventory", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            server_id BIGINT,
+            balance INT DEFAULT 0,
+            last_claim DATE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id BIGINT,
+            item_name VARCHAR(255),
+            quantity INT DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+        """,
+    ]),
+    (2, "russian roulette sessions and invitations", [
+        """
+        CREATE TABLE IF NOT EXISTS russian_roullette_game_sessions (
+            user_id BIGINT PRIMARY KEY,
+            players JSON,
+            chambers INT,
+            winnings INT,
+            original_wager INT,
+            shots_survived INT DEFAULT 0,
+            gun_state JSON,
+            current_turn INT DEFAULT 0,
+            votes JSON
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS russian_roulette_invitations (
+            game_id INT AUTO_INCREMENT PRIMARY KEY,
+            creator_id BIGINT,
+            server_id BIGINT,
+            invited_users JSON,
+            accepted_users JSON,
+            declined_users JSON
+        )
+        """,
+    ]),
+    (3, "russian roulette session membership", [
+        """
+        CREATE TABLE IF NOT EXISTS russian_roulette_session_players (
+            session_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            seat INT NOT NULL,
+            PRIMARY KEY (session_id, user_id),
+            INDEX idx_session_players_user (user_id)
+        )
+        """,
+        _backfill_session_players,
+    ]),
+    (4, "indexes for leaderboards and daily claims", [
+        _index("users", "idx_users_server_balance", "server_id, balance"),
+        _index("users", "idx_users_balance", "balance"),
+        _index("users", "idx_users_last_claim", "last_claim"),
+        _index("russian_roulette_invitations", "idx_invitations_creator", "creator_id"),
+    ]),
+    (5, "daily claim streaks", [
+        _column("users", "daily_streak", "INT NOT NULL DEFAULT 0"),
+    ]),
+    (6, "russian roulette session servers", [
+        _column("russian_roullette_game_sessions", "server_id", "BIGINT NULL"),
+    ]),
+    (7, "coin ledger", [
+        """
+        CREATE TABLE IF NOT EXISTS coin_ledger (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            delta BIGINT NOT NULL,
+            reason VARCHAR(32) NOT NULL,
+            game VARCHAR(32) NULL,
+            ref_id BIGINT NULL,
+            created_at DATETIME(6) NOT NULL,
+            INDEX idx_ledger_user_time (user_id, created_at),
+            INDEX idx_ledger_ref (ref_id)
+        )
+        """,
+    ]),
+]
+
+# Queries the bot runs constantly, with placeholder arguments, for the EXPLAIN check
+HOT_QUERIES = [
+    ("get_balance", "SELECT balance FROM users WHERE user_id = %s", (0,)),
+    ("try_debit", "SELECT balance FROM users WHERE user_id = %s AND balance >= %s", (0, 0)),
+    ("get_local_leaderboard", "SELECT user_id, balance FROM users WHERE server_id = %s ORDER BY balance DESC LIMIT 10", (0,)),
+    ("get_global_leaderboard", "SELECT user_id, balance FROM users ORDER BY balance DESC LIMIT 10", ()),
+    ("get_game_state", """
+        SELECT s.* FROM russian_roulette_session_players p
+        JOIN russian_roullette_game_sessions s ON s.user_id = p.session_id
+        WHERE p.user_id = %s LIMIT 1
+    """, (0,)),
+    ("delete_game_state", "SELECT session_id FROM russian_roulette_session_players WHERE user_id = %s", (0,)),
+    ("get_accepted_players", "SELECT accepted_users FROM russian_roulette_invitations WHERE game_id = %s", (0,)),
+]
+
+
+async def migrate():
+    """Applies every migration newer than the recorded schema version."""
+    async with database._acquire("migrate") as conn:
+        async with conn.cursor() as cursor:
+            # Serialize startups (e.g. several cluster workers) so each migration runs once
+            await cursor.execute("SELECT GET_LOCK('kui_schema_migrations', 60)")
+            (locked,) = await cursor.fetchone()
+            if not locked:
+                raise RuntimeError("Timed out waiting for another process to finish schema migrations")
+            try:
+                await cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INT PRIMARY KEY,
+                        description VARCHAR(255),
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                await cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                (current,) = await cursor.fetchone()
+
+                for version, description, steps in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    logger.info(f"Applying schema migration {version}: {description}")
+                    for step in steps:
+                        if callable(step):
+                            await step(cursor)
+                        else:
+                            await cursor.execute(step)
+                    await cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)", (version, description))
+                    current = version
+                logger.info(f"Schema is at version {current}.")
+            finally:
+                await cursor.execute("SELECT RELEASE_LOCK('kui_schema_migrations')")
+                await cursor.fetchone()
+
+
+async def verify_indexes():
+    """EXPLAINs the hot queries and warns about any that would scan a whole table. Returns the offenders."""
+    problems = []
+    async with database._acquire("verify_indexes") as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            for name, query, params in HOT_QUERIES:
+                await cursor.execute("EXPLAIN " + query, params)
+                for row in await cursor.fetchall():
+                    extra = row.get("Extra") or ""
+                    # A full scan with no usable index is a schema problem. On tiny tables MySQL may
+                    # still pick ALL despite an index, so only warn when there was nothing to choose.
+                    if (row.get("type") == "ALL" and not row.get("possible_keys")) or "Using filesort" in extra:
+                        problems.append((name, row.get("table"), row.get("type"), extra))
+                        logger.warning(
+                            f"Hot query {name} falls back to a full scan of {row.get('table')} "
+                            f"(type={row.get('type')}, key={row.get('key')}, extra={extra or '-'})"
+                        )
+    if not problems:
+        logger.info(f"All {len(HOT_QUERIES)} hot queries use indexes.")
+    return problems
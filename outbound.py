@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# Outbound message layer for game UIs. Follow-ups and edits are queued per
+# interaction (so one game's messages stay in order), pending edits to the same
+# message collapse to the latest state, and sends are paced by token buckets per
+# channel and per interaction webhook so bursts queue here instead of bouncing
+# off 429s. interaction.response.* stays direct: it has to answer within 3 s and
+# isn't rate limited like follow-ups.
+CHANNEL_BUDGET = (int(os.getenv('OUTBOUND_CHANNEL_RATE', '5')), float(os.getenv('OUTBOUND_CHANNEL_PER', '5')))  # messages per seconds
+WEBHOOK_BUDGET = (int(os.getenv('OUTBOUND_WEBHOOK_RATE', '5')), float(os.getenv('OUTBOUND_WEBHOOK_PER', '2')))  # requests per seconds
+MAX_PENDING = int(os.getenv('OUTBOUND_MAX_PENDING', '50'))  # per interaction lane
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Budget:
+    """Token bucket: `rate` sends per `per` seconds, with bursts up to `rate`."""
+
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def take(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+
+class _Job:
+    __slots__ = ("send", "future", "channel_id", "coalescible")
+
+    def __init__(self, send, future, channel_id, coalescible):
+        self.send = send
+        self.future = future
+        self.channel_id = channel_id
+        self.coalescible = coalescible
+
+
+class _Lane:
+    def __init__(self, webhook_budget):
+        self.jobs: OrderedDict = OrderedDict()  # job key -> _Job, in send order
+        self.budget = webhook_budget
+        self.worker = None
+
+
+class OutboundQueue:
+    def __init__(self, channel_budget, webhook_budget, max_pending):
+        self.channel_budget = channel_budget
+        self.webhook_budget = webhook_budget
+        self.max_pending = max_pending
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._lanes: dict = {}  # lane key (interaction id) -> _Lane
+        self._channels: dict = {}  # channel_id -> _Budget
+        self._seq = 0
+
+    def send(self, lane, send, channel_id=None, urgent=False):
+        """Queues a new message (send is a zero-argument coroutine function). Returns a future for its result."""
+        self._seq += 1
+        return self._enqueue(lane, ("send", self._seq), send, channel_id, coalescible=False, urgent=urgent)
+
+    def edit(self, lane, message_key, send, channel_id=None):
+        """Queues an edit; if an edit to the same message is still waiting, it is replaced by this one."""
+        return self._enqueue(lane, ("edit", message_key), send, channel_id, coalescible=True, urgent=False)
+
+    def depth(self):
+        return sum(len(lane.jobs) for lane in self._lanes.values())
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "lanes": len(self._lanes),
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+    def _enqueue(self, lane_key, job_key, send, channel_id, coalescible, urgent):
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        lane = self._lanes.get(lane_key)
+        if lane is None:
+            lane = self._lanes[lane_key] = _Lane(_Budget(*self.webhook_budget))
+
+        existing = lane.jobs.get(job_key)
+        if existing is not None:
+            # Only the latest state of a message matters: swap in the new edit, and resolve this caller when it lands
+            self.coalesced += 1
+            existing.send = send
+            existing.future.add_done_callback(lambda done: _chain(done, future))
+            return future
+
+        if len(lane.jobs) >= self.max_pending:
+            victim = next((key for key, job in lane.jobs.items() if job.coalescible), None)
+            if victim is None:
+                self.dropped += 1
+                future.set_exception(QueueFull(f"Outbound lane {lane_key} has {len(lane.jobs)} pending messages"))
+                return future
+            self.dropped += 1
+            lane.jobs.pop(victim).future.set_result(None)
+
+        lane.jobs[job_key] = _Job(send, future, channel_id, coalescible)
+        if urgent:
+            lane.jobs.move_to_end(job_key, last=False)
+        if lane.worker is None or lane.worker.done():
+            lane.worker = asyncio.create_task(self._drain(lane_key, lane))
+        return future
+
+    async def _drain(self, lane_key, lane):
+        while lane.jobs:
+            _, job = lane.jobs.popitem(last=False)
+            if job.channel_id is not None:
+                await self._channel_budget(job.channel_id).take()
+            await lane.budget.take()
+            try:
+                result = await job.send()
+            except Exception as e:
+                self.failed += 1
+                if isinstance(e, discord.HTTPException) and e.status == 429:
+                    lane.budget.tokens = 0  # Discord says slow down; spend the next refill waiting
+                logger.warning(f"Outbound message failed: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        if self._lanes.get(lane_key) is lane:
+            del self._lanes[lane_key]
+
+    def _channel_budget(self, channel_id):
+        budget = self._channels.get(channel_id)
+        if budget is None:
+            if len(self._channels) > 1000:
+                self._channels = {key: value for key, value in self._channels.items() if not value.idle()}
+            budget = self._channels[channel_id] = _Budget(*self.channel_budget)
+        return budget
+
+
+def _chain(source, target):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _consume_exception(future):
+    # Most callers fire and forget; failures are already logged by the worker
+    if not future.cancelled():
+        future.exception()
+
+
+queue = OutboundQueue(CHANNEL_BUDGET, WEBHOOK_BUDGET, MAX_PENDING)
+
+
+def followup(interaction: discord.Interaction, *args, urgent=False, **kwargs):
+    """interaction.followup.send through the queue. Ephemeral replies to a click should pass urgent=True."""
+    # Ephemeral messages don't post to the channel, so they only spend the webhook budget
+    channel_id = None if kwargs.get("ephemeral") else interaction.channel_id
+    return queue.send(interaction.id, lambda: interaction.followup.send(*args, **kwargs),
+                      channel_id=channel_id, urgent=urgent)
+
+
+def edit_original(interaction: discord.Interaction, **kwargs):
+    """interaction.edit_original_response through the queue, coalesced with other pending edits to it."""
+    return queue.edit(interaction.id, "original", lambda: interaction.edit_original_response(**kwargs))
+
+
+def edit_message(interaction: discord.Interaction, message, unless=None, **kwargs):
+    """message.edit for a message owned by this interaction, coalesced with other pending edits to it.
+
+    unless is checked when the edit is actually sent (it may wait for budget); if it returns true the edit is skipped.
+    """
+    async def send():
+        if unless is not None and unless():
+            return None
+        return await message.edit(**kwargs)
+
+    return queue.edit(interaction.id, message.id, send)
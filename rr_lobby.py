@@ -0,0 +1,59 @@
+import asyncio
+import os
+
+import rr_sessions
+
+# Open-join lobbies for multiplayer Russian Roulette live only in memory: a
+# Join click is a set lookup and an append, with no database work, and the
+# roster is checked and written once when the lobby closes. As in rr_sessions,
+# everything between a lookup and a mutation is synchronous, so simultaneous
+# clicks can't lose a join or add the same player twice.
+LOBBY_SECONDS = float(os.getenv('RR_LOBBY_SECONDS', '10'))  # How long a lobby stays open
+LOBBY_MAX_PLAYERS = int(os.getenv('RR_LOBBY_MAX_PLAYERS', '8'))  # The game starts as soon as this many have joined
+
+JOINED = "joined"
+ALREADY_JOINED = "already joined"
+IN_GAME = "in game"
+FULL = "full"
+CLOSED = "closed"
+
+
+class Lobby:
+    def __init__(self, host_id, server_id, amount, max_players=LOBBY_MAX_PLAYERS):
+        self.host_id = host_id
+        self.server_id = server_id
+        self.amount = amount
+        self.max_players = max(2, max_players)
+        self.players = [host_id]  # Join order; the host is always in
+        self._members = {host_id}
+        self._full = asyncio.Event()
+        self.closed = False
+
+    def join(self, user_id):
+        """Adds a player and returns JOINED, or why they weren't added."""
+        if self.closed:
+            return CLOSED
+        if user_id in self._members:
+            return ALREADY_JOINED
+        if len(self.players) >= self.max_players:
+            return FULL
+        if rr_sessions.sessions.playing(user_id):  # An abandoned game is expired when the lobby closes
+            return IN_GAME
+        self._members.add(user_id)
+        self.players.append(user_id)
+        if len(self.players) >= self.max_players:
+            self._full.set()
+        return JOINED
+
+    @property
+    def full(self):
+        return len(self.players) >= self.max_players
+
+    async def wait(self, timeout=LOBBY_SECONDS):
+        """Waits until the lobby fills up or the timeout passes, then closes it and returns the roster."""
+        try:
+            await asyncio.wait_for(self._full.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.closed = True
+        return list(self.players)
@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import cluster
+import database
+
+logger = logging.getLogger(__name__)
+
+# Live Russian Roulette games are kept here and MySQL is only a checkpoint, so a
+# trigger pull is a dict lookup instead of a JSON_CONTAINS scan + save + re-read.
+# Everything between a lookup and a mutation is synchronous, so two clicks on the
+# same game can't interleave.
+#
+# Every game has its own ID (the interaction that started it), stored in the
+# table's user_id key column. Players are indexed separately, so a player knocked
+# out of one game can start another without touching the first.
+# A game nobody has touched for its idle timeout is abandoned: its buttons have
+# timed out, so it is ended and its players refunded (see on_expire). Games found
+# in the table after a restart have no buttons at all and are refunded on startup.
+CHECKPOINT_INTERVAL = float(os.getenv('RR_CHECKPOINT_INTERVAL', '2'))  # seconds between background checkpoints
+SOLO_IDLE_TIMEOUT = float(os.getenv('RR_SOLO_TIMEOUT', '60'))  # seconds; also the solo buttons' timeout
+MULTI_IDLE_TIMEOUT = float(os.getenv('RR_MULTI_TIMEOUT', '300'))  # seconds; also the multiplayer buttons' timeout
+EXPIRY_SWEEP_INTERVAL = 15.0  # seconds between sweeps for abandoned games
+
+
+class RussianRouletteSessions:
+    def __init__(self, checkpoint_interval):
+        self.checkpoint_interval = checkpoint_interval
+        self._games: dict[int, dict] = {}  # game_id -> game state
+        self._by_player: dict[int, int] = {}  # user_id -> game_id
+        self._dirty: set[int] = set()  # games to upsert at the next checkpoint
+        self._ended: set[int] = set()  # games to delete at the next checkpoint
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._sweeper = None
+        self._expire_handler = None
+        self._pending_flush = None
+        self._recovered = False
+        self._ids = itertools.count(time.time_ns())  # For games started without an interaction; unique across restarts
+
+    def create(self, players, chambers, winnings, original_wager, gun, server_id=None, ref_id=None):
+        """Starts a game under a new game ID: ref_id (the starting interaction) when given."""
+        game_id = ref_id if ref_id is not None else next(self._ids)
+        state = {
+            "game_id": game_id,
+            "players": list(players),
+            "chambers": chambers,
+            "winnings": winnings,
+            "original_wager": original_wager,
+            "shots_survived": 0,
+            "gun_state": gun,
+            "current_turn": 0,
+            "votes": [],
+            "server_id": server_id,
+            "ref_id": ref_id,  # Ties the game's coin ledger entries together; not checkpointed
+            "idle_timeout": SOLO_IDLE_TIMEOUT if len(players) == 1 else MULTI_IDLE_TIMEOUT,  # Not checkpointed
+        }
+        self._add(state)
+        self._ended.discard(game_id)
+        self.save(state, transition=True)
+        self._ensure_sweeper()
+        return state
+
+    def get(self, user_id):
+        """Returns the live game this player is in, or None."""
+        game_id = self._by_player.get(user_id)
+        return self._games.get(game_id) if game_id is not None else None
+
+    def playing(self, user_id):
+        """True if the player is in a live game that hasn't been abandoned."""
+        state = self.get(user_id)
+        return state is not None and not self.is_idle(state)
+
+    async def busy_players(self, user_ids):
+        """Returns the players already in a game.
+
+        Live games are a dict lookup; abandoned ones are expired first rather than
+        blocking their players. In a cluster, other workers' games only exist here as
+        their checkpoints, so those are checked too (one connection for all the players).
+        Checkpoints of this worker's own guilds are skipped: its live games are all in
+        memory, so such a row is a finished game whose delete hasn't been written yet.
+        """
+        for user_id in user_ids:
+            state = self.get(user_id)
+            if state is not None and self.is_idle(state):
+                await self.expire(state)
+        busy = {user_id for user_id in user_ids if self.get(user_id) is not None}
+        rest = [user_id for user_id in user_ids if user_id not in busy]
+        if cluster.CLUSTERED and rest:
+            busy |= await database.players_in_games(rest, skip_server=cluster.owns_guild)
+        return busy
+
+    def save(self, state, transition=False):
+        """Marks a game as changed. Transitions (start, elimination) are checkpointed right away, the rest on the interval."""
+        state["last_active"] = time.monotonic()
+        self._dirty.add(state["game_id"])
+        if transition:
+            self._flush_soon()
+        self._ensure_checkpointer()
+
+    def remove_player(self, state, user_id):
+        state["players"].remove(user_id)
+        if self._by_player.get(user_id) == state["game_id"]:
+            del self._by_player[user_id]
+
+    def end(self, state):
+        """Removes a finished game; its row is deleted at the next checkpoint (which runs right away)."""
+        game_id = state["game_id"]
+        if self._games.get(game_id) is not state:
+            return
+        del self._games[game_id]
+        for user_id in state["players"]:
+            if self._by_player.get(user_id) == game_id:
+                del self._by_player[user_id]
+        self._dirty.discard(game_id)
+        self._ended.add(game_id)
+        self._flush_soon()
+        self._ensure_checkpointer()
+
+    def is_idle(self, state, now=None):
+        """True once a game has gone its idle timeout without a move."""
+        return (now or time.monotonic()) - state["last_active"] >= state["idle_timeout"]
+
+    def on_expire(self, handler):
+        """Sets the coroutine function that ends and refunds an abandoned game (casino_games registers it)."""
+        self._expire_handler = handler
+
+    async def expire(self, state):
+        """Ends an abandoned game through the expiry handler. Games that already ended are left alone."""
+        if self._games.get(state["game_id"]) is not state:
+            return
+        if self._expire_handler is None:
+            self.end(state)
+            return
+        await self._expire_handler(state)
+
+    def __len__(self):
+        return len(self._games)
+
+    async def flush(self):
+        """Writes every changed game and deletes every finished one."""
+        async with self._lock:
+            # Snapshot synchronously so games can keep changing while we write
+            dirty = [self._games[game_id] for game_id in self._dirty if game_id in self._games]
+            snapshots = [
+                (list(state["players"]), state["chambers"], state["winnings"], state["original_wager"],
+                 state["shots_survived"], list(state["gun_state"]), state["current_turn"], state["game_id"], list(state["votes"]),
+                 state.get("server_id"))
+                for state in dirty
+            ]
+            ended = list(self._ended)
+            self._dirty.clear()
+            self._ended.clear()
+
+            for players, chambers, winnings, wager, shots, gun, turn, game_id, votes, server_id in snapshots:
+                try:
+                    await database.save_game_state(players, chambers, winnings, wager, shots, gun, turn, game_id=game_id, votes=votes, server_id=server_id)
+                except Exception as e:
+                    logger.error(f"Failed to checkpoint Russian Roulette game {game_id}: {e}")
+                    if game_id in self._games:
+                        self._dirty.add(game_id)
+
+            for game_id in ended:
+                try:
+                    await database.delete_game_session(game_id)
+                except Exception as e:
+                    logger.error(f"Failed to delete finished Russian Roulette game {game_id}: {e}")
+                    if game_id not in self._games:
+                        self._ended.add(game_id)
+
+    async def recover(self):
+        """Ends the games saved before a restart. Runs once per process; later calls are no-ops.
+
+        Their buttons belonged to the old process, so nobody can finish them: each is
+        refunded through the expiry handler and its row deleted. In a cluster each worker
+        only takes the games of guilds on its own shards.
+        """
+        if self._recovered:
+            return
+        rows = await database.load_game_states()
+        self._recovered = True  # Only once the load worked, so a failed attempt can be retried
+        refunded = 0
+        for row in rows:
+            if not cluster.owns_guild(row.get("server_id")):
+                continue
+            state = {
+                "game_id": row["user_id"],
+                "players": row["players"],
+                "chambers": row["chambers"],
+                "winnings": row["winnings"],
+                "original_wager": row["original_wager"],
+                "shots_survived": row["shots_survived"],
+                "gun_state": row["gun_state"],
+                "current_turn": row["current_turn"],
+                "votes": row.get("votes") or [],
+                "server_id": row.get("server_id"),
+                "ref_id": None,
+                "idle_timeout": 0.0,
+                "last_active": 0.0,
+            }
+            if not state["players"]:
+                self._ended.add(state["game_id"])
+                continue
+            self._add(state)
+            try:
+                await self.expire(state)
+                refunded += 1
+            except Exception as e:
+                logger.error(f"Failed to refund Russian Roulette game {state['game_id']} from before the restart: {e}")
+        if self._games:
+            self._ensure_sweeper()  # Retries the refunds that failed
+        if self._ended:
+            await self.flush()
+        logger.info(f"Refunded {refunded} Russian Roulette games left over from before the restart.")
+
+    async def close(self):
+        """Stops the checkpointer and writes everything outstanding."""
+        for task in (self._task, self._sweeper):
+            if task is not None:
+                task.cancel()
+        self._task = self._sweeper = None
+        await self.flush()
+
+    def _add(self, state):
+        self._games[state["game_id"]] = state
+        for user_id in state["players"]:
+            self._by_player[user_id] = state["game_id"]
+
+    def _flush_soon(self):
+        # One queued flush is enough; it picks up everything marked by then
+        if self._pending_flush is None or self._pending_flush.done():
+            self._pending_flush = asyncio.create_task(self.flush())
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            if self._dirty or self._ended:
+                await self.flush()
+
+    async def _sweep_loop(self):
+        while self._games:
+            await asyncio.sleep(EXPIRY_SWEEP_INTERVAL)
+            now = time.monotonic()
+            for state in [state for state in self._games.values() if self.is_idle(state, now)]:
+                try:
+                    await self.expire(state)
+                except Exception as e:
+                    logger.error(f"Failed to expire abandoned Russian Roulette game {state['game_id']}: {e}")
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    def _ensure_checkpointer(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._checkpoint_loop())
+
+
+sessions = RussianRouletteSessions(CHECKPOINT_INTERVAL)
@@ -0,0 +1,280 @@
+"""Monte Carlo economy simulator for the casino games.
+
+Replays each game's odds and payout rules from game_rules.py (the same
+constants casino_games.py plays with, including its rounding) with NumPy,
+a whole batch of rounds per array operation, spread over worker processes.
+Nothing touches Discord or the database.
+
+Two reports:
+
+    rtp   Return to player of one bet, over many independent rounds: the mean
+          payout per coin wagered with a 95% confidence interval, its variance
+          and the win rate. RTP below 1 is the house edge; above 1, the game
+          prints coins.
+    ruin  A population of players who start with the same balance and keep
+          betting with a strategy (flat, fraction of balance, martingale),
+          optionally collecting /daily: how many go broke, and how the total
+          coin supply and its spread change.
+
+    python simulate_economy.py rtp --game roulette --choice green --rounds 50000000
+    python simulate_economy.py rtp --game crash --target 2.5
+    python simulate_economy.py ruin --game rr_solo --chambers 6 --shots 2 --strategy martingale
+    python simulate_economy.py ruin --game coinflip --players 100000 --rounds 1000 --daily-every 50
+
+Multiplayer Russian Roulette is not simulated: its pot is the players' own
+wagers handed to the survivor (or split), so it moves coins between players
+but never creates or destroys them.
+
+Needs numpy, which the bot itself does not.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import game_rules
+
+BATCH = 1_000_000  # Rounds per array operation; bounds memory per worker to a few tens of MB
+Z_95 = 1.959964
+
+_WHEEL_NUMBERS = np.array([-1 if number == "00" else int(number) for number in game_rules.ROULETTE_WHEEL])  # 00 as -1
+_WHEEL_COLORS = np.array([game_rules.roulette_color(number) for number in game_rules.ROULETTE_WHEEL])
+
+
+# --- Games: payouts for an array of bets, stake included, 0 on a loss ---
+# Each mirrors the handler of the same name in casino_games.py.
+
+def coinflip(rng, bets, options):
+    won = rng.random(bets.size) < 0.5
+    return np.where(won, bets * game_rules.COINFLIP_PAYOUT, 0)
+
+
+def roulette(rng, bets, options):
+    spins = rng.integers(0, len(game_rules.ROULETTE_WHEEL), bets.size)
+    choice = options.choice
+    if choice in ("red", "black", "green"):
+        won = _WHEEL_COLORS[spins] == choice
+        multiplier = game_rules.ROULETTE_GREEN_PAYOUT if choice == "green" else game_rules.ROULETTE_COLOR_PAYOUT
+    else:
+        won = _WHEEL_NUMBERS[spins] == (-1 if choice == "00" else int(choice))
+        multiplier = game_rules.ROULETTE_NUMBER_PAYOUT
+    return np.where(won, bets * multiplier, 0)
+
+
+def crash_points(rng, size):
+    points = rng.gamma(game_rules.CRASH_GAMMA_SHAPE, game_rules.CRASH_GAMMA_SCALE, size)
+    np.clip(points, game_rules.CRASH_MIN_MULTIPLIER, game_rules.CRASH_MAX_MULTIPLIER, out=points)
+    points[rng.random(size) < game_rules.CRASH_INSTANT_CHANCE] = 1.0
+    return points
+
+
+def crash(rng, bets, options):
+    # The player withdraws as soon as the multiplier reaches the target; the
+    # withdrawal only counts while the multiplier is still below the crash point.
+    won = options.target < crash_points(rng, bets.size)
+    return np.where(won, np.floor(bets * options.target).astype(np.int64), 0)
+
+
+def rr_solo(rng, bets, options):
+    # Shooting a random remaining chamber each time is the same as firing the
+    # chambers in a random order: the player survives `shots` shots when the
+    # bullet comes later in that order.
+    survived = rng.integers(0, options.chambers, bets.size) >= options.shots
+    multiplier = game_rules.RR_CHAMBER_MULTIPLIERS[options.chambers]
+    winnings = bets.astype(np.float64)
+    for _ in range(options.shots):
+        winnings = np.round(winnings * multiplier)  # Half to even, like round()
+    return np.where(survived, winnings.astype(np.int64), 0)
+
+
+GAMES = {"coinflip": coinflip, "roulette": roulette, "crash": crash, "rr_solo": rr_solo}
+
+
+# --- Betting strategies: the bet each active player places this round ---
+
+def next_bets(options, balances, last_bets, last_won):
+    if options.strategy == "flat":
+        bets = np.full(balances.size, options.bet, dtype=np.int64)
+    elif options.strategy == "fraction":
+        bets = np.maximum(1, (balances * options.fraction).astype(np.int64))
+    else:  # martingale: double after a loss, back to the base bet after a win, all-in when short
+        bets = np.where(last_won, options.bet, last_bets * 2)
+    return np.minimum(bets, balances)
+
+
+def min_bet(options):
+    """Below this balance a player can't place their strategy's bet and counts as ruined."""
+    return 1 if options.strategy == "fraction" else options.bet
+
+
+# --- Workers ---
+
+def _rtp_worker(job):
+    seed, rounds, options = job
+    rng = np.random.default_rng(seed)
+    game = GAMES[options.game]
+    count = total = total_sq = wins = 0
+    while rounds > 0:
+        size = min(BATCH, rounds)
+        bets = np.full(size, options.bet, dtype=np.int64)
+        returns = game(rng, bets, options) / options.bet
+        count += size
+        total += float(returns.sum())
+        total_sq += float(np.square(returns).sum())
+        wins += int(np.count_nonzero(returns > 1))
+        rounds -= size
+    return count, total, total_sq, wins
+
+
+def _ruin_worker(job):
+    seed, players, options = job
+    rng = np.random.default_rng(seed)
+    game = GAMES[options.game]
+    balances = np.full(players, options.balance, dtype=np.int64)
+    last_bets = np.full(players, options.bet, dtype=np.int64)
+    last_won = np.ones(players, dtype=bool)
+    wagered = paid = daily = 0
+    floor = min_bet(options)
+    for round_number in range(1, options.rounds + 1):
+        if options.daily_every and round_number % options.daily_every == 0:
+            reward = game_rules.daily_reward(round_number // options.daily_every)  # Claimed every day, so the streak keeps growing
+            balances += reward
+            daily += reward * players
+        active = np.flatnonzero(balances >= floor)
+        if active.size == 0:
+            if not options.daily_every:
+                break
+            continue
+        bets = next_bets(options, balances[active], last_bets[active], last_won[active])
+        payouts = game(rng, bets, options)
+        balances[active] += payouts - bets
+        last_bets[active] = bets
+        last_won[active] = payouts > bets
+        wagered += int(bets.sum())
+        paid += int(payouts.sum())
+    return balances, wagered, paid, daily
+
+
+def _split(total, parts):
+    return [share for share in (total // parts + (i < total % parts) for i in range(parts)) if share]
+
+
+def _run(worker, total, options):
+    """Splits total (rounds or players) across processes, each with an independent random stream."""
+    shares = _split(total, options.workers)
+    seeds = np.random.SeedSequence(options.seed).spawn(len(shares))
+    jobs = [(seed, share, options) for seed, share in zip(seeds, shares)]
+    if len(jobs) == 1:
+        return [worker(jobs[0])]
+    with multiprocessing.Pool(len(jobs)) as pool:
+        return pool.map(worker, jobs)
+
+
+# --- Reports ---
+
+def describe(options):
+    if options.game == "roulette":
+        return f"roulette on {options.choice}"
+    if options.game == "crash":
+        return f"crash, withdrawing at {options.target:.2f}x"
+    if options.game == "rr_solo":
+        return f"solo russian roulette, {options.chambers} chambers, cashing out after {options.shots} shot(s)"
+    return options.game
+
+
+def report_rtp(options):
+    start = time.perf_counter()
+    results = _run(_rtp_worker, options.rounds, options)
+    elapsed = time.perf_counter() - start
+    count = sum(result[0] for result in results)
+    total = sum(result[1] for result in results)
+    total_sq = sum(result[2] for result in results)
+    wins = sum(result[3] for result in results)
+    mean = total / count
+    variance = max(0.0, total_sq / count - mean * mean) * count / max(1, count - 1)
+    margin = Z_95 * (variance / count) ** 0.5
+    print(f"{describe(options)}, bet {options.bet}: {count:,} rounds in {elapsed:.1f}s "
+          f"({count / elapsed * 60 / 1e6:,.0f}M rounds/min on {len(results)} process(es))")
+    print(f"  RTP          {mean:.5f}  (95% CI {mean - margin:.5f} - {mean + margin:.5f})")
+    print(f"  house edge   {1 - mean:+.3%}")
+    print(f"  variance     {variance:.4f} (per coin wagered, std dev {variance ** 0.5:.4f})")
+    print(f"  win rate     {wins / count:.4%}")
+
+
+def report_ruin(options):
+    start = time.perf_counter()
+    results = _run(_ruin_worker, options.players, options)
+    elapsed = time.perf_counter() - start
+    balances = np.concatenate([result[0] for result in results])
+    wagered = sum(result[1] for result in results)
+    paid = sum(result[2] for result in results)
+    daily = sum(result[3] for result in results)
+    players = balances.size
+    ruined = int(np.count_nonzero(balances < min_bet(options)))
+    ruin = ruined / players
+    margin = Z_95 * (ruin * (1 - ruin) / players) ** 0.5
+    supply_start = options.balance * players
+    supply_end = int(balances.sum())
+    ranked = np.sort(balances)[::-1]
+    top_share = ranked[:max(1, players // 100)].sum() / max(1, supply_end)
+
+    print(f"{describe(options)}, {options.strategy} strategy: {players:,} players x {options.rounds:,} rounds "
+          f"from {options.balance:,} coins in {elapsed:.1f}s")
+    print(f"  ruin probability  {ruin:.4%}  (95% CI {max(0.0, ruin - margin):.4%} - {min(1.0, ruin + margin):.4%})")
+    print(f"  realised RTP      {paid / wagered:.5f} over {wagered:,} coins wagered" if wagered else "  realised RTP      - (nothing wagered)")
+    if daily:
+        print(f"  daily rewards     {daily:,} coins")
+    print(f"  coin supply       {supply_start:,} -> {supply_end:,} ({supply_end / supply_start - 1:+.2%})")
+    print(f"  final balance     mean {balances.mean():,.0f}, median {np.median(balances):,.0f}, "
+          f"p99 {np.percentile(balances, 99):,.0f}, max {balances.max():,}")
+    print(f"  top 1% hold       {top_share:.1%} of all coins")
+
+
+def _positive_int(value):
+    number = int(value.replace("_", ""))
+    if number <= 0:
+        raise argparse.ArgumentTypeError("must be greater than 0")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the casino games' payouts and their effect on the coin supply.")
+    parser.add_argument("report", choices=("rtp", "ruin"))
+    parser.add_argument("--game", choices=sorted(GAMES), default="coinflip")
+    parser.add_argument("--bet", type=_positive_int, default=100, help="bet per round (the base bet for martingale)")
+    parser.add_argument("--choice", default="red", help="roulette bet: red, black, green or a number (0-36, 00)")
+    parser.add_argument("--target", type=float, default=2.0, help="crash multiplier to withdraw at")
+    parser.add_argument("--chambers", type=int, choices=sorted(game_rules.RR_CHAMBER_MULTIPLIERS), default=6)
+    parser.add_argument("--shots", type=int, default=1, help="russian roulette shots survived before cashing out")
+    parser.add_argument("--rounds", type=_positive_int, default=None,
+                        help="rtp: rounds in total (default 20,000,000); ruin: rounds per player (default 1,000)")
+    parser.add_argument("--players", type=_positive_int, default=10_000, help="ruin: number of players")
+    parser.add_argument("--balance", type=_positive_int, default=1_000, help="ruin: starting balance")
+    parser.add_argument("--strategy", choices=("flat", "fraction", "martingale"), default="flat")
+    parser.add_argument("--fraction", type=float, default=0.05, help="fraction strategy: share of the balance bet each round")
+    parser.add_argument("--daily-every", type=int, default=0, help="ruin: credit the /daily reward every N rounds (0: never)")
+    parser.add_argument("--workers", type=_positive_int, default=os.cpu_count() or 1, help="processes (default: one per CPU)")
+    parser.add_argument("--seed", type=int, default=None, help="for reproducible runs")
+    options = parser.parse_args()
+
+    if options.rounds is None:
+        options.rounds = 20_000_000 if options.report == "rtp" else 1_000
+    if options.game == "roulette" and options.choice not in ("red", "black", "green") and options.choice not in game_rules.ROULETTE_WHEEL:
+        parser.error(f"invalid roulette choice {options.choice!r}")
+    if options.game == "crash" and options.target < 1.0:
+        parser.error("--target must be at least 1.0")
+    if options.game == "rr_solo" and not 0 <= options.shots < options.chambers:
+        parser.error(f"--shots must be between 0 and {options.chambers - 1} with {options.chambers} chambers")
+    if not 0 < options.fraction <= 1:
+        parser.error("--fraction must be in (0, 1]")
+
+    if options.report == "rtp":
+        report_rtp(options)
+    else:
+        report_ruin(options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# One-shot startup pipeline, started from setup_hook (once per process, not on
+# every reconnect like on_ready). Stages declare what they need and each one
+# starts as soon as its dependencies are done, so independent work (command sync,
+# cache preloads) runs side by side. The gateway connects meanwhile; until every
+# stage has finished, slash commands get a quick "starting up" reply instead of
+# waiting on a pool that doesn't exist yet.
+RETRY_DELAY_MAX = 60.0  # seconds between attempts of a required stage
+
+
+class Stage:
+    def __init__(self, name, run, needs=(), required=False):
+        self.name = name
+        self.run = run
+        self.needs = tuple(needs)
+        self.required = required  # Retried until it succeeds; otherwise a failure is logged and skipped
+
+
+class StartupPipeline:
+    def __init__(self):
+        self.stages: dict[str, Stage] = {}
+        self.timings: dict[str, float] = {}  # stage -> seconds, for finished stages
+        self.failed: dict[str, str] = {}  # stage -> error, for stages that gave up (or were skipped)
+        self.ready = asyncio.Event()
+        self.total_seconds = 0.0
+        self._task = None
+
+    def stage(self, name, needs=(), required=False):
+        """Decorator registering a coroutine function as a stage."""
+        def register(run):
+            for dependency in needs:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage {name!r} needs {dependency!r}, which isn't registered (register it first)")
+            self.stages[name] = Stage(name, run, needs, required)
+            return run
+        return register
+
+    def start(self):
+        """Starts the pipeline in the background; later calls return the same task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def _run(self):
+        started = time.perf_counter()
+        tasks: dict[str, asyncio.Task] = {}
+        for stage in self.stages.values():  # Registration order is a valid order: dependencies come first
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, tasks))
+        await asyncio.gather(*tasks.values())
+        self.total_seconds = time.perf_counter() - started
+        self.ready.set()
+        timings = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+        logger.info(f"Startup finished in {self.total_seconds:.2f}s ({timings}).")
+        for name, error in self.failed.items():
+            logger.warning(f"Startup stage {name} didn't complete: {error}")
+
+    async def _run_stage(self, stage, tasks):
+        await asyncio.gather(*(tasks[dependency] for dependency in stage.needs))
+        missing = [dependency for dependency in stage.needs if dependency in self.failed]
+        if missing:
+            self.failed[stage.name] = f"skipped, {', '.join(missing)} failed"
+            return
+
+        delay = 1.0
+        while True:
+            started = time.perf_counter()
+            try:
+                await stage.run()
+            except Exception as e:
+                if not stage.required:
+                    self.failed[stage.name] = str(e) or type(e).__name__
+                    logger.error(f"Startup stage {stage.name} failed: {e}")
+                    return
+                logger.error(f"Startup stage {stage.name} failed, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_DELAY_MAX)
+                continue
+            self.timings[stage.name] = time.perf_counter() - started
+            logger.info(f"Startup stage {stage.name} done in {self.timings[stage.name]:.2f}s.")
+            return
+
+
+pipeline = StartupPipeline()
+
+
+class GatedCommandTree(metrics.InstrumentedCommandTree):
+    """Command tree that turns slash commands away with a short reply until startup has finished.
+
+    Turned-away interactions are timed with status="starting", not counted as errors.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._turned_away: set[int] = set()  # interaction IDs, until _status picks them up
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if pipeline.ready.is_set():
+            return True
+        self._turned_away.add(interaction.id)
+        if interaction.type is discord.InteractionType.application_command:
+            await interaction.response.send_message("⏳ The bot is still starting up, try again in a few seconds.", ephemeral=True)
+        return False
+
+    def _status(self, interaction: discord.Interaction):
+        if interaction.id in self._turned_away:
+            self._turned_away.discard(interaction.id)
+            return "starting"
+        return super()._status(interaction)
@@ -0,0 +1,26 @@
+import os
+
+from storage.base import StorageBackend
+
+# Which backend database.py talks to. mysql is the production default; sqlite
+# suits single-node deployments; memory keeps everything in this process and
+# is meant for tests and benchmarks (nothing survives a restart).
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mysql').lower()
+
+
+def create_backend(name=None) -> StorageBackend:
+    """Builds the backend named by STORAGE_BACKEND (or `name`). Drivers are imported only when chosen."""
+    name = (name or STORAGE_BACKEND).lower()
+    if name == "mysql":
+        from storage.mysql import MySQLBackend
+        return MySQLBackend()
+    if name == "sqlite":
+        from storage.sqlite import SQLiteBackend
+        return SQLiteBackend()
+    if name == "memory":
+        from storage.memory import MemoryBackend
+        return MemoryBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND {name!r} (expected mysql, sqlite or memory)")
+
+
+__all__ = ["StorageBackend", "create_backend", "STORAGE_BACKEND"]
@@ -0,0 +1,182 @@
+import abc
+import contextlib
+
+
+class StorageBackend(abc.ABC):
+    """What database.py needs from a store.
+
+    database.py keeps everything that is not storage: the balance cache and
+    listeners, the write-behind user registry, session() and timing. Backends
+    only move rows. Every operation takes the connection handle yielded by
+    connection(), so a session can run several operations on one handle and
+    inside one transaction. Values come back as Python objects (lists, dates),
+    never as JSON text.
+    """
+
+    name = "base"
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """Opens connections. Called once, before the first connection()."""
+
+    async def close(self):
+        """Closes connections. Buffered writes are flushed by database.py first."""
+
+    @abc.abstractmethod
+    async def migrate(self):
+        """Brings the schema up to date."""
+
+    async def verify(self):
+        """Checks the hot queries are indexed; returns a list of problems (empty if none or not applicable)."""
+        return []
+
+    def pool_info(self):
+        """Connection counts for pool_stats.snapshot()."""
+        return {"pool_min": 0, "pool_max": 0, "pool_size": 0, "free": 0, "health_checks": 0, "reconnects": 0}
+
+    # --- Connections and transactions ---
+
+    @abc.abstractmethod
+    def connection(self) -> contextlib.AbstractAsyncContextManager:
+        """Async context manager yielding a connection handle for the operations below."""
+
+    @abc.abstractmethod
+    async def begin(self, conn): ...
+
+    @abc.abstractmethod
+    async def commit(self, conn): ...
+
+    @abc.abstractmethod
+    async def rollback(self, conn): ...
+
+    @abc.abstractmethod
+    async def savepoint(self, conn, name): ...
+
+    @abc.abstractmethod
+    async def release_savepoint(self, conn, name): ...
+
+    @abc.abstractmethod
+    async def rollback_to_savepoint(self, conn, name): ...
+
+    # --- Users and balances ---
+
+    @abc.abstractmethod
+    async def upsert_users(self, conn, users):
+        """Inserts or renames users; users is a list of (user_id, username, server_id). Balances are untouched."""
+
+    @abc.abstractmethod
+    async def add_to_balance(self, conn, user_id, amount):
+        """Adds amount and returns the new balance, or None if the user has no row."""
+
+    @abc.abstractmethod
+    async def debit(self, conn, user_id, amount, credit=0):
+        """Subtracts amount and adds credit only if the balance covers amount. Returns the new balance, or None if it didn't."""
+
+    @abc.abstractmethod
+    async def credit_or_create(self, conn, user_id, amount):
+        """Adds amount, creating the user's row if they have none. Returns the new balance."""
+
+    @abc.abstractmethod
+    async def apply_deltas(self, conn, deltas, require_non_negative):
+        """Adds {user_id: delta} to every balance at once, creating rows for users without one (as 0).
+        Returns the new balances, or None without changing anything if require_non_negative and one
+        would go below zero. Called inside a transaction, which keeps the check and the write together."""
+
+    @abc.abstractmethod
+    async def get_balance(self, conn, user_id):
+        """Returns the balance, or None if the user has no row."""
+
+    @abc.abstractmethod
+    async def get_balances(self, conn, user_ids):
+        """Returns {user_id: balance} in one query; users without a row are left out."""
+
+    @abc.abstractmethod
+    async def get_last_claim(self, conn, user_id):
+        """Returns the date of the last daily claim, or None."""
+
+    @abc.abstractmethod
+    async def set_last_claim(self, conn, user_id, day): ...
+
+    @abc.abstractmethod
+    async def claim_daily(self, conn, user_id, today, reward, streak_bonus, streak_cap):
+        """Claims the daily reward in one conditional write, unless already claimed today.
+
+        A claim the day after the last one extends daily_streak, any other resets it to 1;
+        the credit is reward + streak_bonus * min(streak - 1, streak_cap). A user with no row
+        gets one. Returns (new_balance, streak), or None if today's reward was already claimed.
+        """
+
+    @abc.abstractmethod
+    async def delete_users(self, conn, user_ids): ...
+
+    # --- Leaderboards ---
+
+    @abc.abstractmethod
+    async def top_balances(self, conn, server_id, limit):
+        """Richest users as [{"user_id", "username", "balance"}], highest first; server_id None means every server."""
+
+    @abc.abstractmethod
+    async def all_balances(self, conn):
+        """Every user as [{"user_id", "server_id", "balance"}]."""
+
+    @abc.abstractmethod
+    async def usernames(self, conn, user_ids):
+        """Stored usernames as {user_id: username}; users without one (or without a row) are left out."""
+
+    # --- Inventory ---
+
+    @abc.abstractmethod
+    async def get_inventory(self, conn, user_id):
+        """A user's items as [{"item_name", "quantity"}]."""
+
+    @abc.abstractmethod
+    async def add_item(self, conn, user_id, item_name, quantity):
+        """Adds to (or, with a negative quantity, takes from) a user's stack of an item. Returns the new quantity."""
+
+    # --- Russian Roulette sessions (keyed by the creator's ID) ---
+
+    @abc.abstractmethod
+    async def save_session(self, conn, game_id, state):
+        """Upserts a session and its membership rows. state has players, chambers, winnings,
+        original_wager, shots_survived, gun_state, current_turn, votes and server_id (None if unknown)."""
+
+    @abc.abstractmethod
+    async def load_sessions(self, conn):
+        """Every saved session, as dicts keyed like save_session's state plus user_id (the game ID)."""
+
+    @abc.abstractmethod
+    async def get_session(self, conn, game_id): ...
+
+    @abc.abstractmethod
+    async def session_ids_for_player(self, conn, user_id): ...
+
+    @abc.abstractmethod
+    async def update_session(self, conn, game_id, **fields):
+        """Updates some of a session's fields; a new players list also rewrites its membership rows."""
+
+    @abc.abstractmethod
+    async def delete_sessions(self, conn, game_ids): ...
+
+    # --- Russian Roulette invitations ---
+
+    @abc.abstractmethod
+    async def create_invitation(self, conn, creator_id, server_id, invited_users):
+        """Returns the new invitation's game_id."""
+
+    @abc.abstractmethod
+    async def get_invitation(self, conn, game_id):
+        """The invitation as a dict (invited_users, accepted_users, declined_users as lists), or None."""
+
+    @abc.abstractmethod
+    async def set_invitation_users(self, conn, game_id, field, users):
+        """Replaces one of the invitation's user lists (accepted_users or declined_users)."""
+
+    @abc.abstractmethod
+    async def delete_invitation(self, conn, game_id): ...
+
+    # --- Coin ledger ---
+
+    @abc.abstractmethod
+    async def append_ledger(self, conn, entries):
+        """Appends ledger rows; entries is a list of (user_id, delta, reason, game, ref_id, created_at)."""
@@ -0,0 +1,251 @@
+import contextlib
+import copy
+import datetime
+import heapq
+import itertools
+
+from storage.base import StorageBackend
+
+_MISSING = object()
+
+
+def _new_user(user_id):
+    return {"user_id": user_id, "username": None, "server_id": None, "balance": 0, "last_claim": None, "daily_streak": 0}
+
+
+class _MemoryConnection:
+    """Per-connection undo journal: one list of (table, key, previous row) per open transaction level."""
+
+    def __init__(self):
+        self.levels: list[list] = []
+
+
+class MemoryBackend(StorageBackend):
+    """Everything in dicts in this process. Nothing survives a restart.
+
+    Meant for tests, benchmarks and trying the bot without a database. Every
+    operation is synchronous under the hood, so each one is atomic; transactions
+    roll back through an undo journal but are not isolated (other tasks see
+    uncommitted writes).
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.users: dict[int, dict] = {}
+        self.inventory: dict[tuple, int] = {}  # (user_id, item_name) -> quantity
+        self.sessions: dict[int, dict] = {}
+        self.invitations: dict[int, dict] = {}
+        self._invitation_ids = itertools.count(1)
+        self.ledger: dict[int, dict] = {}
+        self._ledger_ids = itertools.count(1)
+
+    async def migrate(self):
+        pass  # No schema
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        yield _MemoryConnection()
+
+    async def begin(self, conn):
+        conn.levels = [[]]
+
+    async def commit(self, conn):
+        conn.levels = []
+
+    async def rollback(self, conn):
+        while conn.levels:
+            self._undo(conn.levels.pop())
+
+    async def savepoint(self, conn, name):
+        conn.levels.append([])
+
+    async def release_savepoint(self, conn, name):
+        released = conn.levels.pop()
+        conn.levels[-1].extend(released)
+
+    async def rollback_to_savepoint(self, conn, name):
+        self._undo(conn.levels.pop())
+
+    def _remember(self, conn, table, key):
+        """Journals a row before it changes, if a transaction is open."""
+        if conn.levels:
+            conn.levels[-1].append((table, key, copy.deepcopy(table.get(key, _MISSING))))
+
+    def _undo(self, journal):
+        for table, key, previous in reversed(journal):
+            if previous is _MISSING:
+                table.pop(key, None)
+            else:
+                table[key] = previous
+
+    # --- Users and balances ---
+
+    async def upsert_users(self, conn, users):
+        for user_id, username, server_id in users:
+            self._remember(conn, self.users, user_id)
+            row = self.users.setdefault(user_id, _new_user(user_id))
+            row["username"] = username
+            row["server_id"] = server_id
+
+    async def add_to_balance(self, conn, user_id, amount):
+        row = self.users.get(user_id)
+        if row is None:
+            return None
+        self._remember(conn, self.users, user_id)
+        row["balance"] += amount
+        return row["balance"]
+
+    async def debit(self, conn, user_id, amount, credit=0):
+        row = self.users.get(user_id)
+        if row is None or row["balance"] < amount:
+            return None
+        self._remember(conn, self.users, user_id)
+        row["balance"] += credit - amount
+        return row["balance"]
+
+    async def credit_or_create(self, conn, user_id, amount):
+        self._remember(conn, self.users, user_id)
+        row = self.users.setdefault(user_id, _new_user(user_id))
+        row["balance"] += amount
+        return row["balance"]
+
+    async def apply_deltas(self, conn, deltas, require_non_negative):
+        new_balances = {user_id: (self.users[user_id]["balance"] if user_id in self.users else 0) + delta
+                        for user_id, delta in deltas.items()}
+        if require_non_negative and any(balance < 0 for balance in new_balances.values()):
+            return None
+        for user_id, balance in new_balances.items():
+            self._remember(conn, self.users, user_id)
+            row = self.users.setdefault(user_id, _new_user(user_id))
+            row["balance"] = balance
+        return new_balances
+
+    async def get_balance(self, conn, user_id):
+        row = self.users.get(user_id)
+        return row["balance"] if row else None
+
+    async def get_balances(self, conn, user_ids):
+        return {user_id: self.users[user_id]["balance"] for user_id in user_ids if user_id in self.users}
+
+    async def get_last_claim(self, conn, user_id):
+        row = self.users.get(user_id)
+        return row["last_claim"] if row else None
+
+    async def set_last_claim(self, conn, user_id, day):
+        if user_id in self.users:
+            self._remember(conn, self.users, user_id)
+            self.users[user_id]["last_claim"] = day
+
+    async def claim_daily(self, conn, user_id, today, reward, streak_bonus, streak_cap):
+        row = self.users.get(user_id)
+        if row is not None and row["last_claim"] is not None and row["last_claim"] >= today:
+            return None
+        self._remember(conn, self.users, user_id)
+        if row is None:
+            row = self.users[user_id] = _new_user(user_id)
+        consecutive = row["last_claim"] == today - datetime.timedelta(days=1)
+        row["daily_streak"] = row["daily_streak"] + 1 if consecutive else 1
+        row["balance"] += reward + streak_bonus * min(row["daily_streak"] - 1, streak_cap)
+        row["last_claim"] = today
+        return row["balance"], row["daily_streak"]
+
+    async def delete_users(self, conn, user_ids):
+        user_ids = set(user_ids)
+        for key in [key for key in self.inventory if key[0] in user_ids]:
+            self._remember(conn, self.inventory, key)
+            del self.inventory[key]
+        for user_id in user_ids:
+            self._remember(conn, self.users, user_id)
+            self.users.pop(user_id, None)
+
+    # --- Leaderboards ---
+
+    async def top_balances(self, conn, server_id, limit):
+        rows = self.users.values() if server_id is None else (row for row in self.users.values() if row["server_id"] == server_id)
+        return [{"user_id": row["user_id"], "username": row["username"], "balance": row["balance"]}
+                for row in heapq.nlargest(limit, rows, key=lambda row: row["balance"])]
+
+    async def all_balances(self, conn):
+        return [{"user_id": row["user_id"], "server_id": row["server_id"], "balance": row["balance"]} for row in self.users.values()]
+
+    async def usernames(self, conn, user_ids):
+        return {user_id: self.users[user_id]["username"] for user_id in user_ids
+                if user_id in self.users and self.users[user_id]["username"] is not None}
+
+    # --- Inventory ---
+
+    async def get_inventory(self, conn, user_id):
+        return [{"item_name": item_name, "quantity": quantity}
+                for (owner, item_name), quantity in sorted(self.inventory.items()) if owner == user_id and quantity > 0]
+
+    async def add_item(self, conn, user_id, item_name, quantity):
+        key = (user_id, item_name)
+        self._remember(conn, self.inventory, key)
+        self.inventory[key] = self.inventory.get(key, 0) + quantity
+        return self.inventory[key]
+
+    # --- Russian Roulette sessions ---
+
+    async def save_session(self, conn, game_id, state):
+        self._remember(conn, self.sessions, game_id)
+        self.sessions[game_id] = {"user_id": game_id, **copy.deepcopy(state)}
+
+    async def load_sessions(self, conn):
+        return [copy.deepcopy(session) for session in self.sessions.values()]
+
+    async def get_session(self, conn, game_id):
+        session = self.sessions.get(game_id)
+        return copy.deepcopy(session) if session else None
+
+    async def session_ids_for_player(self, conn, user_id):
+        return [game_id for game_id, session in self.sessions.items() if user_id in session["players"]]
+
+    async def update_session(self, conn, game_id, **fields):
+        if game_id in self.sessions:
+            self._remember(conn, self.sessions, game_id)
+            self.sessions[game_id].update(copy.deepcopy(fields))
+
+    async def delete_sessions(self, conn, game_ids):
+        for game_id in game_ids:
+            self._remember(conn, self.sessions, game_id)
+            self.sessions.pop(game_id, None)
+
+    # --- Russian Roulette invitations ---
+
+    async def create_invitation(self, conn, creator_id, server_id, invited_users):
+        game_id = next(self._invitation_ids)
+        self._remember(conn, self.invitations, game_id)
+        self.invitations[game_id] = {
+            "game_id": game_id,
+            "creator_id": creator_id,
+            "server_id": server_id,
+            "invited_users": list(invited_users),
+            "accepted_users": [],
+            "declined_users": [],
+        }
+        return game_id
+
+    async def get_invitation(self, conn, game_id):
+        invitation = self.invitations.get(game_id)
+        return copy.deepcopy(invitation) if invitation else None
+
+    async def set_invitation_users(self, conn, game_id, field, users):
+        if field not in ("accepted_users", "declined_users"):
+            raise ValueError(f"Unknown invitation field {field!r}")
+        if game_id in self.invitations:
+            self._remember(conn, self.invitations, game_id)
+            self.invitations[game_id][field] = list(users)
+
+    async def delete_invitation(self, conn, game_id):
+        self._remember(conn, self.invitations, game_id)
+        self.invitations.pop(game_id, None)
+
+    # --- Coin ledger ---
+
+    async def append_ledger(self, conn, entries):
+        for user_id, delta, reason, game, ref_id, created_at in entries:
+            entry_id = next(self._ledger_ids)
+            self._remember(conn, self.ledger, entry_id)
+            self.ledger[entry_id] = {"id": entry_id, "user_id": user_id, "delta": delta, "reason": reason,
+                                     "game": game, "ref_id": ref_id, "created_at": created_at}
@@ -0,0 +1,409 @@
+import aiomysql
+from pymysql.constants import CLIENT
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import os
+import time
+import weakref
+
+from storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing, all overridable from the environment
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN', '2'))  # connections opened (and verified) at startup
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX', '10'))
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '3600'))  # seconds before a connection is replaced; keep under MySQL's wait_timeout
+CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', '10'))  # seconds
+HEALTH_CHECK_IDLE = float(os.getenv('DB_HEALTH_CHECK_IDLE', '30'))  # ping connections idle longer than this before use
+
+
+_STREAK_SPAN = 1 << 16  # claim_daily packs (balance, streak) into one LAST_INSERT_ID value; streaks beyond this are capped
+
+
+def _signed(value):
+    # LAST_INSERT_ID() comes back as an unsigned 64-bit value
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _decode(row, fields):
+    for field in fields:
+        if isinstance(row.get(field), (str, bytes)):
+            row[field] = json.loads(row[field])
+    return row
+
+
+class MySQLBackend(StorageBackend):
+    name = "mysql"
+
+    def __init__(self):
+        self.pool = None
+        self.health_checks = 0
+        self.reconnects = 0
+        self._last_used: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # connection -> time.monotonic() of last release
+
+    async def start(self):
+        self.pool = await aiomysql.create_pool(
+            host=os.getenv('DB_HOST'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            db=os.getenv('DB_NAME'),
+            autocommit=True,
+            client_flag=CLIENT.FOUND_ROWS,  # rowcount = rows matched, so conditional updates report reliably
+            minsize=POOL_MIN_SIZE,
+            maxsize=POOL_MAX_SIZE,
+            pool_recycle=POOL_RECYCLE,
+            connect_timeout=CONNECT_TIMEOUT
+        )
+        await self._warm()
+        logger.info(f"Database connection pool initialized ({POOL_MIN_SIZE}-{POOL_MAX_SIZE} connections, {self.pool.size} open).")
+
+    async def _warm(self):
+        """Checks out minsize connections at once and pings each, so the first commands don't pay for connecting."""
+        conns = [await self.pool.acquire() for _ in range(POOL_MIN_SIZE)]
+        try:
+            await asyncio.gather(*(conn.ping() for conn in conns))
+        finally:
+            for conn in conns:
+                self._last_used[conn] = time.monotonic()
+                self.pool.release(conn)
+
+    async def close(self):
+        if self.pool:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+            logger.info("Database connection pool closed.")
+
+    async def migrate(self):
+        import migrations  # MySQL's versioned schema; it runs through database.py's connections
+        await migrations.migrate()
+
+    async def verify(self):
+        import migrations
+        return await migrations.verify_indexes()
+
+    def pool_info(self):
+        size = self.pool.size if self.pool else 0
+        return {
+            "pool_min": POOL_MIN_SIZE,
+            "pool_max": POOL_MAX_SIZE,
+            "pool_size": size,
+            "free": self.pool.freesize if self.pool else 0,
+            "health_checks": self.health_checks,
+            "reconnects": self.reconnects,
+        }
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        conn = await self.pool.acquire()
+        try:
+            # Connections idle this long may have been dropped by MySQL or a proxy; ping before handing out
+            if time.monotonic() - self._last_used.get(conn, 0.0) > HEALTH_CHECK_IDLE:
+                self.health_checks += 1
+                try:
+                    await conn.ping(reconnect=False)
+                except Exception:
+                    self.reconnects += 1
+                    try:
+                        await conn.ping(reconnect=True)
+                    except Exception:
+                        conn.close()  # The pool drops closed connections on release instead of handing them out again
+                        raise
+            yield conn
+        finally:
+            self.pool.release(conn)
+            if conn.closed:  # Discarded by the pool (broken, or released mid-transaction)
+                self._last_used.pop(conn, None)
+            else:
+                self._last_used[conn] = time.monotonic()
+
+    async def begin(self, conn):
+        await conn.begin()
+
+    async def commit(self, conn):
+        await conn.commit()
+
+    async def rollback(self, conn):
+        await conn.rollback()
+
+    async def savepoint(self, conn, name):
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"SAVEPOINT {name}")
+
+    async def release_savepoint(self, conn, name):
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"RELEASE SAVEPOINT {name}")
+
+    async def rollback_to_savepoint(self, conn, name):
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+
+    # --- Users and balances ---
+
+    async def upsert_users(self, conn, users):
+        async with conn.cursor() as cursor:
+            await cursor.executemany("""
+                INSERT INTO users (user_id, username, server_id, balance)
+                VALUES (%s, %s, %s, 0)
+                ON DUPLICATE KEY UPDATE username = VALUES(username), server_id = VALUES(server_id)
+            """, users)
+
+    async def add_to_balance(self, conn, user_id, amount):
+        async with conn.cursor() as cursor:
+            # LAST_INSERT_ID(expr) hands the new balance back in the same round trip
+            await cursor.execute("UPDATE users SET balance = LAST_INSERT_ID(balance + %s) WHERE user_id = %s", (amount, user_id))
+            return _signed(cursor.lastrowid) if cursor.rowcount else None
+
+    async def debit(self, conn, user_id, amount, credit=0):
+        async with conn.cursor() as cursor:
+            await cursor.execute("""
+                UPDATE users SET balance = LAST_INSERT_ID(balance - %s + %s)
+                WHERE user_id = %s AND balance >= %s
+            """, (amount, credit, user_id, amount))
+            return _signed(cursor.lastrowid) if cursor.rowcount else None
+
+    async def credit_or_create(self, conn, user_id, amount):
+        async with conn.cursor() as cursor:
+            await cursor.execute("UPDATE users SET balance = LAST_INSERT_ID(balance + %s) WHERE user_id = %s", (amount, user_id))
+            if cursor.rowcount:
+                return _signed(cursor.lastrowid)
+            await cursor.execute("INSERT INTO users (user_id, balance) VALUES (%s, %s)", (user_id, amount))
+            return amount
+
+    async def apply_deltas(self, conn, deltas, require_non_negative):
+        user_ids = list(deltas)
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        async with conn.cursor() as cursor:
+            # Lock the rows first so the balances checked are the balances changed
+            await cursor.execute(f"SELECT user_id, balance FROM users WHERE user_id IN ({placeholders}) FOR UPDATE", user_ids)
+            current = dict(await cursor.fetchall())
+            new_balances = {user_id: current.get(user_id, 0) + delta for user_id, delta in deltas.items()}
+            if require_non_negative and any(balance < 0 for balance in new_balances.values()):
+                return None
+            # One statement for every row; users without one are created
+            await cursor.execute(
+                f"INSERT INTO users (user_id, balance) VALUES {', '.join(['(%s, %s)'] * len(deltas))} "
+                "ON DUPLICATE KEY UPDATE balance = balance + VALUES(balance)",
+                [value for item in deltas.items() for value in item]
+            )
+            return new_balances
+
+    async def get_balance(self, conn, user_id):
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT balance FROM users WHERE user_id = %s", (user_id,))
+            result = await cursor.fetchone()
+            return result[0] if result else None
+
+    async def get_balances(self, conn, user_ids):
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"SELECT user_id, balance FROM users WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})", list(user_ids))
+            return dict(await cursor.fetchall())
+
+    async def get_last_claim(self, conn, user_id):
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT DATE(last_claim) FROM users WHERE user_id = %s", (user_id,))
+            result = await cursor.fetchone()
+            return result[0] if result else None
+
+    async def set_last_claim(self, conn, user_id, day):
+        async with conn.cursor() as cursor:
+            await cursor.execute("UPDATE users SET last_claim = %s WHERE user_id = %s", (day, user_id))
+
+    async def claim_daily(self, conn, user_id, today, reward, streak_bonus, streak_cap):
+        yesterday = today - datetime.timedelta(days=1)
+        async with conn.cursor() as cursor:
+            # One statement for new and existing users. ON DUPLICATE KEY UPDATE applies its
+            # assignments left to right, so the balance sees the new streak and every IF sees
+            # the old last_claim. LAST_INSERT_ID(expr) hands back the new balance and streak
+            # packed into one value (balance * _STREAK_SPAN + streak), or 0 if today's reward
+            # was already claimed; VALUES sets it for a new row, the last assignment for an
+            # existing one.
+            await cursor.execute("""
+                INSERT INTO users (user_id, balance, last_claim, daily_streak)
+                VALUES (%(user_id)s, %(reward)s, %(today)s, LAST_INSERT_ID(%(reward)s * %(span)s + 1) MOD %(span)s)
+                ON DUPLICATE KEY UPDATE
+                    daily_streak = IF(last_claim IS NULL OR last_claim < %(today)s,
+                                      IF(last_claim = %(yesterday)s, daily_streak + 1, 1), daily_streak),
+                    balance = IF(last_claim IS NULL OR last_claim < %(today)s,
+                                 balance + %(reward)s + %(bonus)s * LEAST(daily_streak - 1, %(cap)s), balance),
+                    last_claim = IF(LAST_INSERT_ID(IF(last_claim IS NULL OR last_claim < %(today)s,
+                                                      balance * %(span)s + LEAST(daily_streak, %(span)s - 1), 0)),
+                                    %(today)s, last_claim)
+            """, {"user_id": user_id, "reward": reward, "today": today, "yesterday": yesterday,
+                  "bonus": streak_bonus, "cap": streak_cap, "span": _STREAK_SPAN})
+            packed = _signed(cursor.lastrowid)
+            if not packed:
+                return None
+            return divmod(packed, _STREAK_SPAN)  # (balance, streak)
+
+    async def delete_users(self, conn, user_ids):
+        async with conn.cursor() as cursor:
+            await cursor.executemany("DELETE FROM inventory WHERE user_id = %s", [(user_id,) for user_id in user_ids])
+            await cursor.executemany("DELETE FROM users WHERE user_id = %s", [(user_id,) for user_id in user_ids])
+
+    # --- Leaderboards ---
+
+    async def top_balances(self, conn, server_id, limit):
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            if server_id is None:
+                await cursor.execute("SELECT user_id, username, balance FROM users ORDER BY balance DESC LIMIT %s", (limit,))
+            else:
+                await cursor.execute("""
+                    SELECT user_id, username, balance FROM users
+                    WHERE server_id = %s
+                    ORDER BY balance DESC
+                    LIMIT %s
+                """, (server_id, limit))
+            return await cursor.fetchall()
+
+    async def all_balances(self, conn):
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("SELECT user_id, server_id, balance FROM users")
+            return await cursor.fetchall()
+
+    async def usernames(self, conn, user_ids):
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"""
+                SELECT user_id, username FROM users
+                WHERE user_id IN ({', '.join(['%s'] * len(user_ids))}) AND username IS NOT NULL
+            """, list(user_ids))
+            return dict(await cursor.fetchall())
+
+    # --- Inventory ---
+
+    async def get_inventory(self, conn, user_id):
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("""
+                SELECT item_name, SUM(quantity) AS quantity FROM inventory
+                WHERE user_id = %s GROUP BY item_name HAVING quantity > 0 ORDER BY item_name
+            """, (user_id,))
+            return [{"item_name": row["item_name"], "quantity": int(row["quantity"])} for row in await cursor.fetchall()]
+
+    async def add_item(self, conn, user_id, item_name, quantity):
+        # inventory has no unique key on (user_id, item_name), so stacks are kept as rows and summed
+        async with conn.cursor() as cursor:
+            await cursor.execute("INSERT INTO inventory (user_id, item_name, quantity) VALUES (%s, %s, %s)", (user_id, item_name, quantity))
+            await cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM inventory WHERE user_id = %s AND item_name = %s", (user_id, item_name))
+            (total,) = await cursor.fetchone()
+            return int(total)
+
+    # --- Russian Roulette sessions ---
+
+    async def save_session(self, conn, game_id, state):
+        async with conn.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO russian_roullette_game_sessions (user_id, players, chambers, winnings, original_wager, shots_survived, gun_state, current_turn, votes, server_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    players = VALUES(players),
+                    chambers = VALUES(chambers),
+                    winnings = VALUES(winnings),
+                    original_wager = VALUES(original_wager),
+                    shots_survived = VALUES(shots_survived),
+                    gun_state = VALUES(gun_state),
+                    current_turn = VALUES(current_turn),
+                    votes = VALUES(votes),
+                    server_id = VALUES(server_id)
+            """, (game_id, json.dumps(state["players"]), state["chambers"], state["winnings"], state["original_wager"],
+                  state["shots_survived"], json.dumps(state["gun_state"]), state["current_turn"], json.dumps(state["votes"]),
+                  state.get("server_id")))
+            await self._write_session_players(cursor, game_id, state["players"])
+
+    async def _write_session_players(self, cursor, game_id, players):
+        """Replaces a session's membership rows; seat is the player's position in the turn order."""
+        await cursor.execute("DELETE FROM russian_roulette_session_players WHERE session_id = %s", (game_id,))
+        if players:
+            await cursor.executemany(
+                "INSERT INTO russian_roulette_session_players (session_id, user_id, seat) VALUES (%s, %s, %s)",
+                [(game_id, user_id, seat) for seat, user_id in enumerate(players)]
+            )
+
+    async def load_sessions(self, conn):
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("SELECT * FROM russian_roullette_game_sessions")
+            rows = await cursor.fetchall()
+
+        sessions = []
+        for row in rows:
+            try:
+                sessions.append(_decode(row, ("players", "gun_state", "votes")))
+            except json.JSONDecodeError:
+                logger.error(f"Skipping session with undecodable JSON: {row}")
+        return sessions
+
+    async def get_session(self, conn, game_id):
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("SELECT * FROM russian_roullette_game_sessions WHERE user_id = %s", (game_id,))
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        try:
+            return _decode(row, ("players", "gun_state", "votes"))
+        except json.JSONDecodeError:
+            logger.error(f"Error decoding JSON for game state: {row}")
+            return None
+
+    async def session_ids_for_player(self, conn, user_id):
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT session_id FROM russian_roulette_session_players WHERE user_id = %s", (user_id,))
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def update_session(self, conn, game_id, **fields):
+        json_fields = {"players", "gun_state", "votes"}
+        assignments = ", ".join(f"{field} = %s" for field in fields)
+        values = [json.dumps(value) if field in json_fields else value for field, value in fields.items()]
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"UPDATE russian_roullette_game_sessions SET {assignments} WHERE user_id = %s", (*values, game_id))
+            if "players" in fields:
+                await self._write_session_players(cursor, game_id, fields["players"])
+
+    async def delete_sessions(self, conn, game_ids):
+        async with conn.cursor() as cursor:
+            for game_id in game_ids:
+                await cursor.execute("DELETE FROM russian_roulette_session_players WHERE session_id = %s", (game_id,))
+                await cursor.execute("DELETE FROM russian_roullette_game_sessions WHERE user_id = %s", (game_id,))
+
+    # --- Russian Roulette invitations ---
+
+    async def create_invitation(self, conn, creator_id, server_id, invited_users):
+        async with conn.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO russian_roulette_invitations (creator_id, server_id, invited_users, accepted_users, declined_users)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (creator_id, server_id, json.dumps(invited_users), json.dumps([]), json.dumps([])))
+            return cursor.lastrowid
+
+    async def get_invitation(self, conn, game_id):
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("SELECT * FROM russian_roulette_invitations WHERE game_id = %s", (game_id,))
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        _decode(row, ("invited_users", "accepted_users", "declined_users"))
+        for field in ("invited_users", "accepted_users", "declined_users"):
+            row[field] = row[field] or []
+        return row
+
+    async def set_invitation_users(self, conn, game_id, field, users):
+        if field not in ("accepted_users", "declined_users"):
+            raise ValueError(f"Unknown invitation field {field!r}")
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"UPDATE russian_roulette_invitations SET {field} = %s WHERE game_id = %s", (json.dumps(users), game_id))
+
+    async def delete_invitation(self, conn, game_id):
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM russian_roulette_invitations WHERE game_id = %s", (game_id,))
+
+    # --- Coin ledger ---
+
+    async def append_ledger(self, conn, entries):
+        async with conn.cursor() as cursor:
+            # aiomysql folds executemany on INSERT ... VALUES into multi-row INSERTs
+            await cursor.executemany("""
+                INSERT INTO coin_ledger (user_id, delta, reason, game, ref_id, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, entries)
@@ -0,0 +1,423 @@
+import aiosqlite
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import os
+
+from storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Single-node storage: a local SQLite file in WAL mode, so readers never wait on
+# the writer and a balance update is a local write instead of a network round
+# trip. Connections are pooled because database.session() holds one for the
+# whole database part of a command (the Russian Roulette starts), and one
+# connection can only run one transaction at a time. Transactions use BEGIN
+# IMMEDIATE so two writers queue on the busy timeout instead of deadlocking on a
+# lock upgrade.
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'kui.db')
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '4'))
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # milliseconds a writer waits for the lock
+
+# Same tables as the MySQL schema in migrations.py, in SQLite's dialect
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            server_id INTEGER,
+            balance INTEGER DEFAULT 0,
+            last_claim TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER REFERENCES users(user_id),
+            item_name TEXT,
+            quantity INTEGER DEFAULT 1
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS russian_roullette_game_sessions (
+            user_id INTEGER PRIMARY KEY,
+            players TEXT,
+            chambers INTEGER,
+            winnings INTEGER,
+            original_wager INTEGER,
+            shots_survived INTEGER DEFAULT 0,
+            gun_state TEXT,
+            current_turn INTEGER DEFAULT 0,
+            votes TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS russian_roulette_invitations (
+            game_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            creator_id INTEGER,
+            server_id INTEGER,
+            invited_users TEXT,
+            accepted_users TEXT,
+            declined_users TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS russian_roulette_session_players (
+            session_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            seat INTEGER NOT NULL,
+            PRIMARY KEY (session_id, user_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_session_players_user ON russian_roulette_session_players (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_server_balance ON users (server_id, balance)",
+        "CREATE INDEX IF NOT EXISTS idx_users_balance ON users (balance)",
+        "CREATE INDEX IF NOT EXISTS idx_users_last_claim ON users (last_claim)",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_user_item ON inventory (user_id, item_name)",
+        "CREATE INDEX IF NOT EXISTS idx_invitations_creator ON russian_roulette_invitations (creator_id)",
+    ]),
+    (2, "daily claim streaks", [
+        "ALTER TABLE users ADD COLUMN daily_streak INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (3, "russian roulette session servers", [
+        "ALTER TABLE russian_roullette_game_sessions ADD COLUMN server_id INTEGER",
+    ]),
+    (4, "coin ledger", [
+        """
+        CREATE TABLE IF NOT EXISTS coin_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            game TEXT,
+            ref_id INTEGER,
+            created_at TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_ledger_user_time ON coin_ledger (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_ref ON coin_ledger (ref_id)",
+    ]),
+]
+
+_SESSION_JSON = ("players", "gun_state", "votes")
+_INVITATION_JSON = ("invited_users", "accepted_users", "declined_users")
+
+
+def _decode(row, fields):
+    row = dict(row)
+    for field in fields:
+        if isinstance(row.get(field), str):
+            row[field] = json.loads(row[field])
+    return row
+
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH, pool_size=SQLITE_POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._all: list = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    async def start(self):
+        for _ in range(self.pool_size):
+            conn = await aiosqlite.connect(self.path, isolation_level=None)  # autocommit; transactions are explicit
+            conn.row_factory = aiosqlite.Row
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; a crash can only lose the last moments
+            await conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+            self._all.append(conn)
+            self._idle.put_nowait(conn)
+        logger.info(f"SQLite storage opened at {self.path} ({self.pool_size} connections, WAL).")
+
+    async def close(self):
+        for conn in self._all:
+            await conn.close()
+        self._all.clear()
+        self._idle = asyncio.Queue()
+
+    async def migrate(self):
+        async with self.connection() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            async with conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as cursor:
+                (current,) = await cursor.fetchone()
+            for version, description, steps in MIGRATIONS:
+                if version <= current:
+                    continue
+                logger.info(f"Applying SQLite schema migration {version}: {description}")
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for step in steps:
+                        if callable(step):
+                            await step(conn)
+                        else:
+                            await conn.execute(step)
+                    await conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+                    await conn.execute("COMMIT")
+                except Exception:
+                    await conn.execute("ROLLBACK")
+                    raise
+                current = version
+            logger.info(f"SQLite schema is at version {current}.")
+
+    def pool_info(self):
+        return {
+            "pool_min": self.pool_size,
+            "pool_max": self.pool_size,
+            "pool_size": len(self._all),
+            "free": self._idle.qsize(),
+            "health_checks": 0,
+            "reconnects": 0,
+        }
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def begin(self, conn):
+        await conn.execute("BEGIN IMMEDIATE")
+
+    async def commit(self, conn):
+        await conn.execute("COMMIT")
+
+    async def rollback(self, conn):
+        await conn.execute("ROLLBACK")
+
+    async def savepoint(self, conn, name):
+        await conn.execute(f"SAVEPOINT {name}")
+
+    async def release_savepoint(self, conn, name):
+        await conn.execute(f"RELEASE SAVEPOINT {name}")
+
+    async def rollback_to_savepoint(self, conn, name):
+        await conn.execute(f"ROLLBACK TO SAVEPOINT {name}")
+
+    async def _one(self, conn, sql, params=()):
+        async with conn.execute(sql, params) as cursor:
+            return await cursor.fetchone()
+
+    async def _all_rows(self, conn, sql, params=()):
+        async with conn.execute(sql, params) as cursor:
+            return await cursor.fetchall()
+
+    # --- Users and balances ---
+
+    async def upsert_users(self, conn, users):
+        await conn.executemany("""
+            INSERT INTO users (user_id, username, server_id, balance) VALUES (?, ?, ?, 0)
+            ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, server_id = excluded.server_id
+        """, users)
+
+    async def add_to_balance(self, conn, user_id, amount):
+        row = await self._one(conn, "UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING balance", (amount, user_id))
+        return row[0] if row else None
+
+    async def debit(self, conn, user_id, amount, credit=0):
+        row = await self._one(conn, """
+            UPDATE users SET balance = balance - ? + ?
+            WHERE user_id = ? AND balance >= ?
+            RETURNING balance
+        """, (amount, credit, user_id, amount))
+        return row[0] if row else None
+
+    async def credit_or_create(self, conn, user_id, amount):
+        row = await self._one(conn, """
+            INSERT INTO users (user_id, balance) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance
+            RETURNING balance
+        """, (user_id, amount))
+        return row[0]
+
+    async def apply_deltas(self, conn, deltas, require_non_negative):
+        # The caller's BEGIN IMMEDIATE already holds the write lock, so nothing changes between the read and the write
+        placeholders = ", ".join("?" * len(deltas))
+        current = dict(await self._all_rows(conn, f"SELECT user_id, balance FROM users WHERE user_id IN ({placeholders})", list(deltas)))
+        new_balances = {user_id: current.get(user_id, 0) + delta for user_id, delta in deltas.items()}
+        if require_non_negative and any(balance < 0 for balance in new_balances.values()):
+            return None
+        await conn.execute(
+            f"INSERT INTO users (user_id, balance) VALUES {', '.join(['(?, ?)'] * len(deltas))} "
+            "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance",
+            [value for item in deltas.items() for value in item]
+        )
+        return new_balances
+
+    async def get_balance(self, conn, user_id):
+        row = await self._one(conn, "SELECT balance FROM users WHERE user_id = ?", (user_id,))
+        return row[0] if row else None
+
+    async def get_balances(self, conn, user_ids):
+        placeholders = ", ".join("?" * len(user_ids))
+        return dict(await self._all_rows(conn, f"SELECT user_id, balance FROM users WHERE user_id IN ({placeholders})", list(user_ids)))
+
+    async def get_last_claim(self, conn, user_id):
+        row = await self._one(conn, "SELECT last_claim FROM users WHERE user_id = ?", (user_id,))
+        return datetime.date.fromisoformat(row[0]) if row and row[0] else None
+
+    async def set_last_claim(self, conn, user_id, day):
+        await conn.execute("UPDATE users SET last_claim = ? WHERE user_id = ?", (day.isoformat(), user_id))
+
+    async def claim_daily(self, conn, user_id, today, reward, streak_bonus, streak_cap):
+        yesterday = (today - datetime.timedelta(days=1)).isoformat()
+        # SQLite evaluates every SET expression against the old row, so the new streak is spelled out twice
+        row = await self._one(conn, """
+            UPDATE users SET
+                daily_streak = CASE WHEN last_claim = ? THEN daily_streak + 1 ELSE 1 END,
+                balance = balance + ? + ? * MIN(CASE WHEN last_claim = ? THEN daily_streak ELSE 0 END, ?),
+                last_claim = ?
+            WHERE user_id = ? AND (last_claim IS NULL OR last_claim < ?)
+            RETURNING balance, daily_streak
+        """, (yesterday, reward, streak_bonus, yesterday, streak_cap, today.isoformat(), user_id, today.isoformat()))
+        if row:
+            return row[0], row[1]
+        # Already claimed today, or no row yet
+        row = await self._one(conn, """
+            INSERT INTO users (user_id, balance, last_claim, daily_streak) VALUES (?, ?, ?, 1)
+            ON CONFLICT(user_id) DO NOTHING
+            RETURNING balance
+        """, (user_id, reward, today.isoformat()))
+        return (reward, 1) if row else None
+
+    async def delete_users(self, conn, user_ids):
+        await conn.executemany("DELETE FROM inventory WHERE user_id = ?", [(user_id,) for user_id in user_ids])
+        await conn.executemany("DELETE FROM users WHERE user_id = ?", [(user_id,) for user_id in user_ids])
+
+    # --- Leaderboards ---
+
+    async def top_balances(self, conn, server_id, limit):
+        if server_id is None:
+            rows = await self._all_rows(conn, "SELECT user_id, username, balance FROM users ORDER BY balance DESC LIMIT ?", (limit,))
+        else:
+            rows = await self._all_rows(conn, """
+                SELECT user_id, username, balance FROM users WHERE server_id = ? ORDER BY balance DESC LIMIT ?
+            """, (server_id, limit))
+        return [dict(row) for row in rows]
+
+    async def all_balances(self, conn):
+        return [dict(row) for row in await self._all_rows(conn, "SELECT user_id, server_id, balance FROM users")]
+
+    async def usernames(self, conn, user_ids):
+        placeholders = ", ".join("?" * len(user_ids))
+        return dict(await self._all_rows(conn, f"""
+            SELECT user_id, username FROM users WHERE user_id IN ({placeholders}) AND username IS NOT NULL
+        """, list(user_ids)))
+
+    # --- Inventory ---
+
+    async def get_inventory(self, conn, user_id):
+        rows = await self._all_rows(conn, """
+            SELECT item_name, SUM(quantity) AS quantity FROM inventory
+            WHERE user_id = ? GROUP BY item_name HAVING SUM(quantity) > 0 ORDER BY item_name
+        """, (user_id,))
+        return [dict(row) for row in rows]
+
+    async def add_item(self, conn, user_id, item_name, quantity):
+        await conn.execute("INSERT INTO inventory (user_id, item_name, quantity) VALUES (?, ?, ?)", (user_id, item_name, quantity))
+        row = await self._one(conn, "SELECT COALESCE(SUM(quantity), 0) FROM inventory WHERE user_id = ? AND item_name = ?", (user_id, item_name))
+        return row[0]
+
+    # --- Russian Roulette sessions ---
+
+    async def save_session(self, conn, game_id, state):
+        await conn.execute("""
+            INSERT INTO russian_roullette_game_sessions (user_id, players, chambers, winnings, original_wager, shots_survived, gun_state, current_turn, votes, server_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                players = excluded.players,
+                chambers = excluded.chambers,
+                winnings = excluded.winnings,
+                original_wager = excluded.original_wager,
+                shots_survived = excluded.shots_survived,
+                gun_state = excluded.gun_state,
+                current_turn = excluded.current_turn,
+                votes = excluded.votes,
+                server_id = excluded.server_id
+        """, (game_id, json.dumps(state["players"]), state["chambers"], state["winnings"], state["original_wager"],
+              state["shots_survived"], json.dumps(state["gun_state"]), state["current_turn"], json.dumps(state["votes"]),
+              state.get("server_id")))
+        await self._write_session_players(conn, game_id, state["players"])
+
+    async def _write_session_players(self, conn, game_id, players):
+        await conn.execute("DELETE FROM russian_roulette_session_players WHERE session_id = ?", (game_id,))
+        if players:
+            await conn.executemany(
+                "INSERT INTO russian_roulette_session_players (session_id, user_id, seat) VALUES (?, ?, ?)",
+                [(game_id, user_id, seat) for seat, user_id in enumerate(players)]
+            )
+
+    async def load_sessions(self, conn):
+        sessions = []
+        for row in await self._all_rows(conn, "SELECT * FROM russian_roullette_game_sessions"):
+            try:
+                sessions.append(_decode(row, _SESSION_JSON))
+            except json.JSONDecodeError:
+                logger.error(f"Skipping session with undecodable JSON: {dict(row)}")
+        return sessions
+
+    async def get_session(self, conn, game_id):
+        row = await self._one(conn, "SELECT * FROM russian_roullette_game_sessions WHERE user_id = ?", (game_id,))
+        return _decode(row, _SESSION_JSON) if row else None
+
+    async def session_ids_for_player(self, conn, user_id):
+        rows = await self._all_rows(conn, "SELECT session_id FROM russian_roulette_session_players WHERE user_id = ?", (user_id,))
+        return [row[0] for row in rows]
+
+    async def update_session(self, conn, game_id, **fields):
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        values = [json.dumps(value) if field in _SESSION_JSON else value for field, value in fields.items()]
+        await conn.execute(f"UPDATE russian_roullette_game_sessions SET {assignments} WHERE user_id = ?", (*values, game_id))
+        if "players" in fields:
+            await self._write_session_players(conn, game_id, fields["players"])
+
+    async def delete_sessions(self, conn, game_ids):
+        for game_id in game_ids:
+            await conn.execute("DELETE FROM russian_roulette_session_players WHERE session_id = ?", (game_id,))
+            await conn.execute("DELETE FROM russian_roullette_game_sessions WHERE user_id = ?", (game_id,))
+
+    # --- Russian Roulette invitations ---
+
+    async def create_invitation(self, conn, creator_id, server_id, invited_users):
+        row = await self._one(conn, """
+            INSERT INTO russian_roulette_invitations (creator_id, server_id, invited_users, accepted_users, declined_users)
+            VALUES (?, ?, ?, '[]', '[]') RETURNING game_id
+        """, (creator_id, server_id, json.dumps(invited_users)))
+        return row[0]
+
+    async def get_invitation(self, conn, game_id):
+        row = await self._one(conn, "SELECT * FROM russian_roulette_invitations WHERE game_id = ?", (game_id,))
+        if row is None:
+            return None
+        row = _decode(row, _INVITATION_JSON)
+        for field in _INVITATION_JSON:
+            row[field] = row[field] or []
+        return row
+
+    async def set_invitation_users(self, conn, game_id, field, users):
+        if field not in ("accepted_users", "declined_users"):
+            raise ValueError(f"Unknown invitation field {field!r}")
+        await conn.execute(f"UPDATE russian_roulette_invitations SET {field} = ? WHERE game_id = ?", (json.dumps(users), game_id))
+
+    async def delete_invitation(self, conn, game_id):
+        await conn.execute("DELETE FROM russian_roulette_invitations WHERE game_id = ?", (game_id,))
+
+    # --- Coin ledger ---
+
+    async def append_ledger(self, conn, entries):
+        await conn.executemany("""
+            INSERT INTO coin_ledger (user_id, delta, reason, game, ref_id, created_at) VALUES (?, ?, ?, ?, ?, ?)
+        """, [(user_id, delta, reason, game, ref_id, created_at.isoformat(sep=" "))
+              for user_id, delta, reason, game, ref_id, created_at in entries])
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+os.environ["STORAGE_BACKEND"] = "memory"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import ledger  # noqa: E402
+from storage.memory import MemoryBackend  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    tasks = asyncio.all_tasks(loop)  # Background writers and sweepers
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture
+def run(loop):
+    """Runs a coroutine to completion on the shared test loop."""
+    return loop.run_until_complete
+
+
+@pytest.fixture
+def db(run):
+    """A fresh in-memory backend, with the balance cache and user registry emptied."""
+    database.backend = MemoryBackend()
+    database.balance_cache.invalidate()
+    database._known_users.clear()
+    database._pending_users.clear()
+    yield database.backend
+    run(ledger.writer.flush())  # Rows a test queued go to its own backend
+    run(database.close_pool())
+
+
+@pytest.fixture
+def add_user(db):
+    """Puts a users row straight into the memory backend."""
+    def add(user_id, balance=0, **fields):
+        db.users[user_id] = {"user_id": user_id, "username": None, "server_id": None, "balance": balance,
+                             "last_claim": None, "daily_streak": 0, **fields}
+    return add
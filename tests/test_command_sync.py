@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import command_sync
+
+
+class FakeTree:
+    def __init__(self, names, deployed):
+        self.names = names
+        self.deployed = deployed
+        self.synced = 0
+
+    def get_commands(self, guild=None):
+        return [SimpleNamespace(to_dict=lambda tree, name=name: {"name": name, "type": 1, "description": name})
+                for name in self.names]
+
+    async def fetch_commands(self, guild=None):
+        return [SimpleNamespace(name=name, type=SimpleNamespace(value=1)) for name in self.deployed]
+
+    async def sync(self, guild=None):
+        self.synced += 1
+
+
+def test_first_sync_reports_deployed_commands_as_unknown(tmp_path, run):
+    syncer = command_sync.CommandSync(path=str(tmp_path / "state.json"))
+    tree = FakeTree(["balance", "daily"], deployed=["balance", "coinflip"])
+
+    result = run(syncer.sync(tree))
+    assert result == {"synced": True, "added": ["/daily"], "changed": [],
+                      "unknown": ["/balance"], "removed": ["/coinflip"]}
+
+    tree.names = ["daily"]
+    result = run(syncer.sync(tree))
+    assert (result["changed"], result["unknown"], result["removed"]) == ([], [], ["/balance"])
+    assert run(syncer.sync(tree))["synced"] is False
+    assert tree.synced == 2
@@ -0,0 +1,121 @@
+import datetime
+
+import pytest
+
+import database
+
+
+def test_session_runs_every_call_on_one_connection(db, run, add_user):
+    add_user(1, balance=100)
+    add_user(2, balance=100)
+
+    async def scenario():
+        async with database.session():
+            await database.try_debit(1, 10)
+            await database.get_balances([1, 2])
+            await database.apply_deltas({1: 5, 2: -5})
+
+    acquires = database.pool_stats.acquires
+    run(scenario())
+    assert database.pool_stats.acquires == acquires + 1
+
+
+def test_session_transaction_rolls_back_and_keeps_caches_clean(db, run, add_user):
+    add_user(1, balance=100)
+    seen = []
+    database.add_balance_listener(lambda user_id, balance: seen.append((user_id, balance)))
+
+    async def scenario():
+        async with database.session(transaction=True):
+            assert await database.try_debit(1, 30) == (True, 70)
+            assert await database.get_balance(1) == 70
+            raise database.Rollback
+        return await database.get_balance(1)
+
+    try:
+        assert run(scenario()) == 100
+        assert db.users[1]["balance"] == 100
+        assert (1, 70) not in seen
+    finally:
+        database._balance_listeners.pop()
+
+
+def test_claim_daily_builds_a_capped_streak(db, run, add_user):
+    add_user(1, balance=0)
+    day = datetime.date(2026, 1, 1)
+
+    def claim(offset):
+        return run(database.claim_daily(1, 100, day + datetime.timedelta(days=offset), streak_bonus=10, streak_cap=2))
+
+    assert claim(0) == (100, 1)
+    assert claim(0) is None  # Once per day
+    assert claim(1) == (110, 2)
+    assert claim(2) == (120, 3)
+    assert claim(3) == (120, 4)  # Bonus capped at two days
+    assert claim(5) == (100, 1)  # A missed day resets the streak
+    assert db.users[1]["balance"] == 550
+    assert run(database.get_balance(1)) == 550
+
+
+def test_claim_daily_creates_a_missing_user(db, run):
+    assert run(database.claim_daily(9, 100, datetime.date(2026, 1, 1))) == (100, 1)
+    assert db.users[9]["balance"] == 100
+
+
+def test_try_debit_rejects_short_funds_without_touching_the_balance(db, run, add_user):
+    add_user(1, balance=40)
+
+    assert run(database.try_debit(1, 50)) == (False, 40)
+    assert run(database.try_debit(1, 40, credit=80)) == (True, 80)
+    assert db.users[1]["balance"] == 80
+
+
+def test_transfer_rejects_short_funds(db, run, add_user):
+    add_user(1, balance=40)
+    add_user(2, balance=0)
+
+    assert run(database.transfer(1, 2, 50)) == (False, 40)
+    assert (db.users[1]["balance"], db.users[2]["balance"]) == (40, 0)
+
+
+def test_transfer_rolls_back_the_debit_when_the_credit_fails(db, run, add_user, monkeypatch):
+    add_user(1, balance=100)
+
+    async def failing_credit(conn, user_id, amount):
+        raise RuntimeError("credit failed")
+
+    monkeypatch.setattr(db, "credit_or_create", failing_credit)
+    assert run(database.get_balance(1)) == 100  # Cached, so the failure must invalidate it
+    with pytest.raises(RuntimeError):
+        run(database.transfer(1, 2, 30))
+
+    assert db.users[1]["balance"] == 100
+    assert 2 not in db.users
+    assert run(database.get_balance(1)) == 100
+
+
+def test_apply_deltas_is_all_or_nothing_when_a_balance_would_go_negative(db, run, add_user):
+    add_user(1, balance=50)
+    add_user(2, balance=5)
+
+    assert run(database.apply_deltas({1: -10, 2: -10, 3: 20})) == (False, {1: 50, 2: 5, 3: 0})
+    assert (db.users[1]["balance"], db.users[2]["balance"]) == (50, 5)
+    assert 3 not in db.users
+
+
+def test_apply_deltas_rolls_back_when_the_backend_fails_part_way(db, run, add_user, monkeypatch):
+    add_user(1, balance=50)
+    add_user(2, balance=50)
+    apply = db.apply_deltas
+
+    async def failing_apply(conn, deltas, require_non_negative):
+        await apply(conn, deltas, require_non_negative)  # The writes land, then the statement fails
+        raise RuntimeError("settlement failed")
+
+    monkeypatch.setattr(db, "apply_deltas", failing_apply)
+    assert run(database.get_balance(1)) == 50
+    with pytest.raises(RuntimeError):
+        run(database.apply_deltas({1: -20, 2: 20}))
+
+    assert (db.users[1]["balance"], db.users[2]["balance"]) == (50, 50)
+    assert run(database.get_balance(1)) == 50
@@ -0,0 +1,18 @@
+import rr_lobby
+from rr_sessions import sessions
+
+GUN = [0, 0, 0, 0, 0, 1]
+
+
+def test_join_turns_away_live_players_but_not_abandoned_ones(db, run):
+    async def scenario():
+        game = sessions.create([2], 6, 10, 10, list(GUN), ref_id=4001)
+        lobby = rr_lobby.Lobby(host_id=1, server_id=None, amount=10)
+        first = lobby.join(2)
+        game["last_active"] -= game["idle_timeout"]
+        second = lobby.join(2)
+        sessions.end(game)
+        await sessions.close()
+        return first, second
+
+    assert run(scenario()) == (rr_lobby.IN_GAME, rr_lobby.JOINED)
@@ -0,0 +1,90 @@
+import pytest
+
+from rr_sessions import RussianRouletteSessions
+
+GUN = [0, 0, 0, 0, 0, 1]
+
+
+@pytest.fixture
+def sessions(db, run):
+    sessions = RussianRouletteSessions(checkpoint_interval=60)
+    yield sessions
+    run(sessions.close())
+
+
+def test_knocked_out_player_can_start_a_game_without_replacing_the_first(db, run, sessions):
+    async def scenario():
+        multi = sessions.create([1, 2, 3], 6, 300, 100, list(GUN), ref_id=1001)
+        sessions.remove_player(multi, 1)
+        assert await sessions.busy_players([1]) == set()
+
+        solo = sessions.create([1], 6, 100, 100, list(GUN), ref_id=1002)
+        await sessions.flush()
+        return multi, solo
+
+    multi, solo = run(scenario())
+    assert sessions.get(2) is multi and sessions.get(3) is multi
+    assert sessions.get(1) is solo
+    assert multi["players"] == [2, 3] and multi["winnings"] == 300
+    assert sorted(db.sessions) == [1001, 1002]
+    assert db.sessions[1001]["players"] == [2, 3]
+
+
+def test_games_without_an_interaction_get_distinct_ids(db, run, sessions):
+    async def scenario():
+        return sessions.create([1], 6, 100, 100, list(GUN)), sessions.create([2], 6, 100, 100, list(GUN))
+
+    first, second = run(scenario())
+    assert first["game_id"] != second["game_id"]
+
+
+@pytest.fixture
+def games(sessions, monkeypatch):
+    """The sessions fixture, wired to casino_games' refund handler."""
+    import casino_games
+    monkeypatch.setattr(casino_games, "rr_sessions", sessions)
+    sessions.on_expire(casino_games.refund_abandoned)
+    return sessions
+
+
+def test_abandoned_game_is_refunded_instead_of_blocking_its_players(db, run, add_user, games):
+    for user_id in (1, 2, 3):
+        add_user(user_id, balance=0)  # Wagers already taken
+
+    async def scenario():
+        multi = games.create([1, 2, 3], 6, 300, 100, list(GUN), ref_id=1001)
+        games.remove_player(multi, 1)
+        assert await games.busy_players([2]) == {2}
+        multi["last_active"] -= multi["idle_timeout"]
+        busy = await games.busy_players([2])
+        await games.flush()
+        return busy
+
+    assert run(scenario()) == set()
+    assert games.get(2) is None and games.get(3) is None
+    assert [db.users[user_id]["balance"] for user_id in (1, 2, 3)] == [0, 100, 100]
+    assert db.sessions == {}
+
+
+def test_games_saved_before_a_restart_are_refunded_on_recovery(db, run, add_user, games):
+    add_user(5, balance=10)
+    db.sessions[2002] = {"user_id": 2002, "players": [5], "chambers": 6, "winnings": 120, "original_wager": 50,
+                         "shots_survived": 1, "gun_state": [0, 0, 0, 0, 1], "current_turn": 0, "votes": [], "server_id": None}
+
+    run(games.recover())
+    assert len(games) == 0
+    assert db.users[5]["balance"] == 60
+    assert db.sessions == {}
+
+
+def test_cluster_check_counts_other_workers_games_only(db, run, sessions, monkeypatch):
+    import cluster
+    monkeypatch.setattr(cluster, "CLUSTERED", True)
+    monkeypatch.setattr(cluster, "SHARD_COUNT", 2)
+    monkeypatch.setattr(cluster, "SHARD_IDS", [0])
+    other_guild, own_guild = 1 << 22, 2 << 22  # Shards 1 and 0
+    for game_id, player, server_id in ((3001, 7, other_guild), (3002, 8, own_guild)):
+        db.sessions[game_id] = {"user_id": game_id, "players": [player], "chambers": 6, "winnings": 10, "original_wager": 10,
+                                "shots_survived": 0, "gun_state": list(GUN), "current_turn": 0, "votes": [], "server_id": server_id}
+
+    assert run(sessions.busy_players([7, 8])) == {7}